@@ -0,0 +1,158 @@
+"""
+Archivos adjuntos de las solicitudes
+Antes cada archivo se medía con seek, se leía completo, se pasaba a hexadecimal (el
+doble de tamaño) y todos iban juntos en un JSON dentro de una sola columna: unas fotos
+de 5 MB costaban decenas de MB de memoria por petición.
+
+Ahora cada archivo se copia por bloques a un SpooledTemporaryFile (en disco a partir de
+ADJUNTOS_MEMORIA_MAXIMA) calculando su SHA-256 y cortando apenas pasa del límite. Las
+fotos se pueden reducir a ADJUNTOS_LADO_MAXIMO píxeles antes de guardarlas, y cada
+archivo se inserta en su propia fila de archivo_solicitud, uno a la vez.
+"""
+
+import io
+import os
+import hashlib
+import mimetypes
+import tempfile
+from registro import obtener_logger
+
+logger = obtener_logger('adjuntos')
+
+
+def _entero(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        logger.warning(f"⚠️ {nombre} inválido, usando {defecto}")
+        return defecto
+
+
+EXTENSIONES_PERMITIDAS = ('.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx')
+EXTENSIONES_IMAGEN = ('.jpg', '.jpeg', '.png')
+TAMANO_MAXIMO = _entero('ADJUNTOS_MAX_MB', 5) * 1024 * 1024
+# Las fotos se reciben más grandes si se van a reducir: el límite anterior aplica al resultado
+TAMANO_MAXIMO_FOTO = _entero('ADJUNTOS_MAX_FOTO_MB', 15) * 1024 * 1024
+MAXIMO_POR_SOLICITUD = _entero('ADJUNTOS_MAX_ARCHIVOS', 5)
+MEMORIA_MAXIMA = _entero('ADJUNTOS_MEMORIA_MAXIMA', 512 * 1024)
+# 0 desactiva la reducción de fotos
+LADO_MAXIMO = _entero('ADJUNTOS_LADO_MAXIMO', 2000)
+CALIDAD_JPEG = _entero('ADJUNTOS_CALIDAD_JPEG', 82)
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ErrorAdjunto(ValueError):
+    """Archivo rechazado; el mensaje se muestra al usuario"""
+
+
+class ArchivoSubido:
+    """Archivo ya copiado a un temporal, con su tamaño y hash"""
+
+    def __init__(self, nombre, temporal, tamano, sha256):
+        self.nombre = nombre
+        self.temporal = temporal
+        self.tamano = tamano
+        self.sha256 = sha256
+
+    @property
+    def tipo_mime(self):
+        return mimetypes.guess_type(self.nombre)[0] or 'application/octet-stream'
+
+    def leer(self):
+        self.temporal.seek(0)
+        return self.temporal.read()
+
+    def cerrar(self):
+        self.temporal.close()
+
+
+def _error_tamano(limite):
+    return ErrorAdjunto(f'Cada archivo debe ser menor a {limite // (1024 * 1024)}MB')
+
+
+def _copiar_por_bloques(origen, limite):
+    """Copia el stream a un temporal por bloques; (temporal, tamaño, sha256) o ErrorAdjunto si pasa del límite"""
+    temporal = tempfile.SpooledTemporaryFile(max_size=MEMORIA_MAXIMA)
+    resumen = hashlib.sha256()
+    tamano = 0
+    while True:
+        bloque = origen.read(TAMANO_BLOQUE)
+        if not bloque:
+            break
+        tamano += len(bloque)
+        if tamano > limite:
+            temporal.close()
+            raise _error_tamano(limite)
+        resumen.update(bloque)
+        temporal.write(bloque)
+    return temporal, tamano, resumen.hexdigest()
+
+
+def _reducir_imagen(archivo):
+    """Reduce la foto a LADO_MAXIMO píxeles si es más grande y el resultado pesa menos"""
+    extension = os.path.splitext(archivo.nombre)[1].lower()
+    if not LADO_MAXIMO or extension not in EXTENSIONES_IMAGEN:
+        return archivo
+
+    from PIL import Image, ImageOps
+    try:
+        archivo.temporal.seek(0)
+        with Image.open(archivo.temporal) as imagen:
+            if max(imagen.size) <= LADO_MAXIMO:
+                return archivo
+            # Las fotos del celular guardan la rotación en EXIF
+            imagen = ImageOps.exif_transpose(imagen)
+            imagen.thumbnail((LADO_MAXIMO, LADO_MAXIMO), Image.LANCZOS)
+            salida = tempfile.SpooledTemporaryFile(max_size=MEMORIA_MAXIMA)
+            if extension == '.png':
+                imagen.save(salida, format='PNG', optimize=True)
+            else:
+                imagen.convert('RGB').save(salida, format='JPEG', quality=CALIDAD_JPEG, optimize=True)
+    except Exception as e:
+        # Una imagen que PIL no puede abrir se guarda tal cual
+        logger.warning(f"⚠️ No se pudo reducir la imagen {archivo.nombre}: {e}")
+        return archivo
+
+    tamano = salida.seek(0, io.SEEK_END)
+    if tamano >= archivo.tamano:
+        salida.close()
+        return archivo
+    salida.seek(0)
+    resumen = hashlib.sha256()
+    for bloque in iter(lambda: salida.read(TAMANO_BLOQUE), b''):
+        resumen.update(bloque)
+    logger.info(f"🖼️ Imagen {archivo.nombre} reducida de {archivo.tamano // 1024} KB a {tamano // 1024} KB")
+    archivo.cerrar()
+    return ArchivoSubido(archivo.nombre, salida, tamano, resumen.hexdigest())
+
+
+def procesar_archivos(archivos):
+    """Valida y copia a temporales los FileStorage recibidos.
+
+    Devuelve [ArchivoSubido] o lanza ErrorAdjunto; en ese caso cierra los temporales ya creados.
+    """
+    archivos = [a for a in archivos if a and a.filename]
+    if len(archivos) > MAXIMO_POR_SOLICITUD:
+        raise ErrorAdjunto(f'Máximo {MAXIMO_POR_SOLICITUD} archivos por solicitud')
+
+    procesados = []
+    try:
+        for archivo in archivos:
+            if not archivo.filename.lower().endswith(EXTENSIONES_PERMITIDAS):
+                raise ErrorAdjunto('Solo se permiten archivos PDF, imágenes o documentos Word')
+            es_foto = LADO_MAXIMO and archivo.filename.lower().endswith(EXTENSIONES_IMAGEN)
+            limite = max(TAMANO_MAXIMO, TAMANO_MAXIMO_FOTO) if es_foto else TAMANO_MAXIMO
+            temporal, tamano, sha256 = _copiar_por_bloques(archivo.stream, limite)
+            subido = _reducir_imagen(ArchivoSubido(archivo.filename, temporal, tamano, sha256))
+            procesados.append(subido)
+            if subido.tamano > TAMANO_MAXIMO:
+                raise _error_tamano(TAMANO_MAXIMO)
+    except Exception:
+        cerrar_archivos(procesados)
+        raise
+    return procesados
+
+
+def cerrar_archivos(archivos):
+    for archivo in archivos:
+        archivo.cerrar()
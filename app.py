@@ -1,17 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file  # pyright: ignore[reportMissingImports]
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_file, send_from_directory, make_response, Response, stream_with_context  # pyright: ignore[reportMissingImports]
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from werkzeug.exceptions import NotFound, RequestEntityTooLarge
 from datetime import datetime, date, timedelta, timezone
-from sqlalchemy import text
+from sqlalchemy import text, event
 import os
-import qrcode
 import io
 import hashlib
+import logging
 import secrets
-from openpyxl import load_workbook
-from openpyxl.styles import Font, Alignment
 import shutil
+from bisect import bisect_right
+from functools import lru_cache
 
 # Importar sistema de notificaciones
 from notificaciones import (
@@ -26,6 +27,19 @@ from notificaciones import (
     marcar_notificacion_leida_api,
     limpiar_notificaciones_api
 )
+from difusion_notificaciones import difusion_notificaciones
+from registro import obtener_logger
+from cache_referencias import cache_referencias
+import migraciones
+from motor_bd import opciones_motor, metricas_pool
+from instrumentacion import instrumentacion, CONSULTA_LENTA_MS, UMBRAL_N_MAS_1
+from carnets import firma_carnets, dibujar_carnet, generar_hojas
+from adjuntos import procesar_archivos, cerrar_archivos, ErrorAdjunto
+from cache_usuarios import cache_usuarios
+from cache_http import cache_http
+from limite_peticiones import limite_peticiones
+
+logger = obtener_logger('app')
 
 # Configurar zona horaria de Colombia (UTC-5)
 COLOMBIA_TZ = timezone(timedelta(hours=-5))
@@ -40,45 +54,111 @@ def colombia_now():
     """Devuelve la fecha y hora actual en zona horaria de Colombia"""
     return datetime.now(COLOMBIA_TZ)
 
+def calcular_pascua(ano):
+    """Domingo de Pascua del año (algoritmo de Meeus/Jones/Butcher, calendario gregoriano)"""
+    a = ano % 19
+    b, c = divmod(ano, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes, dia = divmod(h + l - 7 * m + 114, 31)
+    return date(ano, mes, dia + 1)
+
+def trasladar_a_lunes(fecha):
+    """Ley Emiliani (Ley 51 de 1983): el festivo se celebra el lunes siguiente si no cae en lunes"""
+    return fecha + timedelta(days=(7 - fecha.weekday()) % 7)
+
+@lru_cache(maxsize=32)
+def festivos_colombia(ano):
+    """Festivos de Colombia de un año, calculados una vez por año"""
+    # Festivos fijos que no se trasladan
+    festivos = {
+        date(ano, 1, 1),    # Año Nuevo
+        date(ano, 5, 1),    # Día del Trabajo
+        date(ano, 7, 20),   # Día de la Independencia
+        date(ano, 8, 7),    # Batalla de Boyacá
+        date(ano, 12, 8),   # Día de la Inmaculada Concepción
+        date(ano, 12, 25),  # Navidad
+    }
+    # Festivos trasladables al lunes (Ley Emiliani)
+    for mes, dia in [(1, 6),    # Reyes Magos
+                     (3, 19),   # San José
+                     (6, 29),   # San Pedro y San Pablo
+                     (8, 15),   # Asunción de la Virgen
+                     (10, 12),  # Día de la Raza
+                     (11, 1),   # Todos los Santos
+                     (11, 11)]: # Independencia de Cartagena
+        festivos.add(trasladar_a_lunes(date(ano, mes, dia)))
+    # Festivos que dependen de la Pascua
+    pascua = calcular_pascua(ano)
+    festivos.add(pascua - timedelta(days=3))  # Jueves Santo
+    festivos.add(pascua - timedelta(days=2))  # Viernes Santo
+    festivos.add(trasladar_a_lunes(pascua + timedelta(days=39)))  # Ascensión del Señor
+    festivos.add(trasladar_a_lunes(pascua + timedelta(days=60)))  # Corpus Christi
+    festivos.add(trasladar_a_lunes(pascua + timedelta(days=68)))  # Sagrado Corazón
+    return frozenset(festivos)
+
+@lru_cache(maxsize=32)
+def festivos_habiles_colombia(ano):
+    """Festivos del año que no caen en domingo, ordenados (para contar con bisect)"""
+    return tuple(sorted(f for f in festivos_colombia(ano) if f.weekday() != 6))
+
 def es_festivo_colombia(fecha):
     """Verifica si una fecha es festivo en Colombia"""
-    # Festivos fijos en Colombia
-    festivos_fijos = [
-        (1, 1),   # Año Nuevo
-        (5, 1),   # Día del Trabajo
-        (7, 20),  # Día de la Independencia
-        (8, 7),   # Batalla de Boyacá
-        (12, 8),  # Día de la Inmaculada Concepción
-        (12, 25), # Navidad
-    ]
-    
-    # Festivos que dependen del año (Pascua y relacionados)
-    # Para simplificar, usaremos una aproximación básica
-    # En producción, se recomienda usar una librería como 'holidays' o calcular Pascua
-    
-    if (fecha.month, fecha.day) in festivos_fijos:
-        return True
-    
-    # Aquí se pueden agregar más festivos calculados (Pascua, etc.)
-    # Por ahora, solo verificamos festivos fijos
-    
-    return False
+    return fecha in festivos_colombia(fecha.year)
+
+def contar_festivos_habiles(inicio, fin):
+    """Festivos que no caen en domingo en el rango (inicio, fin]"""
+    total = 0
+    for ano in range(inicio.year, fin.year + 1):
+        festivos = festivos_habiles_colombia(ano)
+        total += bisect_right(festivos, fin) - bisect_right(festivos, inicio)
+    return total
+
+def _sumar_dias_sin_domingo(fecha, dias):
+    """Fecha que queda dias días (lunes a sábado) después de fecha, por semanas completas"""
+    lunes = fecha - timedelta(days=fecha.weekday())
+    semanas, resto = divmod(min(fecha.weekday(), 5) + dias, 6)
+    return lunes + timedelta(days=7 * semanas + resto)
+
+def sumar_dias_habiles(fecha, dias):
+    """Fecha que queda dias días hábiles después de fecha.
+
+    Son hábiles los días de lunes a sábado que no son festivos. Se salta por semanas
+    completas y se vuelve a avanzar solo por los festivos que quedaron en el tramo.
+    """
+    while dias > 0:
+        destino = _sumar_dias_sin_domingo(fecha, dias)
+        fecha, dias = destino, contar_festivos_habiles(fecha, destino)
+    return fecha
+
+def contar_dias_habiles(inicio, fin):
+    """Días hábiles en el rango (inicio, fin]"""
+    if fin <= inicio:
+        return 0
+    # Días de lunes a sábado desde el 1/1/1 (un lunes) hasta cada fecha, inclusive
+    def hasta(fecha):
+        return (fecha - date(1, 1, 1)).days // 7 * 6 + min(fecha.weekday() + 1, 6)
+    return hasta(fin) - hasta(inicio) - contar_festivos_habiles(inicio, fin)
+
+MAX_DIAS_VACACIONES = 365
 
 def calcular_fecha_reintegro(fecha_inicio, cantidad_dias):
-    """Calcula la fecha de reintegro excluyendo domingos y festivos de Colombia"""
+    """Calcula la fecha de reintegro excluyendo domingos y festivos de Colombia.
+
+    Lanza ValueError si la cantidad de días no está entre 1 y MAX_DIAS_VACACIONES, y
+    OverflowError si la fecha resultante pasa del año 9999.
+    """
     if isinstance(fecha_inicio, str):
-        fecha_actual = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
-    else:
-        fecha_actual = fecha_inicio
-    dias_agregados = 0
-    
-    while dias_agregados < cantidad_dias:
-        fecha_actual += timedelta(days=1)
-        # Si no es domingo (0 = lunes, 6 = domingo) y no es festivo
-        if fecha_actual.weekday() != 6 and not es_festivo_colombia(fecha_actual):
-            dias_agregados += 1
-    
-    return fecha_actual
+        fecha_inicio = datetime.strptime(fecha_inicio, '%Y-%m-%d').date()
+    cantidad_dias = int(cantidad_dias)
+    if not 0 < cantidad_dias <= MAX_DIAS_VACACIONES:
+        raise ValueError(f'La cantidad de días debe estar entre 1 y {MAX_DIAS_VACACIONES}')
+    return sumar_dias_habiles(fecha_inicio, cantidad_dias)
 
 def get_periodo_actual():
     """Devuelve el período actual en formato YYYY-MM"""
@@ -94,6 +174,43 @@ def get_periodo_desde_params():
     except ValueError:
         return get_periodo_actual()
 
+def patron_prefijo(texto):
+    """Patrón LIKE 'texto%' escapando los comodines (usar con escape='\\')"""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def codificar_cursor(valores):
+    """Cursor opaco para paginación keyset"""
+    import base64, json
+    return base64.urlsafe_b64encode(json.dumps(valores, default=str).encode()).decode()
+
+def decodificar_cursor(cursor):
+    """Valores del cursor o None si no es válido"""
+    import base64, json
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return valores if isinstance(valores, list) else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def paginar_keyset(query, columna_id, columna=None, cursor=None, limite=50, descendente=True):
+    """Pagina por (columna, id) sin OFFSET: cada página continúa después de la última fila.
+
+    Devuelve (filas, siguiente_cursor); siguiente_cursor es None en la última página.
+    """
+    columnas = [columna, columna_id] if columna is not None else [columna_id]
+    valores = decodificar_cursor(cursor) if cursor else None
+    if valores and len(valores) == len(columnas):
+        clave = db.tuple_(*columnas) if len(columnas) > 1 else columnas[0]
+        limite_cursor = db.tuple_(*valores) if len(columnas) > 1 else valores[0]
+        query = query.filter(clave < limite_cursor if descendente else clave > limite_cursor)
+    query = query.order_by(*[c.desc() if descendente else c.asc() for c in columnas])
+    filas = query.limit(limite + 1).all()
+    if len(filas) <= limite:
+        return filas, None
+    filas = filas[:limite]
+    ultima = filas[-1]
+    return filas, codificar_cursor([getattr(ultima, c.key) for c in columnas])
+
 def to_colombia_time(dt):
     """Convierte una fecha/hora a zona horaria de Colombia"""
     if dt is None:
@@ -126,6 +243,7 @@ def generar_contrato_excel(contrato_id):
         ruta_archivo = os.path.join(contratos_dir, nombre_archivo)
         
         # Copiar template y cargar workbook
+        from openpyxl import load_workbook
         shutil.copy2(template_path, ruta_archivo)
         workbook = load_workbook(ruta_archivo)
         worksheet = workbook.active
@@ -175,28 +293,7 @@ def generar_contrato_excel(contrato_id):
         with open(ruta_archivo, 'rb') as f:
             archivo_data = f.read()
         
-        # Verificar si la tabla contrato_generado existe antes de insertar
         try:
-            # Intentar crear la tabla si no existe
-            try:
-                with db.engine.connect() as connection:
-                    connection.execute(text("""
-                        CREATE TABLE IF NOT EXISTS contrato_generado (
-                            id SERIAL PRIMARY KEY,
-                            empleado_id INTEGER NOT NULL REFERENCES empleado(id),
-                            contrato_id INTEGER NOT NULL REFERENCES contrato(id),
-                            nombre_archivo VARCHAR(255) NOT NULL,
-                            ruta_archivo VARCHAR(500) NOT NULL,
-                            archivo_data BYTEA,
-                            fecha_generacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            activo BOOLEAN DEFAULT TRUE
-                        );
-                    """))
-                    connection.commit()
-                print("✅ Tabla contrato_generado creada/verificada en generar_contrato_excel")
-            except Exception as create_error:
-                print(f"⚠️ No se pudo crear la tabla en generar_contrato_excel: {create_error}")
-            
             # Registrar en la base de datos con datos binarios
             contrato_generado = ContratoGenerado(
                 empleado_id=empleado.id,
@@ -205,20 +302,22 @@ def generar_contrato_excel(contrato_id):
                 ruta_archivo=ruta_archivo,
                 archivo_data=archivo_data
             )
+            # La hoja ya está en memoria: renderizar la vista previa ahora evita releer el Excel al abrirla
+            contrato_generado.guardar_vista_previa(worksheet, archivo_data)
             db.session.add(contrato_generado)
             db.session.commit()
             
             # Limpiar archivo temporal (opcional, ya que tenemos los datos en BD)
             try:
                 os.remove(ruta_archivo)
-                print(f"✅ Archivo temporal eliminado: {ruta_archivo}")
+                logger.debug("✅ Archivo temporal eliminado: %s", ruta_archivo)
             except:
                 pass  # No es crítico si no se puede eliminar
             
-            print(f"✅ Contrato generado y guardado en BD: {nombre_archivo}")
+            logger.info(f"✅ Contrato generado y guardado en BD: {nombre_archivo}")
             return contrato_generado
         except Exception as db_error:
-            print(f"Error al guardar en base de datos: {str(db_error)}")
+            logger.error(f"Error al guardar en base de datos: {str(db_error)}")
             # Si hay error de BD, crear un objeto mock que simule ContratoGenerado
             class MockContratoGenerado:
                 def __init__(self, nombre_archivo, ruta_archivo, empleado, contrato, archivo_data):
@@ -232,7 +331,7 @@ def generar_contrato_excel(contrato_id):
             return MockContratoGenerado(nombre_archivo, ruta_archivo, empleado, contrato, archivo_data)
         
     except Exception as e:
-        print(f"Error al generar contrato: {str(e)}")
+        logger.error(f"Error al generar contrato: {str(e)}")
         raise
 
 def reemplazar_variables_excel(worksheet, datos):
@@ -260,22 +359,23 @@ def reemplazar_variables_excel(worksheet, datos):
                                 variables_reemplazadas += 1
                             else:
                                 variables_no_encontradas.append(variable)
-                                print(f"⚠️ Variable no encontrada: {variable}")
+                                logger.debug("⚠️ Variable no encontrada: %s", variable)
                         
                         # Actualizar el valor de la celda
                         cell.value = valor_nuevo
                         if valor_original != valor_nuevo:
-                            print(f"✅ Reemplazado: {valor_original} -> {valor_nuevo}")
+                            logger.debug("✅ Reemplazado: %s -> %s", valor_original, valor_nuevo)
         
-        print(f"✅ Variables reemplazadas exitosamente: {variables_reemplazadas} reemplazos")
+        logger.info(f"✅ Variables reemplazadas exitosamente: {variables_reemplazadas} reemplazos")
         if variables_no_encontradas:
-            print(f"⚠️ Variables no encontradas: {', '.join(set(variables_no_encontradas))}")
+            logger.warning(f"⚠️ Variables no encontradas: {', '.join(set(variables_no_encontradas))}")
         
         # Mostrar todas las variables disponibles
-        print(f"📋 Variables disponibles: {', '.join(datos.keys())}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Variables disponibles: %s", ', '.join(datos.keys()))
         
     except Exception as e:
-        print(f"❌ Error al reemplazar variables: {str(e)}")
+        logger.error(f"❌ Error al reemplazar variables: {str(e)}")
 
 def convertir_numero_a_letras(numero):
     """Convierte un número a letras (mejorado para salarios)"""
@@ -333,7 +433,7 @@ def convertir_numero_a_letras(numero):
         return resultado.strip()
         
     except Exception as e:
-        print(f"Error al convertir número a letras: {str(e)}")
+        logger.error(f"Error al convertir número a letras: {str(e)}")
         return f"{numero} PESOS"
 
 def convertir_centenas_miles(numero):
@@ -410,125 +510,143 @@ def convertir_fecha_espanol(fecha):
         
         return f"{dia} DE {mes} DE {año}"
     except Exception as e:
-        print(f"Error al convertir fecha: {str(e)}")
+        logger.error(f"Error al convertir fecha: {str(e)}")
         return str(fecha)
 
-def convertir_excel_a_html(worksheet, contrato_generado):
-    """Convierte una hoja de Excel a HTML para vista previa con formato fiel"""
-    try:
-        html = '<div class="vista-previa-excel">'
-        html += f'<div class="text-center mb-4">'
-        html += f'<h4 class="text-primary"><i class="fas fa-file-excel me-2"></i>Vista Previa del Contrato</h4>'
-        html += f'<p class="text-muted">Empleado: <strong>{contrato_generado.empleado.nombre_completo}</strong></p>'
-        html += f'</div>'
-        
-        # Crear tabla HTML con estilos más fieles al Excel
-        html += '<div class="table-responsive" style="overflow-x: auto;">'
-        html += '<table class="table table-bordered" style="font-family: Arial, sans-serif; font-size: 11px; border-collapse: collapse; width: 100%;">'
-        
-        # Obtener dimensiones de la hoja
-        max_row = worksheet.max_row
-        max_col = worksheet.max_column
-        
-        # Procesar cada fila
-        for row in range(1, min(max_row + 1, 100)):  # Aumentar límite para ver más contenido
-            html += '<tr style="height: 20px;">'
-            
-            for col in range(1, min(max_col + 1, 30)):  # Aumentar límite de columnas
-                cell = worksheet.cell(row=row, column=col)
-                cell_value = str(cell.value) if cell.value is not None else ''
-                
-                # Aplicar estilos más detallados
-                cell_style = 'padding: 4px 8px; border: 1px solid #000; vertical-align: top; '
-                
-                # Estilos de fuente
-                if cell.font:
-                    if cell.font.bold:
-                        cell_style += 'font-weight: bold; '
-                    if cell.font.italic:
-                        cell_style += 'font-style: italic; '
-                    if cell.font.size:
-                        cell_style += f'font-size: {cell.font.size}px; '
-                    if cell.font.color and cell.font.color.rgb:
-                        cell_style += f'color: {cell.font.color.rgb}; '
-                
-                # Estilos de relleno
-                if cell.fill and cell.fill.start_color and cell.fill.start_color.rgb:
-                    cell_style += f'background-color: {cell.fill.start_color.rgb}; '
-                
-                # Estilos de alineación
-                if cell.alignment:
-                    if cell.alignment.horizontal == 'center':
-                        cell_style += 'text-align: center; '
-                    elif cell.alignment.horizontal == 'right':
-                        cell_style += 'text-align: right; '
-                    elif cell.alignment.horizontal == 'left':
-                        cell_style += 'text-align: left; '
-                    
-                    if cell.alignment.vertical == 'center':
-                        cell_style += 'vertical-align: middle; '
-                    elif cell.alignment.vertical == 'bottom':
-                        cell_style += 'vertical-align: bottom; '
-                
-                # Estilos de borde
-                if cell.border:
-                    if cell.border.left and cell.border.left.style:
-                        cell_style += 'border-left: 2px solid #000; '
-                    if cell.border.right and cell.border.right.style:
-                        cell_style += 'border-right: 2px solid #000; '
-                    if cell.border.top and cell.border.top.style:
-                        cell_style += 'border-top: 2px solid #000; '
-                    if cell.border.bottom and cell.border.bottom.style:
-                        cell_style += 'border-bottom: 2px solid #000; '
-                
-                # Determinar el tipo de celda
-                if row == 1 or (cell.font and cell.font.bold):
-                    html += f'<th style="{cell_style}">{cell_value}</th>'
-                else:
-                    html += f'<td style="{cell_style}">{cell_value}</td>'
-            
-            html += '</tr>'
-        
-        html += '</table>'
-        html += '</div>'
-        
-        # Información adicional
-        html += '<div class="mt-3">'
-        html += '<div class="alert alert-info">'
-        html += '<h6><i class="fas fa-info-circle me-2"></i>Información del Contrato:</h6>'
-        html += f'<ul class="mb-0">'
-        html += f'<li><strong>Empleado:</strong> {contrato_generado.empleado.nombre_completo}</li>'
-        html += f'<li><strong>Cédula:</strong> {contrato_generado.empleado.cedula}</li>'
-        html += f'<li><strong>Cargo:</strong> {contrato_generado.empleado.cargo_puesto or "No especificado"}</li>'
-        html += f'<li><strong>Salario:</strong> $ {contrato_generado.contrato.salario:,.0f}</li>'
-        html += f'<li><strong>Tipo de Contrato:</strong> {contrato_generado.contrato.tipo_contrato}</li>'
-        html += f'<li><strong>Fecha de Inicio:</strong> {contrato_generado.contrato.fecha_inicio.strftime("%d/%m/%Y")}</li>'
-        if contrato_generado.contrato.fecha_fin:
-            html += f'<li><strong>Fecha de Fin:</strong> {contrato_generado.contrato.fecha_fin.strftime("%d/%m/%Y")}</li>'
-        else:
-            html += f'<li><strong>Fecha de Fin:</strong> Indefinido</li>'
-        html += f'</ul>'
-        html += '</div>'
-        html += '</div>'
-        
-        html += '</div>'
-        
-        return html
-        
-    except Exception as e:
-        print(f"Error al convertir Excel a HTML: {str(e)}")
-        return f'''
-        <div class="alert alert-warning">
-            <h6><i class="fas fa-exclamation-triangle me-2"></i>Error en Vista Previa</h6>
-            <p>No se pudo generar la vista previa del contrato. Error: {str(e)}</p>
-            <p>Puedes descargar el archivo Excel para verlo directamente.</p>
+# Versión del formato de vista previa: cambiarla invalida el HTML guardado de los contratos
+VERSION_VISTA_PREVIA = '1'
+
+VARIANTES_VISTA_PREVIA = {
+    # Vista previa completa: estilos fieles al Excel
+    'completa': {'base': ('padding: 4px 8px', 'border: 1px solid #000', 'vertical-align: top'),
+                 'max_fuente': None, 'color_fuente': True, 'max_texto': None},
+    # Vista previa simple: texto recortado y fuente limitada
+    'simple': {'base': ('font-size: 10px',),
+               'max_fuente': 12, 'color_fuente': False, 'max_texto': 50},
+}
+
+def estilo_celda_excel(cell, variante):
+    """Declaraciones CSS de una celda de Excel como tupla (sirve de llave para deduplicar)"""
+    config = VARIANTES_VISTA_PREVIA[variante]
+    estilo = list(config['base'])
+
+    # Estilos de fuente
+    if cell.font:
+        if cell.font.bold:
+            estilo.append('font-weight: bold')
+        if cell.font.italic:
+            estilo.append('font-style: italic')
+        if cell.font.size:
+            tamano = min(cell.font.size, config['max_fuente']) if config['max_fuente'] else cell.font.size
+            estilo.append(f'font-size: {tamano}px')
+        if config['color_fuente'] and cell.font.color and cell.font.color.rgb:
+            estilo.append(f'color: {cell.font.color.rgb}')
+
+    # Estilos de relleno
+    if cell.fill and cell.fill.start_color and cell.fill.start_color.rgb:
+        estilo.append(f'background-color: {cell.fill.start_color.rgb}')
+
+    # Estilos de alineación
+    if cell.alignment:
+        if cell.alignment.horizontal in ('center', 'right', 'left'):
+            estilo.append(f'text-align: {cell.alignment.horizontal}')
+        if cell.alignment.vertical == 'center':
+            estilo.append('vertical-align: middle')
+        elif cell.alignment.vertical == 'bottom':
+            estilo.append('vertical-align: bottom')
+
+    # Estilos de borde
+    if cell.border:
+        for lado in ('left', 'right', 'top', 'bottom'):
+            borde = getattr(cell.border, lado)
+            if borde and borde.style:
+                estilo.append(f'border-{lado}: 2px solid #000')
+
+    return tuple(estilo)
+
+def renderizar_hoja_excel(worksheet, variante):
+    """Convierte una hoja de Excel en filas HTML para la vista previa.
+
+    Los estilos repetidos se agrupan en clases CSS (.tabla-excel-<variante> .xcN) en vez de
+    repetir un atributo style por celda. Devuelve '<style>...</style>' seguido de las filas.
+    """
+    from markupsafe import escape
+    max_texto = VARIANTES_VISTA_PREVIA[variante]['max_texto']
+    clases = {}
+    filas = []
+
+    for row in range(1, min(worksheet.max_row + 1, 100)):
+        celdas = []
+        for col in range(1, min(worksheet.max_column + 1, 30)):
+            cell = worksheet.cell(row=row, column=col)
+            cell_value = str(cell.value) if cell.value is not None else ''
+            if max_texto and len(cell_value) > max_texto:
+                cell_value = cell_value[:max_texto - 3] + '...'
+
+            clase = clases.setdefault(estilo_celda_excel(cell, variante), f'xc{len(clases)}')
+            etiqueta = 'th' if row == 1 or (cell.font and cell.font.bold) else 'td'
+            celdas.append(f'<{etiqueta} class="{clase}">{escape(cell_value)}</{etiqueta}>')
+        filas.append(f'<tr>{"".join(celdas)}</tr>')
+
+    css = '\n'.join(
+        f'.tabla-excel-{variante} .{clase} {{ {"; ".join(estilo)}; }}' for estilo, clase in clases.items()
+    )
+    return f'<style>\n{css}\n</style>\n' + '\n'.join(filas)
+
+def convertir_excel_a_html(tabla_html, contrato_generado):
+    """Arma la vista previa completa a partir de las filas ya renderizadas de la hoja"""
+    contrato = contrato_generado.contrato
+    empleado = contrato_generado.empleado
+    fecha_fin = contrato.fecha_fin.strftime("%d/%m/%Y") if contrato.fecha_fin else 'Indefinido'
+    return f'''<div class="vista-previa-excel">
+        <div class="text-center mb-4">
+            <h4 class="text-primary"><i class="fas fa-file-excel me-2"></i>Vista Previa del Contrato</h4>
+            <p class="text-muted">Empleado: <strong>{empleado.nombre_completo}</strong></p>
+        </div>
+        <div class="table-responsive" style="overflow-x: auto;">
+            <table class="table table-bordered tabla-excel-completa" style="font-family: Arial, sans-serif; font-size: 11px; border-collapse: collapse; width: 100%;">
+                {tabla_html}
+            </table>
+        </div>
+        <div class="mt-3">
+            <div class="alert alert-info">
+                <h6><i class="fas fa-info-circle me-2"></i>Información del Contrato:</h6>
+                <ul class="mb-0">
+                    <li><strong>Empleado:</strong> {empleado.nombre_completo}</li>
+                    <li><strong>Cédula:</strong> {empleado.cedula}</li>
+                    <li><strong>Cargo:</strong> {empleado.cargo_puesto or "No especificado"}</li>
+                    <li><strong>Salario:</strong> $ {contrato.salario:,.0f}</li>
+                    <li><strong>Tipo de Contrato:</strong> {contrato.tipo_contrato}</li>
+                    <li><strong>Fecha de Inicio:</strong> {contrato.fecha_inicio.strftime("%d/%m/%Y")}</li>
+                    <li><strong>Fecha de Fin:</strong> {fecha_fin}</li>
+                </ul>
+            </div>
         </div>
-        '''
+    </div>'''
+
+def responder_vista_previa(pagina):
+    """Respuesta con ETag: si el navegador ya tiene esta misma vista previa responde 304"""
+    respuesta = make_response(pagina)
+    respuesta.add_etag()
+    respuesta.headers['Cache-Control'] = 'private, no-cache'
+    return respuesta.make_conditional(request)
 
 app = Flask(__name__)
 
 # Configuración de la aplicación
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'tu_clave_secreta_muy_segura_aqui')
+# Tamaño máximo del cuerpo de una petición: werkzeug responde 413 sin leerlo si lo supera
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_PETICION_MB', 32)) * 1024 * 1024
+
+@app.errorhandler(RequestEntityTooLarge)
+def peticion_demasiado_grande(error):
+    """413 legible: JSON para las APIs, mensaje y regreso al formulario para las páginas"""
+    limite_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    mensaje = f'Los archivos enviados superan el máximo de {limite_mb}MB por envío'
+    if request.is_json or request.path.startswith('/api/') or request.path.endswith('/lote'):
+        return jsonify({'success': False, 'message': mensaje}), 413
+    flash(mensaje, 'error')
+    return redirect(request.path)
 
 # Registrar filtro de zona horaria para templates
 @app.template_filter('colombia_time')
@@ -539,12 +657,12 @@ def colombia_time_filter(dt):
 # Context processor para pasar variables globales a todos los templates
 @app.context_processor
 def inject_global_vars():
-    """Inyecta variables globales en todos los templates"""
-    try:
-        solicitudes_pendientes = SolicitudEmpleado.query.filter_by(estado='PENDIENTE').count()
-    except:
-        solicitudes_pendientes = 0
-    return dict(solicitudes_pendientes=solicitudes_pendientes)
+    """Inyecta variables globales en todos los templates.
+
+    El contador de solicitudes se pasa como función: solo se consulta cuando el menú
+    de administración lo muestra, nunca en páginas públicas ni fragmentos.
+    """
+    return dict(contar_solicitudes_pendientes=contar_solicitudes_pendientes_badge)
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
@@ -556,7 +674,7 @@ if database_url:
     if database_url.startswith('postgresql://'):
         database_url = database_url.replace('postgresql://', 'postgresql+psycopg://', 1)
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-    print(f"🔗 Usando PostgreSQL con psycopg en producción")
+    logger.info(f"🔗 Usando PostgreSQL con psycopg en producción")
 else:
     # Verificar si estamos en producción (Railway, Heroku, etc.)
     if os.environ.get('RAILWAY_ENVIRONMENT') or os.environ.get('DYNO') or os.environ.get('PORT'):
@@ -571,9 +689,16 @@ else:
     else:
         # Desarrollo local: usar SQLite
         app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///empleados.db'
-        print("💾 Usando SQLite para desarrollo local")
+        logger.info("💾 Usando SQLite para desarrollo local")
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(app.config['SQLALCHEMY_DATABASE_URI'])
 
 db = SQLAlchemy(app)
+cache_referencias.init_app(app, db)
+instrumentacion.init_app(app)
+firma_carnets.init_app(app)
+cache_http.init_app(app)
+limite_peticiones.init_app(app, db)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -658,14 +783,64 @@ class ContratoGenerado(db.Model):
     contrato_id = db.Column(db.Integer, db.ForeignKey('contrato.id'), nullable=False)
     nombre_archivo = db.Column(db.String(255), nullable=False)
     ruta_archivo = db.Column(db.String(500), nullable=False)
-    archivo_data = db.Column(db.LargeBinary, nullable=True)  # Datos binarios del archivo
+    archivo_data = db.deferred(db.Column(db.LargeBinary, nullable=True))  # Datos binarios del archivo
     fecha_generacion = db.Column(db.DateTime, default=colombia_now)
     activo = db.Column(db.Boolean, default=True)
+    # Vista previa renderizada: se guarda una vez y se reutiliza mientras el archivo no cambie
+    vista_previa_hash = db.Column(db.String(80))  # "<VERSION_VISTA_PREVIA>:<sha256 del archivo>"
+    vista_previa_html = db.deferred(db.Column(db.Text))
+    vista_previa_simple_html = db.deferred(db.Column(db.Text))
     
     # Relaciones
     empleado = db.relationship('Empleado', backref='contratos_generados')
     contrato = db.relationship('Contrato', backref='documentos_generados')
 
+    @staticmethod
+    def hash_contenido(archivo_data):
+        """Llave de la vista previa: versión del formato + hash del archivo"""
+        import hashlib
+        return f"{VERSION_VISTA_PREVIA}:{hashlib.sha256(archivo_data).hexdigest()}"
+
+    def guardar_vista_previa(self, worksheet, archivo_data):
+        """Renderiza las dos variantes de la vista previa y las guarda con su hash"""
+        self.vista_previa_html = renderizar_hoja_excel(worksheet, 'completa')
+        self.vista_previa_simple_html = renderizar_hoja_excel(worksheet, 'simple')
+        self.vista_previa_hash = ContratoGenerado.hash_contenido(archivo_data)
+
+    def obtener_vista_previa(self, variante):
+        """HTML de las filas de la vista previa, renderizado en la primera vista si hace falta.
+
+        Devuelve None si no hay archivo (ni en BD ni en disco).
+        """
+        campo = 'vista_previa_html' if variante == 'completa' else 'vista_previa_simple_html'
+        archivo_data = self.archivo_data
+        if not archivo_data:
+            # Fallback: intentar desde archivo (para contratos antiguos)
+            if not os.path.exists(self.ruta_archivo):
+                return None
+            with open(self.ruta_archivo, 'rb') as f:
+                archivo_data = f.read()
+
+        # Hashear el archivo es mucho más barato que volver a renderizarlo
+        if self.vista_previa_hash == ContratoGenerado.hash_contenido(archivo_data):
+            html = getattr(self, campo)
+            if html:
+                return html
+
+        from io import BytesIO
+        from openpyxl import load_workbook
+        workbook = load_workbook(BytesIO(archivo_data))
+        self.guardar_vista_previa(workbook.active, archivo_data)
+        try:
+            db.session.commit()
+            logger.info(f"✅ Vista previa del contrato {self.id} guardada")
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"⚠️ No se pudo guardar la vista previa del contrato {self.id}: {e}")
+            workbook = load_workbook(BytesIO(archivo_data))
+            return renderizar_hoja_excel(workbook.active, variante)
+        return getattr(self, campo)
+
 # Modelos para Sistema de Inventarios
 class Producto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -728,42 +903,138 @@ class Producto(db.Model):
     @staticmethod
     def generar_codigo_automatico(categoria, periodo=None):
         """Genera un código automático basado en la categoría"""
+        return Producto.reservar_codigos(categoria, periodo, 1)[0]
+
+    @staticmethod
+    def reservar_codigos(categoria, periodo=None, cantidad=1):
+        """Reserva `cantidad` códigos consecutivos (PREFIJO-NNN) para la categoría y el período.
+
+        Usa el contador de SecuenciaCodigoProducto, incrementado con un UPDATE atómico,
+        así dos usuarios creando productos a la vez nunca reciben el mismo código.
+        Los códigos reservados y no usados se pierden (igual que una secuencia).
+        """
         if periodo is None:
             periodo = get_periodo_actual()
-        
-        # Prefijos por categoría
-        prefijos = {
-            'ALMACEN GENERAL': 'ALM',
-            'QUIMICOS': 'QUI', 
-            'POSCOSECHA': 'POS'
-        }
-        
-        prefijo = prefijos.get(categoria, 'GEN')
-        
-        # Buscar el último código de esta categoría en el período
-        ultimo_producto = Producto.query.filter(
-            Producto.categoria == categoria,
-            Producto.periodo == periodo
-        ).order_by(Producto.id.desc()).first()
-        
-        if ultimo_producto and ultimo_producto.codigo:
-            # Extraer el número del último código
-            try:
-                # Buscar el patrón PREFIJO-NUMERO
-                import re
-                match = re.search(rf'^{prefijo}-(\d+)$', ultimo_producto.codigo)
-                if match:
-                    ultimo_numero = int(match.group(1))
-                    nuevo_numero = ultimo_numero + 1
-                else:
-                    nuevo_numero = 1
-            except:
-                nuevo_numero = 1
-        else:
-            nuevo_numero = 1
-        
+        prefijo = PREFIJOS_CATEGORIA_PRODUCTO.get(categoria, 'GEN')
+
+        ultimo_numero = SecuenciaCodigoProducto.incrementar(prefijo, periodo, cantidad)
+        if ultimo_numero is None:
+            # Primera vez para este prefijo/período: sembrar el contador con los códigos existentes
+            SecuenciaCodigoProducto.sembrar(prefijo, periodo)
+            ultimo_numero = SecuenciaCodigoProducto.incrementar(prefijo, periodo, cantidad)
+
         # Formatear con ceros a la izquierda (3 dígitos)
-        return f"{prefijo}-{nuevo_numero:03d}"
+        return [f"{prefijo}-{numero:03d}" for numero in range(ultimo_numero - cantidad + 1, ultimo_numero + 1)]
+
+    @staticmethod
+    def ajustar_stock(producto_id, delta, permitir_negativo=False):
+        """Suma delta al stock_actual con un UPDATE atómico y devuelve el nuevo stock.
+
+        La verificación de stock va en el WHERE del mismo UPDATE, así dos salidas
+        simultáneas no pueden pasar ambas la validación ni perder una actualización.
+        Devuelve None si el producto no existe o no hay stock suficiente.
+        """
+        condiciones = [Producto.id == producto_id]
+        if delta < 0 and not permitir_negativo:
+            condiciones.append(Producto.stock_actual >= -delta)
+
+        resultado = db.session.execute(
+            db.update(Producto)
+            .where(*condiciones)
+            .values(stock_actual=Producto.stock_actual + delta)
+            .returning(Producto.stock_actual)
+            .execution_options(synchronize_session=False)
+        )
+        fila = resultado.first()
+        if fila:
+            # El UPDATE directo no marca el Producto como modificado: el after_flush no lo ve
+            cache_referencias.invalidar('productos', conexion=db.session.connection())
+        return fila[0] if fila else None
+
+    @staticmethod
+    def ajustar_stock_lote(deltas):
+        """Aplica {producto_id: delta} al stock de varios productos en un solo UPDATE.
+
+        No valida stock: se usa después de bloquear y validar los productos.
+        """
+        if not deltas:
+            return
+        parametros = {}
+        if db.engine.dialect.name == 'postgresql':
+            valores = []
+            for i, (producto_id, delta) in enumerate(deltas.items()):
+                valores.append(f'(CAST(:id_{i} AS INTEGER), CAST(:delta_{i} AS INTEGER))')
+                parametros[f'id_{i}'] = producto_id
+                parametros[f'delta_{i}'] = delta
+            sql = f"""
+                UPDATE producto SET stock_actual = producto.stock_actual + v.delta
+                FROM (VALUES {', '.join(valores)}) AS v(id, delta)
+                WHERE producto.id = v.id
+            """
+        else:
+            # SQLite no admite alias de columnas en VALUES: usar CASE equivalente
+            casos = []
+            for i, (producto_id, delta) in enumerate(deltas.items()):
+                casos.append(f'WHEN :id_{i} THEN :delta_{i}')
+                parametros[f'id_{i}'] = producto_id
+                parametros[f'delta_{i}'] = delta
+            ids = ', '.join(f':id_{i}' for i in range(len(deltas)))
+            sql = f"""
+                UPDATE producto SET stock_actual = stock_actual + CASE id {' '.join(casos)} END
+                WHERE id IN ({ids})
+            """
+        db.session.execute(text(sql), parametros)
+        cache_referencias.invalidar('productos', conexion=db.session.connection())
+
+PREFIJOS_CATEGORIA_PRODUCTO = {
+    'ALMACEN GENERAL': 'ALM',
+    'QUIMICOS': 'QUI',
+    'POSCOSECHA': 'POS'
+}
+
+class SecuenciaCodigoProducto(db.Model):
+    """Último número de código asignado por prefijo y período"""
+    __tablename__ = 'secuencia_codigo_producto'
+
+    prefijo = db.Column(db.String(10), primary_key=True)
+    periodo = db.Column(db.String(7), primary_key=True)
+    ultimo_numero = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def incrementar(prefijo, periodo, cantidad=1):
+        """Suma `cantidad` al contador y devuelve el nuevo último número (None si no existe)"""
+        resultado = db.session.execute(
+            db.update(SecuenciaCodigoProducto)
+            .where(SecuenciaCodigoProducto.prefijo == prefijo,
+                   SecuenciaCodigoProducto.periodo == periodo)
+            .values(ultimo_numero=SecuenciaCodigoProducto.ultimo_numero + cantidad)
+            .returning(SecuenciaCodigoProducto.ultimo_numero)
+            .execution_options(synchronize_session=False)
+        )
+        fila = resultado.first()
+        return fila[0] if fila else None
+
+    @staticmethod
+    def sembrar(prefijo, periodo):
+        """Crea el contador partiendo del mayor código PREFIJO-NNN existente en el período"""
+        import re
+        patron = re.compile(rf'^{re.escape(prefijo)}-(\d+)$')
+        codigos = db.session.query(Producto.codigo).filter(
+            Producto.periodo == periodo,
+            Producto.codigo.like(f'{prefijo}-%')
+        ).all()
+        numeros = [int(m.group(1)) for (codigo,) in codigos if (m := patron.match(codigo or ''))]
+
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as insertar
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insertar
+        # Si otro proceso lo sembró primero se conserva el suyo
+        db.session.execute(
+            insertar(SecuenciaCodigoProducto)
+            .values(prefijo=prefijo, periodo=periodo, ultimo_numero=max(numeros, default=0))
+            .on_conflict_do_nothing(index_elements=['prefijo', 'periodo'])
+        )
 
 class MovimientoInventario(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -808,6 +1079,22 @@ class MovimientoInventario(db.Model):
             return float(self.cantidad * self.precio_unitario)
         return 0.0
     
+    @staticmethod
+    def calcular_valores(tipo_movimiento, tipo_ingreso, cantidad, precio_unitario,
+                         cantidad_empaques=None, contenido_por_empaque=None, precio_por_empaque=None):
+        """Calcula (cantidad en unidad base, precio unitario final, total) de un movimiento"""
+        if tipo_movimiento != 'ENTRADA':
+            return cantidad, 0, 0
+
+        if tipo_ingreso == 'EMPAQUE' and cantidad_empaques and contenido_por_empaque and precio_por_empaque:
+            # Ingreso por empaques: precio por unidad base y cantidad total en unidad base
+            precio_final = precio_por_empaque / contenido_por_empaque
+            total = cantidad_empaques * precio_por_empaque
+            return int(cantidad_empaques * contenido_por_empaque), precio_final, total
+
+        # Ingreso individual
+        return cantidad, precio_unitario, cantidad * precio_unitario
+
     def es_ingreso_por_empaques(self):
         """Verifica si es un ingreso por empaques"""
         return self.tipo_ingreso == 'EMPAQUE' and self.tipo_movimiento == 'ENTRADA'
@@ -834,6 +1121,11 @@ class Notificacion(db.Model):
     # Relaciones
     usuario = db.relationship('User', backref='notificaciones')
 
+notificacion_manager.init_app(app, db, Notificacion)
+
+# Hora a partir de la cual una entrada cuenta como llegada tarde en los reportes
+HORA_LIMITE_ENTRADA = datetime.strptime(os.environ.get('ASISTENCIA_HORA_LIMITE_ENTRADA', '07:00'), '%H:%M').time()
+
 class Asistencia(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     empleado_id = db.Column(db.Integer, db.ForeignKey('empleado.id'), nullable=False)
@@ -850,6 +1142,298 @@ class Asistencia(db.Model):
     # Índice único para evitar asistencia duplicada por día
     __table_args__ = (db.UniqueConstraint('empleado_id', 'fecha', name='unique_attendance_per_day'),)
 
+    def registrar_salida(self, hora_salida):
+        """Registra la salida y calcula las horas trabajadas (nómina y reportes suman esa columna)"""
+        self.hora_salida = hora_salida
+        if self.hora_entrada:
+            entrada = datetime.combine(self.fecha, self.hora_entrada)
+            salida = datetime.combine(self.fecha, hora_salida)
+            self.horas_trabajadas = (salida - entrada).total_seconds() / 3600
+
+    @staticmethod
+    def columnas_resumen():
+        """Agregados comunes de los reportes: días, horas, llegadas tarde y salidas sin registrar"""
+        hoy = colombia_now().date()
+        return [
+            db.func.count(Asistencia.id).label('dias_presentes'),
+            db.func.coalesce(db.func.sum(Asistencia.horas_trabajadas), 0).label('total_horas'),
+            db.func.count(Asistencia.horas_trabajadas).label('dias_con_horas'),
+            db.func.sum(db.case((Asistencia.hora_entrada > HORA_LIMITE_ENTRADA, 1), else_=0)).label('llegadas_tarde'),
+            # La asistencia de hoy sin salida sigue en curso: solo cuentan días anteriores
+            db.func.sum(db.case((db.and_(Asistencia.hora_salida.is_(None), Asistencia.fecha < hoy), 1), else_=0)).label('sin_salida'),
+        ]
+
+    @staticmethod
+    def resumen_por_empleado(inicio, fin):
+        """Totales de asistencia por empleado en el rango, en una consulta agrupada"""
+        return db.session.query(
+            Empleado.id.label('empleado_id'), Empleado.nombre_completo, Empleado.cedula,
+            Empleado.cargo_puesto, Empleado.departamento_laboral,
+            *Asistencia.columnas_resumen()
+        ).join(Asistencia, Asistencia.empleado_id == Empleado.id).filter(
+            Asistencia.fecha >= inicio,
+            Asistencia.fecha <= fin
+        ).group_by(
+            Empleado.id, Empleado.nombre_completo, Empleado.cedula,
+            Empleado.cargo_puesto, Empleado.departamento_laboral
+        ).order_by(Empleado.nombre_completo).all()
+
+    @staticmethod
+    def resumen_por_departamento(inicio, fin):
+        """Totales de asistencia por departamento en el rango, en una consulta agrupada"""
+        return db.session.query(
+            Empleado.departamento_laboral,
+            db.func.count(db.distinct(Asistencia.empleado_id)).label('empleados'),
+            *Asistencia.columnas_resumen()
+        ).join(Asistencia, Asistencia.empleado_id == Empleado.id).filter(
+            Asistencia.fecha >= inicio,
+            Asistencia.fecha <= fin
+        ).group_by(Empleado.departamento_laboral).order_by(Empleado.departamento_laboral).all()
+
+    @staticmethod
+    def registros_reporte(inicio, fin):
+        """Registros del rango con los datos del empleado en la misma consulta, leídos por lotes"""
+        return db.session.query(
+            Asistencia.fecha, Empleado.cedula, Empleado.nombre_completo, Empleado.departamento_laboral,
+            Asistencia.hora_entrada, Asistencia.hora_salida, Asistencia.horas_trabajadas, Asistencia.observaciones
+        ).join(Empleado, Empleado.id == Asistencia.empleado_id).filter(
+            Asistencia.fecha >= inicio,
+            Asistencia.fecha <= fin
+        ).order_by(Asistencia.fecha, Empleado.nombre_completo).execution_options(yield_per=1000)
+
+class RegistroKiosco(db.Model):
+    """Marcación recibida del kiosco sin conexión. El id lo genera el dispositivo y hace idempotente el reenvío."""
+    __tablename__ = 'registro_kiosco'
+
+    id_cliente = db.Column(db.String(64), primary_key=True)
+    documento = db.Column(db.String(20), nullable=False)
+    empleado_id = db.Column(db.Integer, db.ForeignKey('empleado.id'))
+    tipo = db.Column(db.String(10), nullable=False)  # entrada, salida
+    marcado_en = db.Column(db.DateTime)  # Hora del dispositivo (Colombia)
+    estado = db.Column(db.String(30), nullable=False)  # registrado, ya_registrado, sin_entrada, rechazado
+    mensaje = db.Column(db.String(300))
+    recibido_en = db.Column(db.DateTime, default=colombia_now)
+
+# Parámetros de liquidación de nómina (se pueden ajustar por variables de entorno si cambia la ley)
+HORAS_JORNADA_DIARIA = float(os.environ.get('NOMINA_HORAS_JORNADA_DIARIA', 8))
+HORA_INICIO_NOCTURNA = int(os.environ.get('NOMINA_HORA_INICIO_NOCTURNA', 21))  # Trabajo nocturno: de esta hora...
+HORA_FIN_NOCTURNA = int(os.environ.get('NOMINA_HORA_FIN_NOCTURNA', 6))  # ...hasta esta hora del día siguiente
+RECARGO_HORA_EXTRA = float(os.environ.get('NOMINA_RECARGO_HORA_EXTRA', 0.25))
+RECARGO_NOCTURNO = float(os.environ.get('NOMINA_RECARGO_NOCTURNO', 0.35))
+RECARGO_DOMINICAL_FESTIVO = float(os.environ.get('NOMINA_RECARGO_DOMINICAL_FESTIVO', 0.75))
+# Días que cubre salario_base según tipo_salario ('Por Hora' es valor por hora)
+DIAS_POR_TIPO_SALARIO = {'Mensual': 30, 'Quincenal': 15, 'Semanal': 7, 'Diario': 1}
+
+def segundos_del_dia(columna):
+    """Expresión SQL con los segundos desde medianoche de una columna TIME"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.extract('epoch', columna)
+    # SQLite guarda TIME como texto 'HH:MM:SS.ffffff'
+    return (db.func.strftime('%s', db.literal('2000-01-01 ').op('||')(columna))
+            - db.func.strftime('%s', '2000-01-01'))
+
+def rango_periodo(ano, mes):
+    """Primer y último día de un mes"""
+    inicio = date(ano, mes, 1)
+    fin = date(ano + 1, 1, 1) if mes == 12 else date(ano, mes + 1, 1)
+    return inicio, fin - timedelta(days=1)
+
+class NominaPeriodo(db.Model):
+    """Nómina liquidada de un empleado en un mes cerrado.
+
+    Los meses ya terminados se liquidan una sola vez y se leen de esta tabla; si se
+    modifica una asistencia de un mes cerrado sus filas se borran y se recalculan.
+    """
+    __tablename__ = 'nomina_periodo'
+
+    periodo = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    empleado_id = db.Column(db.Integer, db.ForeignKey('empleado.id'), primary_key=True)
+    total_dias = db.Column(db.Integer, nullable=False, default=0)
+    total_horas = db.Column(db.Float, nullable=False, default=0)
+    horas_ordinarias = db.Column(db.Float, nullable=False, default=0)
+    horas_extras = db.Column(db.Float, nullable=False, default=0)
+    horas_nocturnas = db.Column(db.Float, nullable=False, default=0)
+    horas_dominicales = db.Column(db.Float, nullable=False, default=0)
+    horas_festivas = db.Column(db.Float, nullable=False, default=0)
+    # Salario vigente al liquidar: un cambio posterior no altera meses cerrados
+    salario_base = db.Column(db.Float, nullable=False, default=0)
+    tipo_salario = db.Column(db.String(20))
+    valor_hora = db.Column(db.Float, nullable=False, default=0)
+    salario_devengado = db.Column(db.Float, nullable=False, default=0)
+    valor_horas_extras = db.Column(db.Float, nullable=False, default=0)
+    valor_recargos = db.Column(db.Float, nullable=False, default=0)
+    total_pagar = db.Column(db.Float, nullable=False, default=0)
+    fecha_calculo = db.Column(db.DateTime, default=colombia_now)
+
+    CAMPOS = ('total_dias', 'total_horas', 'horas_ordinarias', 'horas_extras', 'horas_nocturnas',
+              'horas_dominicales', 'horas_festivas', 'salario_base', 'tipo_salario', 'valor_hora',
+              'salario_devengado', 'valor_horas_extras', 'valor_recargos', 'total_pagar')
+
+    @staticmethod
+    def agregar_asistencias(inicio, fin):
+        """Totales de horas por empleado y mes en una sola consulta agregada.
+
+        Las horas totales salen de la entrada y la salida, y las nocturnas de su cruce con
+        la franja nocturna; las dominicales y festivas, de listas IN con las fechas del rango.
+        """
+        domingos, festivos = [], []
+        dia = inicio
+        while dia <= fin:
+            if dia.weekday() == 6:
+                domingos.append(dia)
+            elif es_festivo_colombia(dia):
+                festivos.append(dia)
+            dia += timedelta(days=1)
+
+        entrada = segundos_del_dia(Asistencia.hora_entrada)
+        salida = segundos_del_dia(Asistencia.hora_salida)
+        con_horario = db.and_(Asistencia.hora_entrada.isnot(None), Asistencia.hora_salida.isnot(None), salida >= entrada)
+        # Las horas salen de entrada/salida, igual que las nocturnas; horas_trabajadas solo
+        # cuenta en los registros sin horario completo
+        horas = db.case((con_horario, (salida - entrada) / 3600.0), else_=Asistencia.horas_trabajadas)
+        fin_madrugada = HORA_FIN_NOCTURNA * 3600
+        inicio_noche = HORA_INICIO_NOCTURNA * 3600
+        madrugada = db.case(
+            (entrada < fin_madrugada, db.case((salida < fin_madrugada, salida), else_=fin_madrugada) - entrada),
+            else_=0
+        )
+        noche = db.case(
+            (salida > inicio_noche, salida - db.case((entrada > inicio_noche, entrada), else_=inicio_noche)),
+            else_=0
+        )
+        segundos_nocturnos = db.case((con_horario, madrugada + noche), else_=0)
+        ano = db.extract('year', Asistencia.fecha)
+        mes = db.extract('month', Asistencia.fecha)
+
+        totales = db.session.query(
+            Asistencia.empleado_id.label('empleado_id'),
+            ano.label('ano'),
+            mes.label('mes'),
+            db.func.count(Asistencia.id).label('total_dias'),
+            db.func.sum(horas).label('total_horas'),
+            db.func.sum(db.case((horas > HORAS_JORNADA_DIARIA, horas - HORAS_JORNADA_DIARIA), else_=0)).label('horas_extras'),
+            db.func.sum(segundos_nocturnos).label('segundos_nocturnos'),
+            db.func.sum(db.case((Asistencia.fecha.in_(domingos), horas), else_=0)).label('horas_dominicales'),
+            db.func.sum(db.case((Asistencia.fecha.in_(festivos), horas), else_=0)).label('horas_festivas'),
+        ).filter(
+            Asistencia.fecha >= inicio,
+            Asistencia.fecha <= fin,
+            horas.isnot(None)
+        ).group_by(Asistencia.empleado_id, ano, mes).subquery()
+
+        return db.session.query(
+            totales, Empleado.nombre_completo, Empleado.cedula, Empleado.cargo_puesto,
+            Empleado.salario_base, Empleado.tipo_salario
+        ).join(Empleado, Empleado.id == totales.c.empleado_id).all()
+
+    @staticmethod
+    def liquidar(fila):
+        """Valores a pagar de una fila de agregar_asistencias"""
+        total_dias = int(fila.total_dias or 0)
+        total_horas = float(fila.total_horas or 0)
+        horas_extras = float(fila.horas_extras or 0)
+        horas_ordinarias = total_horas - horas_extras
+        salario_base = float(fila.salario_base or 0)
+
+        if fila.tipo_salario == 'Por Hora':
+            valor_hora = salario_base
+            salario_devengado = horas_ordinarias * valor_hora
+        else:
+            valor_dia = salario_base / DIAS_POR_TIPO_SALARIO.get(fila.tipo_salario, 30)
+            valor_hora = valor_dia / HORAS_JORNADA_DIARIA
+            # Los salarios por período se pagan completos; el diario, por día trabajado
+            salario_devengado = valor_dia * (total_dias if fila.tipo_salario == 'Diario' else 30)
+
+        datos = {
+            'total_dias': total_dias,
+            'total_horas': round(total_horas, 2),
+            'horas_ordinarias': round(horas_ordinarias, 2),
+            'horas_extras': round(horas_extras, 2),
+            'horas_nocturnas': round(float(fila.segundos_nocturnos or 0) / 3600, 2),
+            'horas_dominicales': round(float(fila.horas_dominicales or 0), 2),
+            'horas_festivas': round(float(fila.horas_festivas or 0), 2),
+            'salario_base': salario_base,
+            'tipo_salario': fila.tipo_salario,
+            'valor_hora': round(valor_hora, 2),
+        }
+        datos['salario_devengado'] = round(salario_devengado)
+        datos['valor_horas_extras'] = round(horas_extras * valor_hora * (1 + RECARGO_HORA_EXTRA))
+        datos['valor_recargos'] = round(
+            datos['horas_nocturnas'] * valor_hora * RECARGO_NOCTURNO
+            + (datos['horas_dominicales'] + datos['horas_festivas']) * valor_hora * RECARGO_DOMINICAL_FESTIVO
+        )
+        datos['total_pagar'] = datos['salario_devengado'] + datos['valor_horas_extras'] + datos['valor_recargos']
+        return datos
+
+    @staticmethod
+    def obtener(ano, meses=None, recalcular=False):
+        """Nómina de los meses indicados (todo el año por defecto), lista de dicts por empleado y mes.
+
+        Los meses cerrados se leen de nomina_periodo; los que falten y el mes en curso se
+        calculan con una sola consulta agregada sobre el rango que los cubre.
+        """
+        meses = sorted(meses or range(1, 13))
+        periodos = {f"{ano}-{mes:02d}": mes for mes in meses}
+        hoy = colombia_now().date()
+        cerrados = {p for p, mes in periodos.items() if rango_periodo(ano, mes)[1] < hoy}
+
+        if recalcular and cerrados:
+            NominaPeriodo.query.filter(NominaPeriodo.periodo.in_(cerrados)).delete(synchronize_session=False)
+            db.session.commit()
+
+        guardados = {p for (p,) in db.session.query(NominaPeriodo.periodo).filter(
+            NominaPeriodo.periodo.in_(cerrados)).distinct()} if cerrados else set()
+        pendientes = sorted(mes for p, mes in periodos.items() if p not in guardados)
+
+        resultado = []
+        if pendientes:
+            inicio = rango_periodo(ano, pendientes[0])[0]
+            fin = rango_periodo(ano, pendientes[-1])[1]
+            nuevos = []
+            for fila in NominaPeriodo.agregar_asistencias(inicio, fin):
+                periodo = f"{int(fila.ano)}-{int(fila.mes):02d}"
+                if periodo in guardados or periodo not in periodos:
+                    continue
+                datos = NominaPeriodo.liquidar(fila)
+                if periodo in cerrados:
+                    nuevos.append(dict(datos, periodo=periodo, empleado_id=fila.empleado_id))
+                resultado.append(dict(datos, periodo=periodo, empleado={
+                    'id': fila.empleado_id, 'nombre_completo': fila.nombre_completo,
+                    'cedula': fila.cedula, 'cargo_puesto': fila.cargo_puesto
+                }))
+            if nuevos:
+                try:
+                    db.session.execute(NominaPeriodo.__table__.insert(), nuevos)
+                    db.session.commit()
+                    logger.info(f"✅ Nómina guardada para {len({n['periodo'] for n in nuevos})} período(s) cerrado(s)")
+                except Exception as e:
+                    # Otro worker pudo guardar el mismo período al mismo tiempo
+                    db.session.rollback()
+                    logger.warning(f"⚠️ No se pudo guardar la nómina calculada: {e}")
+
+        if guardados:
+            filas = db.session.query(
+                NominaPeriodo, Empleado.nombre_completo, Empleado.cedula, Empleado.cargo_puesto
+            ).join(Empleado, Empleado.id == NominaPeriodo.empleado_id).filter(
+                NominaPeriodo.periodo.in_(guardados)
+            ).all()
+            for nomina, nombre_completo, cedula, cargo_puesto in filas:
+                datos = {campo: getattr(nomina, campo) for campo in NominaPeriodo.CAMPOS}
+                resultado.append(dict(datos, periodo=nomina.periodo, empleado={
+                    'id': nomina.empleado_id, 'nombre_completo': nombre_completo,
+                    'cedula': cedula, 'cargo_puesto': cargo_puesto
+                }))
+
+        resultado.sort(key=lambda d: (d['periodo'], d['empleado']['nombre_completo']))
+        return resultado
+
+    @staticmethod
+    def invalidar_fechas(conexion, fechas):
+        """Borra la nómina guardada de los meses de esas fechas"""
+        periodos = {f"{f.year}-{f.month:02d}" for f in fechas if f}
+        if periodos:
+            conexion.execute(NominaPeriodo.__table__.delete().where(NominaPeriodo.periodo.in_(periodos)))
+
 class SolicitudEmpleado(db.Model):
     """Modelo para solicitudes de empleados (vacaciones, licencias, etc.)"""
     id = db.Column(db.Integer, primary_key=True)
@@ -877,13 +1461,14 @@ class SolicitudEmpleado(db.Model):
     fecha_aprobacion = db.Column(db.DateTime, nullable=True)
     comentario_admin = db.Column(db.Text)  # Comentario al aprobar/rechazar
     
-    # Archivos adjuntos (almacenados como BYTEA)
-    adjuntos_data = db.Column(db.LargeBinary, nullable=True)  # JSON con información de archivos
+    # Archivos adjuntos: el contenido está en ArchivoSolicitud (origen 'empleado')
     adjuntos_nombres = db.Column(db.Text)  # Nombres de archivos separados por |
+    # Formato anterior (JSON con el contenido en hexadecimal); la migración 0014 lo pasa a archivo_solicitud
+    adjuntos_data = db.deferred(db.Column(db.LargeBinary, nullable=True))
     
-    # Documentos del admin (respuesta)
-    documentos_admin_data = db.Column(db.LargeBinary, nullable=True)
+    # Documentos del admin (respuesta): ArchivoSolicitud con origen 'admin'
     documentos_admin_nombres = db.Column(db.Text)
+    documentos_admin_data = db.deferred(db.Column(db.LargeBinary, nullable=True))  # Formato anterior
     
     # Campos del sistema
     created_at = db.Column(db.DateTime, default=colombia_now)
@@ -893,6 +1478,65 @@ class SolicitudEmpleado(db.Model):
     empleado = db.relationship('Empleado', backref=db.backref('solicitudes', lazy=True))
     aprobado_por = db.relationship('User', backref=db.backref('solicitudes_aprobadas', lazy=True))
 
+class ArchivoSolicitud(db.Model):
+    """Archivo adjunto de una solicitud, uno por fila (ver adjuntos.py)"""
+    __tablename__ = 'archivo_solicitud'
+    __table_args__ = (db.UniqueConstraint('solicitud_id', 'origen', 'indice'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    solicitud_id = db.Column(db.Integer, db.ForeignKey('solicitud_empleado.id', ondelete='CASCADE'), nullable=False)
+    origen = db.Column(db.String(10), nullable=False)  # empleado, admin
+    indice = db.Column(db.Integer, nullable=False)  # Orden dentro de la solicitud, usado en la URL de descarga
+    nombre = db.Column(db.String(255), nullable=False)
+    tipo_mime = db.Column(db.String(100))
+    tamano = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    # Solo se carga al descargar
+    contenido = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    created_at = db.Column(db.DateTime, default=colombia_now)
+
+    @staticmethod
+    def guardar(solicitud_id, origen, archivos):
+        """Inserta los archivos uno por uno: solo el contenido de uno está en memoria a la vez"""
+        inicial = db.session.query(db.func.count(ArchivoSolicitud.id)).filter_by(
+            solicitud_id=solicitud_id, origen=origen).scalar()
+        for indice, archivo in enumerate(archivos, start=inicial):
+            db.session.execute(db.insert(ArchivoSolicitud).values(
+                solicitud_id=solicitud_id,
+                origen=origen,
+                indice=indice,
+                nombre=archivo.nombre[:255],
+                tipo_mime=archivo.tipo_mime,
+                tamano=archivo.tamano,
+                sha256=archivo.sha256,
+                contenido=archivo.leer(),
+                created_at=colombia_now()
+            ))
+
+    @staticmethod
+    def listar(solicitud_id, origen):
+        """Datos de los archivos sin el contenido"""
+        return ArchivoSolicitud.query.filter_by(solicitud_id=solicitud_id, origen=origen).order_by(
+            ArchivoSolicitud.indice).all()
+
+    @staticmethod
+    def respuesta_descarga(solicitud_id, origen, indice):
+        """send_file del archivo, o None si no existe"""
+        archivo = ArchivoSolicitud.query.filter_by(
+            solicitud_id=solicitud_id, origen=origen, indice=indice
+        ).options(db.undefer(ArchivoSolicitud.contenido)).first()
+        if archivo is None:
+            return None
+        respuesta = send_file(
+            io.BytesIO(archivo.contenido),
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=archivo.nombre,
+            etag=archivo.sha256
+        )
+        respuesta.cache_control.private = True
+        return respuesta
+
 class Visitante(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     
@@ -923,22 +1567,201 @@ class Visitante(db.Model):
     created_at = db.Column(db.DateTime, default=colombia_now)
     updated_at = db.Column(db.DateTime, default=colombia_now, onupdate=colombia_now)
 
+    __table_args__ = (
+        db.Index('ix_visitante_documento', 'documento'),
+        db.Index('ix_visitante_documento_fecha_entrada', 'documento', 'fecha_entrada'),
+        # Índice parcial para la vista de visitas en curso
+        db.Index('ix_visitante_en_visita', 'id',
+                 postgresql_where=text("estado_visita = 'En visita'"),
+                 sqlite_where=text("estado_visita = 'En visita'")),
+    )
+
+    @staticmethod
+    def visita_de_hoy(documento, solo_en_visita=False):
+        """Primer registro del documento con entrada hoy (rango de fechas, usa el índice)"""
+        inicio_dia = datetime.combine(date.today(), datetime.min.time())
+        filtros = [
+            Visitante.documento == documento,
+            Visitante.fecha_entrada >= inicio_dia,
+            Visitante.fecha_entrada < inicio_dia + timedelta(days=1)
+        ]
+        if solo_en_visita:
+            filtros.append(Visitante.estado_visita == 'En visita')
+        return Visitante.query.filter(*filtros).first()
+
+class PerfilVisitante(db.Model):
+    """Datos más recientes de cada visitante (una fila por documento) para la entrada rápida"""
+    __tablename__ = 'perfil_visitante'
+
+    id = db.Column(db.Integer, primary_key=True)
+    documento = db.Column(db.String(20), nullable=False, unique=True)
+    nombre = db.Column(db.String(100), nullable=False)
+    apellido = db.Column(db.String(100), nullable=False)
+    nombre_busqueda = db.Column(db.String(201), nullable=False)  # "nombre apellido" en minúsculas
+    eps = db.Column(db.String(100), nullable=False)
+    rh = db.Column(db.String(10), nullable=False)
+    telefono = db.Column(db.String(20), nullable=False)
+    empresa = db.Column(db.String(100))
+    motivo_visita = db.Column(db.Text, nullable=False)
+    nombre_contacto_emergencia = db.Column(db.String(200), nullable=False)
+    telefono_emergencia = db.Column(db.String(20), nullable=False)
+    parentesco = db.Column(db.String(50), nullable=False)
+    total_visitas = db.Column(db.Integer, default=1)
+    ultima_visita = db.Column(db.DateTime, default=colombia_now)
+
+    __table_args__ = (
+        db.Index('ix_perfil_visitante_nombre_busqueda', 'nombre_busqueda',
+                 postgresql_ops={'nombre_busqueda': 'varchar_pattern_ops'}),
+    )
 
-def obtener_visitantes_recurrentes():
-    """Obtiene la lista de visitantes registrados previamente (último registro por documento)."""
-    subconsulta = db.session.query(
-        db.func.max(Visitante.id).label('max_id')
-    ).group_by(Visitante.documento).subquery()
+    CAMPOS = ('nombre', 'apellido', 'eps', 'rh', 'telefono', 'empresa', 'motivo_visita',
+              'nombre_contacto_emergencia', 'telefono_emergencia', 'parentesco')
 
-    visitantes_unicos = Visitante.query.filter(
-        Visitante.id.in_(subconsulta)
-    ).order_by(Visitante.nombre.asc()).all()
+    @staticmethod
+    def normalizar_busqueda(texto):
+        return ' '.join((texto or '').lower().split())
+
+    @staticmethod
+    def valores_desde_visitante(visitante):
+        valores = {campo: getattr(visitante, campo) for campo in PerfilVisitante.CAMPOS}
+        valores['documento'] = visitante.documento.strip()
+        valores['nombre_busqueda'] = PerfilVisitante.normalizar_busqueda(f"{visitante.nombre} {visitante.apellido}")
+        valores['ultima_visita'] = visitante.fecha_entrada or colombia_now()
+        return valores
 
-    return visitantes_unicos
+    @staticmethod
+    def registrar_visita(visitante):
+        """Crea o actualiza el perfil del documento con los datos de esta visita (en la misma transacción)"""
+        if db.engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as insertar
+        else:
+            from sqlalchemy.dialects.sqlite import insert as insertar
+        valores = PerfilVisitante.valores_desde_visitante(visitante)
+        consulta = insertar(PerfilVisitante).values(total_visitas=1, **valores)
+        actualizar = {campo: consulta.excluded[campo] for campo in valores if campo != 'documento'}
+        actualizar['total_visitas'] = PerfilVisitante.total_visitas + 1
+        db.session.execute(consulta.on_conflict_do_update(index_elements=['documento'], set_=actualizar))
+
+    @staticmethod
+    def buscar(texto, limite=8):
+        """Perfiles cuyo nombre o documento empieza por el texto"""
+        texto = PerfilVisitante.normalizar_busqueda(texto)
+        if len(texto) < 2:
+            return []
+        patron = patron_prefijo(texto)
+        return PerfilVisitante.query.filter(db.or_(
+            PerfilVisitante.nombre_busqueda.like(patron, escape='\\'),
+            PerfilVisitante.documento.like(patron, escape='\\')
+        )).order_by(PerfilVisitante.ultima_visita.desc()).limit(limite).all()
+
+    @staticmethod
+    def poblar_desde_visitantes():
+        """Crea los perfiles a partir del historial de visitantes (último registro por documento)"""
+        subconsulta = db.session.query(
+            db.func.max(Visitante.id).label('max_id'),
+            db.func.count(Visitante.id).label('total')
+        ).group_by(Visitante.documento).subquery()
+        filas = db.session.query(Visitante, subconsulta.c.total).join(
+            subconsulta, Visitante.id == subconsulta.c.max_id
+        ).all()
+        perfiles = {}
+        for visitante, total in filas:
+            valores = PerfilVisitante.valores_desde_visitante(visitante)
+            valores['total_visitas'] = total
+            perfiles[valores['documento']] = valores  # documentos con espacios se unifican
+        if perfiles:
+            db.session.execute(db.insert(PerfilVisitante), list(perfiles.values()))
+        return len(perfiles)
+
+# Datos de referencia en caché (ver cache_referencias.py)
+# Grupos que se invalidan cuando se escribe cada modelo
+GRUPOS_CACHE_POR_MODELO = {
+    'Producto': ('productos',),
+    'MovimientoInventario': ('movimientos',),
+    'Empleado': ('empleados',),
+    'SolicitudEmpleado': ('solicitudes',),
+    'Visitante': ('visitantes',),
+}
+
+@event.listens_for(db.session, 'after_flush')
+def invalidar_cache_referencias(session, flush_context):
+    """Invalida los grupos de caché de los modelos escritos en este flush y la nómina afectada"""
+    modelos = {type(obj).__name__ for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+    grupos = {grupo for modelo in modelos for grupo in GRUPOS_CACHE_POR_MODELO.get(modelo, ())}
+    if grupos:
+        cache_referencias.invalidar(*sorted(grupos), conexion=session.connection())
+
+    # Una asistencia modificada invalida la nómina guardada de su mes (y del anterior si cambió la fecha)
+    fechas = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Asistencia):
+            fechas.add(obj.fecha)
+            fechas.update(db.inspect(obj).attrs.fecha.history.deleted or ())
+    if fechas:
+        NominaPeriodo.invalidar_fechas(session.connection(), fechas)
+
+def contar_solicitudes_pendientes():
+    """Número de solicitudes en estado PENDIENTE (en caché hasta que se cree, apruebe o rechace una)"""
+    return cache_referencias.obtener(
+        'solicitudes', 'pendientes',
+        lambda: SolicitudEmpleado.query.filter_by(estado='PENDIENTE').count()
+    )
+
+def contar_solicitudes_pendientes_badge():
+    """Contador para el menú: 0 si no hay un administrador autenticado"""
+    if not current_user.is_authenticated or not current_user.is_admin:
+        return 0
+    try:
+        return contar_solicitudes_pendientes()
+    except Exception as e:
+        logger.warning(f"⚠️ Error obteniendo solicitudes pendientes: {e}")
+        return 0
+
+def obtener_periodos_productos():
+    """Períodos con productos, del más reciente al más antiguo"""
+    def calcular():
+        periodos = db.session.query(Producto.periodo).distinct().order_by(Producto.periodo.desc()).all()
+        return [p[0] for p in periodos if p[0] is not None]
+    return cache_referencias.obtener('productos', 'periodos', calcular)
+
+def obtener_periodos_movimientos():
+    """Períodos con movimientos de inventario, del más reciente al más antiguo"""
+    def calcular():
+        periodos = db.session.query(MovimientoInventario.periodo).distinct().order_by(MovimientoInventario.periodo.desc()).all()
+        return [p[0] for p in periodos if p[0] is not None]
+    return cache_referencias.obtener('movimientos', 'periodos', calcular)
+
+def obtener_responsables_movimientos():
+    """Responsables distintos registrados en movimientos de inventario"""
+    def calcular():
+        responsables = db.session.query(MovimientoInventario.responsable).distinct().filter(MovimientoInventario.responsable.isnot(None)).all()
+        return sorted([r[0] for r in responsables if r[0] and r[0].strip()])
+    return cache_referencias.obtener('movimientos', 'responsables', calcular)
+
+def obtener_empleados_activos():
+    """Empleados activos para selectores (id, nombre_completo, cedula)"""
+    def calcular():
+        empleados = db.session.query(Empleado.id, Empleado.nombre_completo, Empleado.cedula).filter(
+            Empleado.estado_empleado == 'Activo'
+        ).order_by(Empleado.nombre_completo).all()
+        return [{'id': e.id, 'nombre_completo': e.nombre_completo, 'cedula': e.cedula} for e in empleados]
+    return cache_referencias.obtener('empleados', 'activos', calcular)
+
+def obtener_productos_activos_selector():
+    """Productos activos para filtros (id, codigo, nombre), sin stock porque cambia con cada movimiento"""
+    def calcular():
+        productos = db.session.query(Producto.id, Producto.codigo, Producto.nombre).filter(
+            Producto.activo == True
+        ).order_by(Producto.nombre).all()
+        return [{'id': p.id, 'codigo': p.codigo, 'nombre': p.nombre} for p in productos]
+    return cache_referencias.obtener('productos', 'activos_selector', calcular)
+
+cache_usuarios.init_app(app, User)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Identidad en caché por worker: los sondeos autenticados no consultan la tabla user
+    return cache_usuarios.cargar(user_id)
 
 # Funciones para el sistema de QR y tokens
 def generar_token_diario():
@@ -959,10 +1782,10 @@ def validar_token_diario_visitantes(token):
     token_actual = generar_token_diario_visitantes()
     return token == token_actual
 
-def generar_qr_solicitudes():
-    """Genera un código QR para solicitudes de empleados"""
-    token = generar_token_qr_constante()  # Mismo token estático
-    url_solicitudes = f"{request.url_root}solicitudes-publico/{token}"
+def generar_imagen_qr(url):
+    """PNG en memoria con el código QR de la URL"""
+    # qrcode y PIL se importan aquí: solo los usan las páginas de QR y no deben pesar en el arranque
+    import qrcode
     
     qr = qrcode.QRCode(
         version=1,
@@ -970,7 +1793,7 @@ def generar_qr_solicitudes():
         box_size=10,
         border=4,
     )
-    qr.add_data(url_solicitudes)
+    qr.add_data(url)
     qr.make(fit=True)
     
     img = qr.make_image(fill_color="black", back_color="white")
@@ -979,7 +1802,14 @@ def generar_qr_solicitudes():
     img_buffer = io.BytesIO()
     img.save(img_buffer, format='PNG')
     img_buffer.seek(0)
+    return img_buffer
+
+def generar_qr_solicitudes():
+    """Genera un código QR para solicitudes de empleados"""
+    token = generar_token_qr_constante()  # Mismo token estático
+    url_solicitudes = f"{request.url_root}solicitudes-publico/{token}"
     
+    img_buffer = generar_imagen_qr(url_solicitudes)
     return img_buffer, token, url_solicitudes
 
 def generar_qr_asistencia():
@@ -987,22 +1817,7 @@ def generar_qr_asistencia():
     token = generar_token_diario()
     url_asistencia = f"{request.url_root}asistencia-publica/{token}"
     
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url_asistencia)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Guardar en memoria
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    
+    img_buffer = generar_imagen_qr(url_asistencia)
     return img_buffer, token, url_asistencia
 
 def generar_qr_visitantes():
@@ -1010,22 +1825,7 @@ def generar_qr_visitantes():
     token = generar_token_diario_visitantes()
     url_visitantes = f"{request.url_root}visitantes-publico/{token}"
     
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(url_visitantes)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Guardar en memoria
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    img_buffer.seek(0)
-    
+    img_buffer = generar_imagen_qr(url_visitantes)
     return img_buffer, token, url_visitantes
 
 # Rutas de Autenticación
@@ -1038,6 +1838,7 @@ def login():
         
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
+            cache_usuarios.registrar_inicio(user)
             return redirect(url_for('dashboard'))
         else:
             flash('Email o contraseña incorrectos', 'error')
@@ -1048,6 +1849,7 @@ def login():
 @login_required
 def logout():
     logout_user()
+    cache_usuarios.cerrar_sesion()
     return redirect(url_for('login'))
 
 # Dashboard Principal
@@ -1060,7 +1862,7 @@ def dashboard():
         total_empleados = Empleado.query.filter_by(estado_empleado='Activo').count()
         total_empleados_inactivos = Empleado.query.filter_by(estado_empleado='Inactivo').count()
     except Exception as e:
-        print(f"⚠️ Error obteniendo estadísticas de empleados: {e}")
+        logger.warning(f"⚠️ Error obteniendo estadísticas de empleados: {e}")
         total_empleados = 0
         total_empleados_inactivos = 0
     
@@ -1075,7 +1877,7 @@ def dashboard():
             Visitante.activo == True
         ).count()
     except Exception as e:
-        print(f"⚠️ Error obteniendo estadísticas de visitantes: {e}")
+        logger.warning(f"⚠️ Error obteniendo estadísticas de visitantes: {e}")
         total_visitantes_hoy = 0
         total_visitantes_mes = 0
     
@@ -1102,7 +1904,7 @@ def dashboard():
         ).all()
         horas_trabajadas_mes = sum(a.horas_trabajadas for a in asistencias_mes_completas if a.horas_trabajadas)
     except Exception as e:
-        print(f"⚠️ Error obteniendo estadísticas de asistencias: {e}")
+        logger.warning(f"⚠️ Error obteniendo estadísticas de asistencias: {e}")
         asistencias_hoy = 0
         asistencias_semana = 0
         asistencias_mes = 0
@@ -1117,7 +1919,7 @@ def dashboard():
         ).count()
         total_contratos_activos = Contrato.query.filter_by(activo=True).count()
     except Exception as e:
-        print(f"⚠️ Error obteniendo estadísticas de contratos: {e}")
+        logger.warning(f"⚠️ Error obteniendo estadísticas de contratos: {e}")
         contratos_vencer = 0
         total_contratos_activos = 0
     
@@ -1138,7 +1940,7 @@ def dashboard():
             ContratoGenerado.fecha_generacion >= datetime.now().date()
         ).count()
     except Exception as e:
-        print(f"⚠️ Error obteniendo contratos generados: {e}")
+        logger.warning(f"⚠️ Error obteniendo contratos generados: {e}")
         contratos_generados_hoy = 0
     
     # Empleados recientes (últimos 30 días)
@@ -1147,14 +1949,14 @@ def dashboard():
             Empleado.fecha_ingreso >= date.today() - timedelta(days=30)
         ).count()
     except Exception as e:
-        print(f"⚠️ Error obteniendo empleados recientes: {e}")
+        logger.warning(f"⚠️ Error obteniendo empleados recientes: {e}")
         empleados_recientes = 0
     
     # Solicitudes pendientes
     try:
-        solicitudes_pendientes = SolicitudEmpleado.query.filter_by(estado='PENDIENTE').count()
+        solicitudes_pendientes = contar_solicitudes_pendientes()
     except Exception as e:
-        print(f"⚠️ Error obteniendo solicitudes pendientes: {e}")
+        logger.warning(f"⚠️ Error obteniendo solicitudes pendientes: {e}")
         solicitudes_pendientes = 0
     
     return render_template('dashboard.html', 
@@ -1179,9 +1981,71 @@ def dashboard():
 @app.route('/empleados')
 @login_required
 def empleados():
-    # Mostrar todos los empleados, no solo los activos
-    empleados = Empleado.query.order_by(Empleado.created_at.desc()).all()
-    return render_template('empleados.html', empleados=empleados)
+    # Mostrar todos los empleados, no solo los activos (paginados)
+    query, filtros = consulta_empleados(request.args)
+    empleados, siguiente_cursor = paginar_consulta_empleados(query, filtros, request.args.get('cursor'))
+    return render_template('empleados.html',
+                         empleados=empleados,
+                         filtros=filtros,
+                         siguiente_cursor=siguiente_cursor)
+
+TAMANO_PAGINA_LISTADOS = 50
+
+def leer_fecha_param(valor):
+    """Fecha YYYY-MM-DD de un parámetro de la URL o None"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+    except ValueError:
+        return None
+
+def consulta_empleados(args):
+    """Consulta de empleados según los filtros de la URL (estado, q, orden)"""
+    filtros = {
+        'estado': args.get('estado', ''),
+        'q': args.get('q', '').strip(),
+        'orden': args.get('orden') if args.get('orden') in ('recientes', 'nombre') else 'recientes'
+    }
+    query = Empleado.query
+    if filtros['estado']:
+        query = query.filter(Empleado.estado_empleado == filtros['estado'])
+    if filtros['q']:
+        patron = patron_prefijo(filtros['q'].lower())
+        query = query.filter(db.or_(
+            db.func.lower(Empleado.nombre_completo).like(patron, escape='\\'),
+            Empleado.cedula.like(patron, escape='\\')
+        ))
+    return query, filtros
+
+def paginar_consulta_empleados(query, filtros, cursor):
+    if filtros['orden'] == 'nombre':
+        return paginar_keyset(query, Empleado.id, Empleado.nombre_completo, cursor,
+                              TAMANO_PAGINA_LISTADOS, descendente=False)
+    return paginar_keyset(query, Empleado.id, cursor=cursor, limite=TAMANO_PAGINA_LISTADOS)
+
+@app.route('/api/empleados')
+@login_required
+def api_empleados():
+    """Página de empleados en JSON (con html=1 incluye las filas de la tabla ya renderizadas)"""
+    query, filtros = consulta_empleados(request.args)
+    empleados, siguiente_cursor = paginar_consulta_empleados(query, filtros, request.args.get('cursor'))
+    respuesta = {
+        'success': True,
+        'siguiente_cursor': siguiente_cursor,
+        'empleados': [{
+            'id': e.id,
+            'nombre_completo': e.nombre_completo,
+            'cedula': e.cedula,
+            'telefono_principal': e.telefono_principal,
+            'email_personal': e.email_personal,
+            'cargo_puesto': e.cargo_puesto,
+            'departamento_laboral': e.departamento_laboral,
+            'salario_base': float(e.salario_base) if e.salario_base else None,
+            'estado_empleado': e.estado_empleado
+        } for e in empleados]
+    }
+    if request.args.get('html'):
+        respuesta['html'] = render_template('componentes/filas_empleados.html', empleados=empleados)
+    return jsonify(respuesta)
 
 @app.route('/empleados/nuevo', methods=['GET', 'POST'])
 @login_required
@@ -1321,6 +2185,50 @@ def eliminar_empleado(id):
     flash('Empleado desactivado exitosamente', 'success')
     return redirect(url_for('empleados'))
 
+# ===== CARNETS CON QR FIRMADO =====
+MAX_CARNETS_HOJAS = int(os.environ.get('CARNETS_MAX_HOJAS', 2000))
+
+def datos_carnet(empleado):
+    """Lo que se imprime en el carnet (un dict simple: viaja a los procesos que dibujan)"""
+    return {
+        'contenido': firma_carnets.firmar(empleado.id),
+        'nombre': empleado.nombre_completo,
+        'cedula': empleado.cedula,
+        'cargo': empleado.cargo_puesto
+    }
+
+@app.route('/empleados/<int:id>/carnet')
+@login_required
+def carnet_empleado(id):
+    """PNG del carnet de un empleado"""
+    empleado = Empleado.query.get_or_404(id)
+    return send_file(io.BytesIO(dibujar_carnet(datos_carnet(empleado))), mimetype='image/png',
+                     as_attachment=request.args.get('descargar') == '1',
+                     download_name=f'carnet_{empleado.cedula}.png')
+
+@app.route('/empleados/carnets')
+@login_required
+def hojas_carnets():
+    """Hojas A4 con los carnets de los empleados filtrados (por defecto los activos), en PDF o PNG"""
+    argumentos = request.args.to_dict()
+    argumentos.setdefault('estado', 'Activo')
+    argumentos['orden'] = 'nombre'
+    query, filtros = consulta_empleados(argumentos)
+    empleados_carnet = query.order_by(Empleado.nombre_completo, Empleado.id).limit(MAX_CARNETS_HOJAS + 1).all()
+    if not empleados_carnet:
+        flash('No hay empleados para generar carnets con esos filtros', 'warning')
+        return redirect(url_for('empleados'))
+    if len(empleados_carnet) > MAX_CARNETS_HOJAS:
+        flash(f'Son más de {MAX_CARNETS_HOJAS} carnets: filtre por estado o nombre', 'warning')
+        return redirect(url_for('empleados'))
+
+    formato = 'png' if request.args.get('formato') == 'png' else 'pdf'
+    inicio = datetime.now()
+    archivo, mimetype, extension = generar_hojas([datos_carnet(e) for e in empleados_carnet], formato)
+    logger.info(f"🪪 {len(empleados_carnet)} carnets generados en {(datetime.now() - inicio).total_seconds():.1f}s ({formato})")
+    return send_file(archivo, mimetype=mimetype, as_attachment=True,
+                     download_name=f"carnets_{colombia_now().strftime('%Y%m%d')}.{extension}")
+
 # Gestión de Solicitudes de Empleados
 @app.route('/solicitudes')
 @login_required
@@ -1354,25 +2262,9 @@ def ver_solicitud(id):
     """Ver detalles de una solicitud"""
     solicitud = SolicitudEmpleado.query.get_or_404(id)
     
-    # Procesar adjuntos si existen
-    adjuntos = []
-    if solicitud.adjuntos_data:
-        try:
-            import json
-            adjuntos_json = json.loads(solicitud.adjuntos_data.decode())
-            adjuntos = [{'nombre': a['nombre']} for a in adjuntos_json]
-        except:
-            pass
-    
-    # Procesar documentos del admin si existen
-    documentos_admin = []
-    if solicitud.documentos_admin_data:
-        try:
-            import json
-            docs_json = json.loads(solicitud.documentos_admin_data.decode())
-            documentos_admin = [{'nombre': d['nombre']} for d in docs_json]
-        except:
-            pass
+    # Adjuntos del empleado y documentos del admin (sin cargar su contenido)
+    adjuntos = ArchivoSolicitud.listar(solicitud.id, 'empleado')
+    documentos_admin = ArchivoSolicitud.listar(solicitud.id, 'admin')
     
     return render_template('ver_solicitud.html', 
                          solicitud=solicitud,
@@ -1391,49 +2283,30 @@ def aprobar_solicitud(id):
     
     comentario = request.form.get('comentario', '').strip()
     
-    # Procesar documentos del admin si se subieron
-    documentos_admin_data = None
-    documentos_admin_nombres = []
-    if 'documentos_admin' in request.files:
-        archivos = request.files.getlist('documentos_admin')
-        archivos_data_list = []
-        for archivo in archivos:
-            if archivo and archivo.filename:
-                if not archivo.filename.lower().endswith(('.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx')):
-                    flash('Solo se permiten archivos PDF, imágenes o documentos Word', 'error')
-                    return redirect(url_for('ver_solicitud', id=id))
-                
-                archivo.seek(0, os.SEEK_END)
-                tamaño = archivo.tell()
-                archivo.seek(0)
-                if tamaño > 5 * 1024 * 1024:
-                    flash('Cada archivo debe ser menor a 5MB', 'error')
-                    return redirect(url_for('ver_solicitud', id=id))
-                
-                archivos_data_list.append({
-                    'nombre': archivo.filename,
-                    'data': archivo.read()
-                })
-                documentos_admin_nombres.append(archivo.filename)
-        
-        if archivos_data_list:
-            import json
-            documentos_admin_data = json.dumps([{'nombre': a['nombre'], 'data': a['data'].hex()} for a in archivos_data_list]).encode()
+    # Documentos del admin: se copian por bloques a temporales (ver adjuntos.py)
+    try:
+        documentos = procesar_archivos(request.files.getlist('documentos_admin'))
+    except ErrorAdjunto as e:
+        flash(str(e), 'error')
+        return redirect(url_for('ver_solicitud', id=id))
     
     solicitud.estado = 'APROBADA'
     solicitud.aprobado_por_id = current_user.id
     solicitud.fecha_aprobacion = colombia_now()
     solicitud.comentario_admin = comentario or None
-    if documentos_admin_data:
-        solicitud.documentos_admin_data = documentos_admin_data
-        solicitud.documentos_admin_nombres = '|'.join(documentos_admin_nombres)
+    if documentos:
+        solicitud.documentos_admin_nombres = '|'.join(d.nombre for d in documentos)
     
     try:
+        ArchivoSolicitud.guardar(solicitud.id, 'admin', documentos)
         db.session.commit()
         flash('Solicitud aprobada exitosamente', 'success')
     except Exception as e:
         db.session.rollback()
+        logger.error(f"❌ Error al aprobar la solicitud {id}: {str(e)}")
         flash('Error al aprobar la solicitud', 'error')
+    finally:
+        cerrar_archivos(documentos)
     
     return redirect(url_for('ver_solicitud', id=id))
 
@@ -1471,61 +2344,21 @@ def rechazar_solicitud(id):
 @login_required
 def descargar_adjunto_solicitud(id, adjunto_idx):
     """Descargar un archivo adjunto de una solicitud"""
-    solicitud = SolicitudEmpleado.query.get_or_404(id)
-    
-    if not solicitud.adjuntos_data:
-        flash('No hay archivos adjuntos', 'error')
-        return redirect(url_for('ver_solicitud', id=id))
-    
-    try:
-        import json
-        adjuntos_json = json.loads(solicitud.adjuntos_data.decode())
-        if adjunto_idx >= len(adjuntos_json):
-            flash('Archivo no encontrado', 'error')
-            return redirect(url_for('ver_solicitud', id=id))
-        
-        adjunto = adjuntos_json[adjunto_idx]
-        archivo_data = bytes.fromhex(adjunto['data'])
-        
-        return send_file(
-            io.BytesIO(archivo_data),
-            mimetype='application/octet-stream',
-            as_attachment=True,
-            download_name=adjunto['nombre']
-        )
-    except Exception as e:
-        flash('Error al descargar el archivo', 'error')
+    respuesta = ArchivoSolicitud.respuesta_descarga(id, 'empleado', adjunto_idx)
+    if respuesta is None:
+        flash('Archivo no encontrado', 'error')
         return redirect(url_for('ver_solicitud', id=id))
+    return respuesta
 
 @app.route('/solicitudes/<int:id>/documento-admin/<int:doc_idx>')
 @login_required
 def descargar_documento_admin(id, doc_idx):
     """Descargar un documento del admin"""
-    solicitud = SolicitudEmpleado.query.get_or_404(id)
-    
-    if not solicitud.documentos_admin_data:
-        flash('No hay documentos', 'error')
-        return redirect(url_for('ver_solicitud', id=id))
-    
-    try:
-        import json
-        docs_json = json.loads(solicitud.documentos_admin_data.decode())
-        if doc_idx >= len(docs_json):
-            flash('Documento no encontrado', 'error')
-            return redirect(url_for('ver_solicitud', id=id))
-        
-        doc = docs_json[doc_idx]
-        archivo_data = bytes.fromhex(doc['data'])
-        
-        return send_file(
-            io.BytesIO(archivo_data),
-            mimetype='application/octet-stream',
-            as_attachment=True,
-            download_name=doc['nombre']
-        )
-    except Exception as e:
-        flash('Error al descargar el documento', 'error')
+    respuesta = ArchivoSolicitud.respuesta_descarga(id, 'admin', doc_idx)
+    if respuesta is None:
+        flash('Documento no encontrado', 'error')
         return redirect(url_for('ver_solicitud', id=id))
+    return respuesta
 
 # Gestión de Contratos - Rutas movidas a la sección completa más abajo
 
@@ -1537,7 +2370,7 @@ def asistencia():
     fecha_obj = datetime.strptime(fecha, '%Y-%m-%d').date()
     
     asistencias = Asistencia.query.filter_by(fecha=fecha_obj).all()
-    empleados = Empleado.query.filter_by(estado_empleado='Activo').all()
+    empleados = obtener_empleados_activos()
     
     # Generar QR para el día actual
     qr_buffer, token, url_qr = generar_qr_asistencia()
@@ -1602,11 +2435,10 @@ def asistencia_publica(token):
             nombre_normalizado = unicodedata.normalize('NFD', nombre).encode('ascii', 'ignore').decode('ascii').lower()
             
             # Buscar empleados que coincidan con el nombre normalizado
-            empleados = Empleado.query.filter_by(estado_empleado='Activo').all()
-            for emp in empleados:
-                nombre_emp_normalizado = unicodedata.normalize('NFD', emp.nombre_completo).encode('ascii', 'ignore').decode('ascii').lower()
+            for emp in obtener_empleados_activos():
+                nombre_emp_normalizado = unicodedata.normalize('NFD', emp['nombre_completo']).encode('ascii', 'ignore').decode('ascii').lower()
                 if nombre_normalizado in nombre_emp_normalizado or nombre_emp_normalizado in nombre_normalizado:
-                    empleado = emp
+                    empleado = db.session.get(Empleado, emp['id'])
                     break
         
         if not empleado:
@@ -1678,7 +2510,7 @@ def asistencia_publica(token):
                 return redirect(url_for('asistencia_publica', token=token))
             
             # Registrar salida
-            asistencia_existente.hora_salida = hora_actual
+            asistencia_existente.registrar_salida(hora_actual)
             asistencia_existente.token_diario = token
             
             try:
@@ -1702,12 +2534,215 @@ def asistencia_publica(token):
     
     return render_template('asistencia_publica.html', token=token)
 
+# ===== KIOSCO DE ASISTENCIA SIN CONEXIÓN =====
+# La página del kiosco guarda las marcaciones en el dispositivo y las envía por lotes;
+# el id que genera el dispositivo hace que reenviar un lote no duplique nada.
+
+KIOSCO_MAX_REGISTROS_LOTE = int(os.environ.get('KIOSCO_MAX_REGISTROS_LOTE', 500))
+KIOSCO_DIAS_MAXIMOS = int(os.environ.get('KIOSCO_DIAS_MAXIMOS', 3))  # Marcaciones más antiguas se rechazan
+TOLERANCIA_RELOJ_KIOSCO = timedelta(minutes=5)  # Adelanto máximo del reloj del dispositivo
+
+def leer_marcacion_kiosco(dato):
+    """(id_cliente, documento, empleado_id, tipo, marcado_en) de un registro del lote. ValueError si no es válido.
+
+    El registro trae el documento digitado o el contenido del QR del carnet; con carnet
+    documento es None y el empleado se identifica por su id.
+    """
+    if not isinstance(dato, dict):
+        raise ValueError('Registro con formato inválido')
+    id_cliente = str(dato.get('id') or '').strip()
+    documento = str(dato.get('documento') or '').strip() or None
+    tipo = str(dato.get('tipo') or '').strip().lower()
+    empleado_id = None
+    if not id_cliente or len(id_cliente) > 64:
+        raise ValueError('Id de registro inválido')
+    if dato.get('carnet'):
+        empleado_id = firma_carnets.verificar(str(dato['carnet']))
+        if empleado_id is None:
+            raise ValueError('Carnet no reconocido')
+        documento = None
+    elif not documento or len(documento) > 20:
+        raise ValueError('Documento inválido')
+    if tipo not in ('entrada', 'salida'):
+        raise ValueError('Tipo de registro inválido')
+    try:
+        # Milisegundos desde epoch, como Date.now() en el navegador
+        marcado_en = datetime.fromtimestamp(int(dato.get('marcado_en')) / 1000, COLOMBIA_TZ).replace(tzinfo=None)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError('Hora de marcación inválida')
+    ahora = colombia_now().replace(tzinfo=None)
+    if marcado_en > ahora + TOLERANCIA_RELOJ_KIOSCO:
+        raise ValueError('La hora del dispositivo está adelantada')
+    if marcado_en < ahora - timedelta(days=KIOSCO_DIAS_MAXIMOS):
+        raise ValueError(f'Marcación de hace más de {KIOSCO_DIAS_MAXIMOS} días')
+    return id_cliente, documento, empleado_id, tipo, marcado_en
+
+def aplicar_marcacion_kiosco(empleado, tipo, marcado_en, asistencias, token):
+    """Aplica una marcación sobre las asistencias precargadas {(empleado_id, fecha): Asistencia}. Devuelve (estado, mensaje)."""
+    if not empleado:
+        return 'rechazado', 'No se encontró un empleado con ese documento'
+    if empleado.estado_empleado != 'Activo':
+        return 'rechazado', f'{empleado.nombre_completo} no está activo en el sistema'
+    
+    fecha, hora = marcado_en.date(), marcado_en.time().replace(microsecond=0)
+    asistencia = asistencias.get((empleado.id, fecha))
+    
+    if tipo == 'entrada':
+        if asistencia:
+            return 'ya_registrado', f'{empleado.nombre_completo} ya tenía entrada a las {asistencia.hora_entrada.strftime("%H:%M")}'
+        asistencia = Asistencia(empleado_id=empleado.id, fecha=fecha, hora_entrada=hora, token_diario=token)
+        db.session.add(asistencia)
+        asistencias[(empleado.id, fecha)] = asistencia
+        return 'registrado', f'Entrada de {empleado.nombre_completo} a las {hora.strftime("%H:%M")}'
+    
+    if not asistencia:
+        return 'sin_entrada', f'{empleado.nombre_completo} no tiene entrada el {fecha.strftime("%d/%m/%Y")}'
+    if asistencia.hora_salida:
+        return 'ya_registrado', f'{empleado.nombre_completo} ya tenía salida a las {asistencia.hora_salida.strftime("%H:%M")}'
+    if asistencia.hora_entrada and hora <= asistencia.hora_entrada:
+        return 'rechazado', 'La salida es anterior a la entrada'
+    asistencia.registrar_salida(hora)
+    asistencia.token_diario = token
+    return 'registrado', f'Salida de {empleado.nombre_completo} a las {hora.strftime("%H:%M")}'
+
+def _aplicar_lote_kiosco(validos, token):
+    """{id_cliente: resultado} aplicando en una transacción las marcaciones válidas del lote"""
+    resultados = {}
+    
+    # Reenvíos: se devuelve el resultado guardado la primera vez, sin volver a aplicar
+    ids = list({v[0] for v in validos})
+    for previo in RegistroKiosco.query.filter(RegistroKiosco.id_cliente.in_(ids)):
+        resultados[previo.id_cliente] = {'id': previo.id_cliente, 'estado': previo.estado,
+                                         'mensaje': previo.mensaje, 'reenvio': True}
+    nuevos = [v for v in validos if v[0] not in resultados]
+    if not nuevos:
+        return resultados
+    
+    # Empleados (por cédula o por id del carnet) y asistencias del lote en dos consultas
+    cedulas = {v[1] for v in nuevos if v[1]}
+    ids_carnet = {v[2] for v in nuevos if v[2]}
+    empleados_lote = Empleado.query.filter(db.or_(Empleado.cedula.in_(cedulas), Empleado.id.in_(ids_carnet))).all()
+    por_cedula = {e.cedula: e for e in empleados_lote}
+    por_id = {e.id: e for e in empleados_lote}
+    asistencias = {}
+    if empleados_lote:
+        consulta = Asistencia.query.filter(
+            Asistencia.empleado_id.in_(list(por_id)),
+            Asistencia.fecha.in_({v[4].date() for v in nuevos})
+        )
+        asistencias = {(a.empleado_id, a.fecha): a for a in consulta}
+    
+    # En orden de marcación, para que la entrada se aplique antes que la salida del mismo día
+    for id_cliente, documento, empleado_id, tipo, marcado_en in sorted(nuevos, key=lambda v: v[4]):
+        if id_cliente in resultados:
+            continue  # Id repetido dentro del mismo lote
+        empleado = por_id.get(empleado_id) if empleado_id else por_cedula.get(documento)
+        estado, mensaje = aplicar_marcacion_kiosco(empleado, tipo, marcado_en, asistencias, token)
+        db.session.add(RegistroKiosco(
+            id_cliente=id_cliente,
+            documento=documento or (empleado.cedula if empleado else ''),
+            empleado_id=empleado.id if empleado else None,
+            tipo=tipo,
+            marcado_en=marcado_en,
+            estado=estado,
+            mensaje=mensaje
+        ))
+        resultados[id_cliente] = {'id': id_cliente, 'estado': estado, 'mensaje': mensaje, 'tipo': tipo}
+    return resultados
+
+def sincronizar_registros_kiosco(registros, token):
+    """Aplica un lote del kiosco. Devuelve un resultado por registro, en el mismo orden."""
+    from sqlalchemy.exc import IntegrityError
+    
+    rechazados = {}
+    validos = []
+    for posicion, dato in enumerate(registros):
+        try:
+            validos.append(leer_marcacion_kiosco(dato))
+        except ValueError as e:
+            id_cliente = str(dato.get('id') or '') if isinstance(dato, dict) else ''
+            rechazados[posicion] = {'id': id_cliente, 'estado': 'rechazado', 'mensaje': str(e)}
+    
+    resultados = {}
+    if validos:
+        # Un reintento: otro envío del mismo lote o una marcación en línea pudo ganar la carrera
+        for intento in range(2):
+            try:
+                resultados = _aplicar_lote_kiosco(validos, token)
+                db.session.commit()
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if intento:
+                    raise
+    
+    salida = []
+    for posicion, dato in enumerate(registros):
+        if posicion in rechazados:
+            salida.append(rechazados[posicion])
+        else:
+            salida.append(resultados[str(dato.get('id')).strip()])
+    return salida
+
+@app.route('/asistencia-publica/<token>/kiosco')
+def kiosco_asistencia(token):
+    """Kiosco de asistencia que sigue funcionando sin conexión"""
+    if not validar_token_diario(token):
+        flash('El código QR ha expirado. Solicite un nuevo código al administrador.', 'error')
+        return render_template('asistencia_publica.html', token=token, error=True)
+    return render_template('kiosco_asistencia.html', token=token,
+                         max_registros_lote=KIOSCO_MAX_REGISTROS_LOTE)
+
+@app.route('/asistencia-publica/<token>/kiosco-sw.js')
+def kiosco_service_worker(token):
+    """Service worker del kiosco (su alcance es /asistencia-publica/<token>/)"""
+    if not validar_token_diario(token):
+        return '', 404
+    respuesta = make_response(render_template('kiosco_sw.js', token=token))
+    respuesta.headers['Content-Type'] = 'application/javascript; charset=utf-8'
+    # El navegador debe revisar siempre si hay una versión nueva del service worker
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+@app.route('/asistencia-publica/<token>/lote', methods=['POST'])
+def sincronizar_kiosco(token):
+    """Recibe un lote de marcaciones del kiosco y devuelve el resultado de cada una"""
+    if not validar_token_diario(token):
+        return jsonify({'success': False, 'message': 'Token inválido'}), 403
+    
+    datos = request.get_json(silent=True) or {}
+    registros = datos.get('registros')
+    if not isinstance(registros, list):
+        return jsonify({'success': False, 'message': 'Se esperaba una lista de registros'}), 400
+    if len(registros) > KIOSCO_MAX_REGISTROS_LOTE:
+        return jsonify({'success': False, 'message': f'Máximo {KIOSCO_MAX_REGISTROS_LOTE} registros por lote'}), 413
+    
+    try:
+        resultados = sincronizar_registros_kiosco(registros, token)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Error sincronizando lote del kiosco: {str(e)}")
+        return jsonify({'success': False, 'message': 'Error al guardar el lote. Se reintentará.'}), 500
+    
+    nuevos = [r for r in resultados if r['estado'] == 'registrado' and not r.get('reenvio')]
+    if nuevos:
+        entradas = sum(1 for r in nuevos if r['tipo'] == 'entrada')
+        logger.info(f"📥 Kiosco: {len(nuevos)} marcaciones registradas de {len(registros)} recibidas")
+        notificacion_manager.agregar_notificacion(
+            titulo='Kiosco sincronizado',
+            mensaje=f'{len(nuevos)} marcaciones registradas ({entradas} entradas, {len(nuevos) - entradas} salidas)',
+            tipo='success',
+            tipo_sonido='entrada',
+            icono='fas fa-sync'
+        )
+    
+    return jsonify({'success': True, 'resultados': resultados})
+
 # Ruta pública para visitantes (sin login requerido)
 @app.route('/visitantes-publico/<token>', methods=['GET', 'POST'])
 def visitantes_publico(token):
     """Página pública para que los visitantes se registren"""
     modo_activo = 'nuevo'
-    visitantes_recurrentes = obtener_visitantes_recurrentes()
 
     # Validar que el token sea del día actual
     if not validar_token_diario_visitantes(token):
@@ -1716,7 +2751,6 @@ def visitantes_publico(token):
             'visitantes_publico.html',
             token=token,
             error=True,
-            visitantes_recurrentes=visitantes_recurrentes,
             modo_activo=modo_activo
         )
     
@@ -1732,7 +2766,10 @@ def visitantes_publico(token):
                 flash('Seleccione su nombre y escriba su documento para continuar.', 'error')
                 return redirect(url_for('visitantes_publico', token=token))
 
-            visitante_referencia = Visitante.query.get(int(visitante_recurrente_id))
+            try:
+                visitante_referencia = db.session.get(PerfilVisitante, int(visitante_recurrente_id))
+            except ValueError:
+                visitante_referencia = None
 
             if not visitante_referencia:
                 flash('No encontramos el visitante seleccionado. Intente nuevamente.', 'error')
@@ -1742,12 +2779,7 @@ def visitantes_publico(token):
                 flash('El documento ingresado no coincide con el registrado anteriormente.', 'error')
                 return redirect(url_for('visitantes_publico', token=token))
 
-            fecha_hoy = date.today()
-            visitante_existente = Visitante.query.filter(
-                Visitante.documento == documento_verificacion,
-                db.func.date(Visitante.fecha_entrada) == fecha_hoy,
-                Visitante.estado_visita == 'En visita'
-            ).first()
+            visitante_existente = Visitante.visita_de_hoy(documento_verificacion, solo_en_visita=True)
 
             if visitante_existente:
                 flash('Ya existe un registro activo para este documento el día de hoy.', 'warning')
@@ -1772,6 +2804,7 @@ def visitantes_publico(token):
 
             try:
                 db.session.add(visitante)
+                PerfilVisitante.registrar_visita(visitante)
                 db.session.commit()
 
                 notificar_visitante_nuevo(
@@ -1820,11 +2853,7 @@ def visitantes_publico(token):
             return redirect(url_for('visitantes_publico', token=token))
         
         # Verificar si ya existe un visitante con el mismo documento hoy
-        fecha_hoy = date.today()
-        visitante_existente = Visitante.query.filter(
-            Visitante.documento == documento,
-            db.func.date(Visitante.fecha_entrada) == fecha_hoy
-        ).first()
+        visitante_existente = Visitante.visita_de_hoy(documento)
         
         if visitante_existente:
             flash(f'Ya existe un registro de visitante con documento {documento} para hoy', 'warning')
@@ -1850,6 +2879,7 @@ def visitantes_publico(token):
         
         try:
             db.session.add(visitante)
+            PerfilVisitante.registrar_visita(visitante)
             db.session.commit()
             
             # Enviar notificación
@@ -1869,10 +2899,35 @@ def visitantes_publico(token):
     return render_template(
         'visitantes_publico.html',
         token=token,
-        visitantes_recurrentes=visitantes_recurrentes,
         modo_activo=modo_activo
     )
 
+@app.route('/visitantes-publico/<token>/buscar')
+def buscar_visitantes_publico(token):
+    """Sugerencias para la entrada rápida: pocos resultados por prefijo de nombre o documento"""
+    if not validar_token_diario_visitantes(token):
+        return jsonify({'success': False, 'message': 'Código QR expirado'}), 403
+
+    perfiles = PerfilVisitante.buscar(request.args.get('q', ''))
+    # No se devuelve el documento: se usa para verificar la identidad
+    return jsonify({
+        'success': True,
+        'resultados': [{'id': p.id, 'nombre': f"{p.nombre} {p.apellido}"} for p in perfiles]
+    })
+
+@app.route('/solicitudes-publico/<token>/fecha-reintegro')
+def fecha_reintegro_publico(token):
+    """Fecha de reintegro de unas vacaciones: N días hábiles (sin domingos ni festivos) después del inicio"""
+    if not validar_token_diario(token):
+        return jsonify({'success': False, 'message': 'Código QR no válido'}), 403
+    
+    try:
+        fecha_reintegro = calcular_fecha_reintegro(request.args.get('fecha_inicio', ''), request.args.get('dias', ''))
+    except (ValueError, OverflowError):
+        return jsonify({'success': False, 'message': 'Fecha o cantidad de días inválida'}), 400
+    
+    return jsonify({'success': True, 'fecha_reintegro': fecha_reintegro.strftime('%Y-%m-%d')})
+
 # Ruta pública para solicitudes de empleados (sin login requerido)
 @app.route('/solicitudes-publico/<token>', methods=['GET', 'POST'])
 def solicitudes_publico(token):
@@ -1950,6 +3005,13 @@ def solicitudes_publico(token):
             fecha_inicio = request.form.get('fecha_inicio_vacaciones', '').strip()
             cantidad_dias = request.form.get('cantidad_dias_vacaciones', '').strip()
             fecha_reintegro = request.form.get('fecha_reintegro', '').strip()
+            # Recalcular en el servidor con el calendario completo de festivos
+            try:
+                fecha_reintegro = calcular_fecha_reintegro(fecha_inicio, cantidad_dias).strftime('%Y-%m-%d')
+            except (ValueError, OverflowError):
+                if fecha_inicio and cantidad_dias:
+                    flash(f'La fecha de inicio o la cantidad de días no es válida (máximo {MAX_DIAS_VACACIONES} días)', 'error')
+                    return redirect(url_for('solicitudes_publico', token=token))
             datos_adicionales = {
                 'cantidad_dias': cantidad_dias,
                 'fecha_reintegro': fecha_reintegro
@@ -2008,37 +3070,13 @@ def solicitudes_publico(token):
             flash('Formato de fecha inválido', 'error')
             return redirect(url_for('solicitudes_publico', token=token))
         
-        # Procesar archivos adjuntos
-        adjuntos_data = None
-        adjuntos_nombres = []
-        if 'adjuntos' in request.files:
-            archivos = request.files.getlist('adjuntos')
-            archivos_data_list = []
-            for archivo in archivos:
-                if archivo and archivo.filename:
-                    # Validar tipo de archivo
-                    if not archivo.filename.lower().endswith(('.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx')):
-                        flash('Solo se permiten archivos PDF, imágenes o documentos Word', 'error')
-                        return redirect(url_for('solicitudes_publico', token=token))
-                    
-                    # Validar tamaño (máximo 5MB por archivo)
-                    archivo.seek(0, os.SEEK_END)
-                    tamaño = archivo.tell()
-                    archivo.seek(0)
-                    if tamaño > 5 * 1024 * 1024:  # 5MB
-                        flash('Cada archivo debe ser menor a 5MB', 'error')
-                        return redirect(url_for('solicitudes_publico', token=token))
-                    
-                    archivos_data_list.append({
-                        'nombre': archivo.filename,
-                        'data': archivo.read()
-                    })
-                    adjuntos_nombres.append(archivo.filename)
-            
-            if archivos_data_list:
-                import json
-                adjuntos_data = json.dumps([{'nombre': a['nombre'], 'data': a['data'].hex()} for a in archivos_data_list]).encode()
-        
+        # Procesar archivos adjuntos: tipo, tamaño (máximo 5MB) y copia por bloques a temporales
+        try:
+            adjuntos = procesar_archivos(request.files.getlist('adjuntos'))
+        except ErrorAdjunto as e:
+            flash(str(e), 'error')
+            return redirect(url_for('solicitudes_publico', token=token))
+        
         # Serializar datos adicionales como JSON
         import json
         datos_adicionales_json = json.dumps(datos_adicionales) if datos_adicionales else None
@@ -2053,16 +3091,16 @@ def solicitudes_publico(token):
             observaciones=observaciones or None,
             datos_adicionales=datos_adicionales_json,
             estado='PENDIENTE',
-            adjuntos_data=adjuntos_data,
-            adjuntos_nombres='|'.join(adjuntos_nombres) if adjuntos_nombres else None
+            adjuntos_nombres='|'.join(a.nombre for a in adjuntos) if adjuntos else None
         )
         
         try:
             db.session.add(solicitud)
+            db.session.flush()
+            ArchivoSolicitud.guardar(solicitud.id, 'empleado', adjuntos)
             db.session.commit()
             
             # Notificar al admin
-            from notificaciones import notificacion_manager
             notificacion_manager.agregar_notificacion(
                 titulo="Nueva Solicitud de Empleado",
                 mensaje=f"{empleado.nombre_completo} ha enviado una solicitud de {tipo_solicitud.replace('_', ' ').title()}",
@@ -2078,9 +3116,11 @@ def solicitudes_publico(token):
             return redirect(url_for('solicitudes_publico', token=token))
         except Exception as e:
             db.session.rollback()
-            print(f"Error al crear solicitud: {e}")
+            logger.error(f"Error al crear solicitud: {e}")
             flash('Error al enviar la solicitud. Intente nuevamente.', 'error')
             return redirect(url_for('solicitudes_publico', token=token))
+        finally:
+            cerrar_archivos(adjuntos)
     
     # Limpiar flag de formulario enviado al cargar la página
     session.pop('form_submitted', None)
@@ -2151,12 +3191,7 @@ def registrar_asistencia():
         
         # Registrar salida
         hora_salida = colombia_now().time()
-        asistencia_existente.hora_salida = hora_salida
-        
-        # Calcular horas trabajadas
-        entrada = datetime.combine(fecha, asistencia_existente.hora_entrada)
-        salida = datetime.combine(fecha, hora_salida)
-        asistencia_existente.horas_trabajadas = (salida - entrada).total_seconds() / 3600
+        asistencia_existente.registrar_salida(hora_salida)
         
         # Actualizar observaciones si se proporcionaron
         if observaciones:
@@ -2248,17 +3283,101 @@ def editar_asistencia(id):
 # Gestión de Visitantes
 @app.route('/visitantes')
 @login_required
+@cache_http.pagina_condicional('visitantes', 'solicitudes')
 def visitantes():
-    visitantes = Visitante.query.order_by(Visitante.created_at.desc()).all()
+    query, filtros, resumen = consulta_visitantes(request.args)
+    visitantes, siguiente_cursor = paginar_consulta_visitantes(query, filtros, request.args.get('cursor'))
     
     # Generar QR para visitantes
     qr_buffer, token, url_qr = generar_qr_visitantes()
     
     return render_template('visitantes.html', 
                          visitantes=visitantes,
+                         filtros=filtros,
+                         resumen=resumen,
+                         siguiente_cursor=siguiente_cursor,
                          token_diario=token,
                          url_qr=url_qr)
 
+def consulta_visitantes(args, con_resumen=True):
+    """Consulta de visitantes según los filtros de la URL.
+
+    vista=activos muestra solo las visitas en curso (índice parcial, sin ventana de fechas);
+    si no, se limita a la ventana fecha_desde/fecha_hasta (últimos 30 días por defecto).
+    Devuelve (query, filtros, resumen con conteos por estado en la ventana).
+    """
+    hoy = date.today()
+    filtros = {
+        'vista': 'activos' if args.get('vista') == 'activos' else 'todos',
+        'estado': args.get('estado', ''),
+        'q': args.get('q', '').strip(),
+        'orden': args.get('orden') if args.get('orden') in ('recientes', 'nombre') else 'recientes',
+        'fecha_desde': leer_fecha_param(args.get('fecha_desde')) or hoy - timedelta(days=30),
+        'fecha_hasta': leer_fecha_param(args.get('fecha_hasta')) or hoy
+    }
+
+    if filtros['vista'] == 'activos':
+        query = Visitante.query.filter(Visitante.estado_visita == 'En visita')
+    else:
+        query = Visitante.query.filter(
+            Visitante.fecha_entrada >= datetime.combine(filtros['fecha_desde'], datetime.min.time()),
+            Visitante.fecha_entrada < datetime.combine(filtros['fecha_hasta'] + timedelta(days=1), datetime.min.time())
+        )
+
+    resumen = None
+    if con_resumen:
+        conteos = dict(query.with_entities(Visitante.estado_visita, db.func.count(Visitante.id))
+                       .group_by(Visitante.estado_visita).all())
+        resumen = {
+            # Visitas en curso sin importar la fecha (índice parcial)
+            'en_visita': Visitante.query.filter(Visitante.estado_visita == 'En visita').count(),
+            'pendientes': conteos.get('Pendiente', 0),
+            'finalizadas': conteos.get('Finalizada', 0),
+            'total': sum(conteos.values())
+        }
+
+    if filtros['estado'] and filtros['vista'] != 'activos':
+        query = query.filter(Visitante.estado_visita == filtros['estado'])
+    if filtros['q']:
+        patron = patron_prefijo(filtros['q'].lower())
+        query = query.filter(db.or_(
+            db.func.lower(Visitante.nombre).like(patron, escape='\\'),
+            db.func.lower(Visitante.apellido).like(patron, escape='\\'),
+            Visitante.documento.like(patron, escape='\\')
+        ))
+    return query, filtros, resumen
+
+def paginar_consulta_visitantes(query, filtros, cursor):
+    if filtros['orden'] == 'nombre':
+        return paginar_keyset(query, Visitante.id, Visitante.nombre, cursor,
+                              TAMANO_PAGINA_LISTADOS, descendente=False)
+    return paginar_keyset(query, Visitante.id, cursor=cursor, limite=TAMANO_PAGINA_LISTADOS)
+
+@app.route('/api/visitantes')
+@login_required
+def api_visitantes():
+    """Página de visitantes en JSON (con html=1 incluye las filas de la tabla ya renderizadas)"""
+    query, filtros, _ = consulta_visitantes(request.args, con_resumen=False)
+    visitantes, siguiente_cursor = paginar_consulta_visitantes(query, filtros, request.args.get('cursor'))
+    respuesta = {
+        'success': True,
+        'siguiente_cursor': siguiente_cursor,
+        'visitantes': [{
+            'id': v.id,
+            'nombre': v.nombre,
+            'apellido': v.apellido,
+            'documento': v.documento,
+            'empresa': v.empresa,
+            'motivo_visita': v.motivo_visita,
+            'fecha_entrada': v.fecha_entrada.isoformat() if v.fecha_entrada else None,
+            'fecha_salida': v.fecha_salida.isoformat() if v.fecha_salida else None,
+            'estado_visita': v.estado_visita
+        } for v in visitantes]
+    }
+    if request.args.get('html'):
+        respuesta['html'] = render_template('componentes/filas_visitantes.html', visitantes=visitantes)
+    return jsonify(respuesta)
+
 @app.route('/visitantes/detalles/<int:id>')
 @login_required
 def detalles_visitante(id):
@@ -2298,7 +3417,7 @@ def nuevo_contrato():
         flash('Contrato creado exitosamente', 'success')
         return redirect(url_for('contratos'))
     
-    empleados = Empleado.query.filter_by(estado_empleado='Activo').all()
+    empleados = obtener_empleados_activos()
     return render_template('nuevo_contrato.html', empleados=empleados)
 
 @app.route('/contratos/editar/<int:id>', methods=['GET', 'POST'])
@@ -2319,7 +3438,7 @@ def editar_contrato(id):
         flash('Contrato actualizado exitosamente', 'success')
         return redirect(url_for('contratos'))
     
-    empleados = Empleado.query.filter_by(estado_empleado='Activo').all()
+    empleados = obtener_empleados_activos()
     return render_template('editar_contrato.html', contrato=contrato, empleados=empleados)
 
 @app.route('/contratos/desactivar/<int:id>')
@@ -2392,29 +3511,10 @@ def generar_contrato(id):
 def contratos_generados():
     """Lista de contratos generados"""
     try:
-        # Intentar crear la tabla si no existe
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text("""
-                    CREATE TABLE IF NOT EXISTS contrato_generado (
-                        id SERIAL PRIMARY KEY,
-                        empleado_id INTEGER NOT NULL REFERENCES empleado(id),
-                        contrato_id INTEGER NOT NULL REFERENCES contrato(id),
-                        nombre_archivo VARCHAR(255) NOT NULL,
-                        ruta_archivo VARCHAR(500) NOT NULL,
-                        fecha_generacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        activo BOOLEAN DEFAULT TRUE
-                    );
-                """))
-                connection.commit()
-            print("✅ Tabla contrato_generado creada/verificada")
-        except Exception as create_error:
-            print(f"⚠️ No se pudo crear la tabla: {create_error}")
-        
         contratos_generados = ContratoGenerado.query.join(Empleado).join(Contrato).order_by(ContratoGenerado.fecha_generacion.desc()).all()
         return render_template('contratos_generados.html', contratos_generados=contratos_generados)
     except Exception as e:
-        print(f"Error al cargar contratos generados: {str(e)}")
+        logger.error(f"Error al cargar contratos generados: {str(e)}")
         flash('Error al cargar contratos generados. La tabla puede no existir aún.', 'error')
         return render_template('contratos_generados.html', contratos_generados=[])
 
@@ -2452,25 +3552,6 @@ def descargar_contrato(id):
 def regenerar_contrato(id):
     """Regenerar contrato (eliminar el anterior y crear uno nuevo)"""
     try:
-        # Intentar crear la tabla si no existe
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text("""
-                    CREATE TABLE IF NOT EXISTS contrato_generado (
-                        id SERIAL PRIMARY KEY,
-                        empleado_id INTEGER NOT NULL REFERENCES empleado(id),
-                        contrato_id INTEGER NOT NULL REFERENCES contrato(id),
-                        nombre_archivo VARCHAR(255) NOT NULL,
-                        ruta_archivo VARCHAR(500) NOT NULL,
-                        fecha_generacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        activo BOOLEAN DEFAULT TRUE
-                    );
-                """))
-                connection.commit()
-            print("✅ Tabla contrato_generado creada/verificada en regenerar")
-        except Exception as create_error:
-            print(f"⚠️ No se pudo crear la tabla en regenerar: {create_error}")
-        
         # Obtener el contrato generado actual
         contrato_generado = ContratoGenerado.query.get_or_404(id)
         contrato_id = contrato_generado.contrato_id
@@ -2479,12 +3560,12 @@ def regenerar_contrato(id):
         # Eliminar el archivo anterior si existe
         if os.path.exists(contrato_generado.ruta_archivo):
             os.remove(contrato_generado.ruta_archivo)
-            print(f"✅ Archivo anterior eliminado: {contrato_generado.ruta_archivo}")
+            logger.info(f"✅ Archivo anterior eliminado: {contrato_generado.ruta_archivo}")
         
         # Eliminar el registro de la base de datos
         db.session.delete(contrato_generado)
         db.session.commit()
-        print(f"✅ Registro anterior eliminado de la base de datos")
+        logger.info(f"✅ Registro anterior eliminado de la base de datos")
         
         # Generar nuevo contrato
         nuevo_contrato = generar_contrato_excel(contrato_id)
@@ -2493,7 +3574,7 @@ def regenerar_contrato(id):
         return redirect(url_for('contratos_generados'))
         
     except Exception as e:
-        print(f"Error al regenerar contrato: {str(e)}")
+        logger.error(f"Error al regenerar contrato: {str(e)}")
         flash(f'Error al regenerar el contrato: {str(e)}', 'error')
         return redirect(url_for('contratos_generados'))
 
@@ -2504,38 +3585,26 @@ def vista_previa_simple(id):
     try:
         contrato_generado = ContratoGenerado.query.get_or_404(id)
         
-        # Verificar si tenemos datos binarios en la base de datos
-        if contrato_generado.archivo_data:
-            # Leer desde datos binarios
-            from io import BytesIO
-            from openpyxl import load_workbook
-            workbook = load_workbook(BytesIO(contrato_generado.archivo_data))
-        else:
-            # Fallback: intentar desde archivo (para contratos antiguos)
-            if not os.path.exists(contrato_generado.ruta_archivo):
-                return f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Error - Vista Previa</title>
-                    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-                </head>
-                <body>
-                    <div class="container mt-5">
-                        <div class="alert alert-danger">
-                            <h4>Error</h4>
-                            <p>El archivo del contrato no existe</p>
-                        </div>
+        # Filas del Excel ya renderizadas (se generan una sola vez por archivo)
+        tabla_html = contrato_generado.obtener_vista_previa('simple')
+        if tabla_html is None:
+            return """
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>Error - Vista Previa</title>
+                <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+            </head>
+            <body>
+                <div class="container mt-5">
+                    <div class="alert alert-danger">
+                        <h4>Error</h4>
+                        <p>El archivo del contrato no existe</p>
                     </div>
-                </body>
-                </html>
-                """, 404
-            
-            # Leer el archivo Excel
-            from openpyxl import load_workbook
-            workbook = load_workbook(contrato_generado.ruta_archivo)
-        
-        worksheet = workbook.active
+                </div>
+            </body>
+            </html>
+            """, 404
         
         # Crear página HTML simple y limpia
         pagina_completa = f"""
@@ -2631,7 +3700,7 @@ def vista_previa_simple(id):
                         <button onclick="window.print()" class="btn btn-info me-2">
                             <i class="fas fa-print"></i> Imprimir
                         </button>
-                        <a href="{{ url_for('descargar_contrato', id=contrato_generado.id) }}" class="btn btn-success me-2">
+                        <a href="{url_for('descargar_contrato', id=contrato_generado.id)}" class="btn btn-success me-2">
                             <i class="fas fa-download"></i> Descargar Excel
                         </a>
                         <button onclick="window.close()" class="btn btn-secondary">
@@ -2641,73 +3710,10 @@ def vista_previa_simple(id):
                 </div>
                 
                 <div class="excel-container" id="excelContainer">
-                    <table class="excel-table">
+                    <table class="excel-table tabla-excel-simple">
         """
         
-        # Obtener dimensiones de la hoja
-        max_row = worksheet.max_row
-        max_col = worksheet.max_column
-        
-        # Procesar cada fila
-        for row in range(1, min(max_row + 1, 100)):  # Aumentar límite para ver más contenido
-            pagina_completa += '<tr>'
-            
-            for col in range(1, min(max_col + 1, 30)):  # Aumentar límite de columnas
-                cell = worksheet.cell(row=row, column=col)
-                cell_value = str(cell.value) if cell.value is not None else ''
-                
-                # Limpiar y formatear el valor de la celda
-                if cell_value and len(cell_value) > 50:
-                    cell_value = cell_value[:47] + '...'
-                
-                # Aplicar estilos más detallados
-                cell_style = 'font-size: 10px; '
-                
-                # Estilos de fuente
-                if cell.font:
-                    if cell.font.bold:
-                        cell_style += 'font-weight: bold; '
-                    if cell.font.italic:
-                        cell_style += 'font-style: italic; '
-                    if cell.font.size:
-                        cell_style += f'font-size: {min(cell.font.size, 12)}px; '
-                
-                # Estilos de relleno
-                if cell.fill and cell.fill.start_color and cell.fill.start_color.rgb:
-                    cell_style += f'background-color: {cell.fill.start_color.rgb}; '
-                
-                # Estilos de alineación
-                if cell.alignment:
-                    if cell.alignment.horizontal == 'center':
-                        cell_style += 'text-align: center; '
-                    elif cell.alignment.horizontal == 'right':
-                        cell_style += 'text-align: right; '
-                    elif cell.alignment.horizontal == 'left':
-                        cell_style += 'text-align: left; '
-                    
-                    if cell.alignment.vertical == 'center':
-                        cell_style += 'vertical-align: middle; '
-                    elif cell.alignment.vertical == 'bottom':
-                        cell_style += 'vertical-align: bottom; '
-                
-                # Estilos de borde
-                if cell.border:
-                    if cell.border.left and cell.border.left.style:
-                        cell_style += 'border-left: 2px solid #000; '
-                    if cell.border.right and cell.border.right.style:
-                        cell_style += 'border-right: 2px solid #000; '
-                    if cell.border.top and cell.border.top.style:
-                        cell_style += 'border-top: 2px solid #000; '
-                    if cell.border.bottom and cell.border.bottom.style:
-                        cell_style += 'border-bottom: 2px solid #000; '
-                
-                # Determinar el tipo de celda
-                if row == 1 or (cell.font and cell.font.bold):
-                    pagina_completa += f'<th style="{cell_style}">{cell_value}</th>'
-                else:
-                    pagina_completa += f'<td style="{cell_style}">{cell_value}</td>'
-            
-            pagina_completa += '</tr>'
+        pagina_completa += tabla_html
         
         pagina_completa += """
                     </table>
@@ -2759,10 +3765,10 @@ def vista_previa_simple(id):
         </html>
         """
         
-        return pagina_completa
+        return responder_vista_previa(pagina_completa)
         
     except Exception as e:
-        print(f"Error al generar vista previa simple: {str(e)}")
+        logger.error(f"Error al generar vista previa simple: {str(e)}")
         return f"""
         <!DOCTYPE html>
         <html>
@@ -2789,41 +3795,29 @@ def vista_previa_contrato(id):
     try:
         contrato_generado = ContratoGenerado.query.get_or_404(id)
         
-        # Verificar si tenemos datos binarios en la base de datos
-        if contrato_generado.archivo_data:
-            # Leer desde datos binarios
-            from io import BytesIO
-            from openpyxl import load_workbook
-            workbook = load_workbook(BytesIO(contrato_generado.archivo_data))
-        else:
-            # Fallback: intentar desde archivo (para contratos antiguos)
-            if not os.path.exists(contrato_generado.ruta_archivo):
-                return f"""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Error - Vista Previa</title>
-                    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
-                </head>
-                <body>
-                    <div class="container mt-5">
-                        <div class="alert alert-danger">
-                            <h4>Error</h4>
-                            <p>El archivo del contrato no existe</p>
-                        </div>
+        # Filas del Excel ya renderizadas (se generan una sola vez por archivo)
+        tabla_html = contrato_generado.obtener_vista_previa('completa')
+        if tabla_html is None:
+            return """
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>Error - Vista Previa</title>
+                <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css" rel="stylesheet">
+            </head>
+            <body>
+                <div class="container mt-5">
+                    <div class="alert alert-danger">
+                        <h4>Error</h4>
+                        <p>El archivo del contrato no existe</p>
                     </div>
-                </body>
-                </html>
-                """, 404
-            
-            # Leer el archivo Excel
-            from openpyxl import load_workbook
-            workbook = load_workbook(contrato_generado.ruta_archivo)
-        
-        worksheet = workbook.active
+                </div>
+            </body>
+            </html>
+            """, 404
         
-        # Convertir a HTML
-        html_content = convertir_excel_a_html(worksheet, contrato_generado)
+        # Datos del empleado y contrato: se arman en cada vista (pueden haber cambiado)
+        html_content = convertir_excel_a_html(tabla_html, contrato_generado)
         
         # Crear página HTML completa
         pagina_completa = f"""
@@ -2867,7 +3861,7 @@ def vista_previa_contrato(id):
                         <button onclick="window.print()" class="btn btn-info me-2">
                             <i class="fas fa-print"></i> Imprimir
                         </button>
-                        <a href="{{ url_for('descargar_contrato', id=contrato_generado.id) }}" class="btn btn-success me-2">
+                        <a href="{url_for('descargar_contrato', id=contrato_generado.id)}" class="btn btn-success me-2">
                             <i class="fas fa-download"></i> Descargar Excel
                         </a>
                         <button onclick="window.close()" class="btn btn-secondary">
@@ -2881,10 +3875,10 @@ def vista_previa_contrato(id):
         </html>
         """
         
-        return pagina_completa
+        return responder_vista_previa(pagina_completa)
         
     except Exception as e:
-        print(f"Error al generar vista previa: {str(e)}")
+        logger.error(f"Error al generar vista previa: {str(e)}")
         return f"""
         <!DOCTYPE html>
         <html>
@@ -2908,32 +3902,13 @@ def vista_previa_contrato(id):
 def eliminar_contrato_generado(id):
     """Eliminar contrato generado"""
     try:
-        # Intentar crear la tabla si no existe
-        try:
-            with db.engine.connect() as connection:
-                connection.execute(text("""
-                    CREATE TABLE IF NOT EXISTS contrato_generado (
-                        id SERIAL PRIMARY KEY,
-                        empleado_id INTEGER NOT NULL REFERENCES empleado(id),
-                        contrato_id INTEGER NOT NULL REFERENCES contrato(id),
-                        nombre_archivo VARCHAR(255) NOT NULL,
-                        ruta_archivo VARCHAR(500) NOT NULL,
-                        fecha_generacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        activo BOOLEAN DEFAULT TRUE
-                    );
-                """))
-                connection.commit()
-            print("✅ Tabla contrato_generado creada/verificada en eliminar")
-        except Exception as create_error:
-            print(f"⚠️ No se pudo crear la tabla en eliminar: {create_error}")
-        
         contrato_generado = ContratoGenerado.query.get_or_404(id)
         empleado_nombre = contrato_generado.empleado.nombre_completo
         
         # Eliminar el archivo si existe (para contratos antiguos)
         if os.path.exists(contrato_generado.ruta_archivo):
             os.remove(contrato_generado.ruta_archivo)
-            print(f"✅ Archivo eliminado: {contrato_generado.ruta_archivo}")
+            logger.info(f"✅ Archivo eliminado: {contrato_generado.ruta_archivo}")
         
         # Eliminar el registro de la base de datos (incluye datos binarios)
         db.session.delete(contrato_generado)
@@ -2952,7 +3927,7 @@ def eliminar_contrato_generado(id):
         
     except Exception as e:
         db.session.rollback()
-        print(f"Error al eliminar contrato generado: {str(e)}")
+        logger.error(f"Error al eliminar contrato generado: {str(e)}")
         
         # Si es una petición AJAX, devolver JSON
         if request.headers.get('Content-Type') == 'application/json' or request.method == 'DELETE':
@@ -2975,7 +3950,7 @@ def arreglar_contratos():
             flash('Acceso denegado. Solo administradores pueden acceder a esta función.', 'error')
             return redirect(url_for('dashboard'))
         
-        print("🚀 Arreglando contratos generados...")
+        logger.info("🚀 Arreglando contratos generados...")
         
         # Verificar si la columna archivo_data existe
         try:
@@ -2988,15 +3963,15 @@ def arreglar_contratos():
                 """))
                 
                 if result.fetchone():
-                    print("✅ La columna archivo_data ya existe")
+                    logger.info("✅ La columna archivo_data ya existe")
                     columna_existe = True
                 else:
-                    print("📝 Agregando columna archivo_data...")
+                    logger.info("📝 Agregando columna archivo_data...")
                     conn.execute(text("""
                         ALTER TABLE contrato_generado 
                         ADD COLUMN archivo_data BYTEA;
                     """))
-                    print("✅ Columna archivo_data agregada")
+                    logger.info("✅ Columna archivo_data agregada")
                     columna_existe = False
                 
                 # Contar contratos existentes
@@ -3004,26 +3979,26 @@ def arreglar_contratos():
                 count_antes = result.fetchone()[0]
                 
                 if count_antes > 0:
-                    print(f"🗑️ Eliminando {count_antes} contratos generados existentes (sin datos binarios)...")
+                    logger.info(f"🗑️ Eliminando {count_antes} contratos generados existentes (sin datos binarios)...")
                     conn.execute(text("DELETE FROM contrato_generado;"))
-                    print("✅ Contratos existentes eliminados")
+                    logger.info("✅ Contratos existentes eliminados")
                 
                 # Confirmar cambios
                 conn.commit()
                 
                 mensaje = f"✅ Arreglo completado exitosamente! Columna archivo_data: {'ya existía' if columna_existe else 'agregada'}. Contratos antiguos eliminados: {count_antes}"
                 flash(mensaje, 'success')
-                print(mensaje)
+                logger.info(mensaje)
                 
                 return redirect(url_for('contratos_generados'))
                 
         except Exception as e:
-            print(f"❌ Error durante el arreglo: {str(e)}")
+            logger.error(f"❌ Error durante el arreglo: {str(e)}")
             flash(f'Error al arreglar contratos: {str(e)}', 'error')
             return redirect(url_for('contratos_generados'))
             
     except Exception as e:
-        print(f"❌ Error general: {str(e)}")
+        logger.error(f"❌ Error general: {str(e)}")
         flash(f'Error general: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
 
@@ -3047,6 +4022,7 @@ def nuevo_visitante():
             activo=False  # No activo hasta que se registre la entrada
         )
         db.session.add(visitante)
+        PerfilVisitante.registrar_visita(visitante)
         db.session.commit()
         flash('Visitante registrado exitosamente. Use el botón de Entrada/Salida para registrar su llegada.', 'success')
         return redirect(url_for('visitantes'))
@@ -3093,18 +4069,121 @@ def registrar_entrada_salida_visitante(id):
 def reportes():
     return render_template('reportes.html')
 
+def leer_rango_reporte(args, dias=30):
+    """Rango (inicio, fin) de un reporte desde la URL; por defecto los últimos `dias` días"""
+    fin = leer_fecha_param(args.get('fecha_fin')) or date.today()
+    inicio = leer_fecha_param(args.get('fecha_inicio')) or fin - timedelta(days=dias)
+    if inicio > fin:
+        inicio, fin = fin, inicio
+    return inicio, fin
+
 @app.route('/reportes/asistencia')
 @login_required
 def reporte_asistencia():
-    fecha_inicio = request.args.get('fecha_inicio', (date.today() - timedelta(days=30)).strftime('%Y-%m-%d'))
-    fecha_fin = request.args.get('fecha_fin', date.today().strftime('%Y-%m-%d'))
+    inicio, fin = leer_rango_reporte(request.args)
+    
+    empleados = Asistencia.resumen_por_empleado(inicio, fin)
+    departamentos = Asistencia.resumen_por_departamento(inicio, fin)
+    totales = {
+        'registros': sum(d.dias_presentes for d in departamentos),
+        'total_horas': sum(float(d.total_horas) for d in departamentos),
+        'dias_con_horas': sum(d.dias_con_horas for d in departamentos),
+        'llegadas_tarde': sum(d.llegadas_tarde or 0 for d in departamentos),
+        'sin_salida': sum(d.sin_salida or 0 for d in departamentos),
+        'empleados': len(empleados)
+    }
     
-    asistencias = Asistencia.query.filter(
-        Asistencia.fecha >= datetime.strptime(fecha_inicio, '%Y-%m-%d').date(),
-        Asistencia.fecha <= datetime.strptime(fecha_fin, '%Y-%m-%d').date()
-    ).all()
+    return render_template('reporte_asistencia.html',
+                         empleados=empleados,
+                         departamentos=departamentos,
+                         totales=totales,
+                         hora_limite_entrada=HORA_LIMITE_ENTRADA.strftime('%H:%M'),
+                         fecha_inicio=inicio.strftime('%Y-%m-%d'),
+                         fecha_fin=fin.strftime('%Y-%m-%d'))
+
+def filas_exportacion_asistencia(vista, inicio, fin):
+    """Encabezados y filas (iterador) de una exportación del reporte de asistencia"""
+    if vista == 'registros':
+        encabezados = ['Fecha', 'Cédula', 'Empleado', 'Departamento', 'Hora Entrada', 'Hora Salida',
+                       'Horas Trabajadas', 'Observaciones']
+        filas = (
+            [r.fecha.strftime('%Y-%m-%d'), r.cedula, r.nombre_completo, r.departamento_laboral,
+             r.hora_entrada.strftime('%H:%M') if r.hora_entrada else '',
+             r.hora_salida.strftime('%H:%M') if r.hora_salida else '',
+             round(r.horas_trabajadas, 2) if r.horas_trabajadas is not None else '',
+             r.observaciones or '']
+            for r in Asistencia.registros_reporte(inicio, fin)
+        )
+    elif vista == 'departamentos':
+        encabezados = ['Departamento', 'Empleados', 'Días Presentes', 'Horas Totales', 'Llegadas Tarde', 'Sin Salida']
+        filas = (
+            [d.departamento_laboral, d.empleados, d.dias_presentes, round(float(d.total_horas), 2),
+             d.llegadas_tarde or 0, d.sin_salida or 0]
+            for d in Asistencia.resumen_por_departamento(inicio, fin)
+        )
+    else:
+        encabezados = ['Cédula', 'Empleado', 'Cargo', 'Departamento', 'Días Presentes', 'Horas Totales',
+                       'Llegadas Tarde', 'Sin Salida']
+        filas = (
+            [e.cedula, e.nombre_completo, e.cargo_puesto, e.departamento_laboral, e.dias_presentes,
+             round(float(e.total_horas), 2), e.llegadas_tarde or 0, e.sin_salida or 0]
+            for e in Asistencia.resumen_por_empleado(inicio, fin)
+        )
+    return encabezados, filas
+
+@app.route('/reportes/asistencia/exportar')
+@login_required
+def exportar_reporte_asistencia():
+    """Descargar el reporte de asistencia en CSV (en streaming) o XLSX.
+
+    vista: empleados (por defecto), departamentos o registros (detalle día a día).
+    """
+    inicio, fin = leer_rango_reporte(request.args)
+    vista = request.args.get('vista', 'empleados')
+    if vista not in ('empleados', 'departamentos', 'registros'):
+        vista = 'empleados'
+    nombre = f"asistencia_{vista}_{inicio.strftime('%Y%m%d')}_{fin.strftime('%Y%m%d')}"
+    
+    if request.args.get('formato') == 'xlsx':
+        from openpyxl import Workbook
+        
+        encabezados, filas = filas_exportacion_asistencia(vista, inicio, fin)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title='Asistencia')
+        ws.append(encabezados)
+        for fila in filas:
+            ws.append(fila)
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        return send_file(
+            buffer,
+            as_attachment=True,
+            download_name=f'{nombre}.xlsx',
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
     
-    return render_template('reporte_asistencia.html', asistencias=asistencias, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    import csv
+    
+    def generar():
+        encabezados, filas = filas_exportacion_asistencia(vista, inicio, fin)
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        buffer.write('\ufeff')  # BOM para que Excel reconozca UTF-8
+        escritor.writerow(encabezados)
+        for fila in filas:
+            escritor.writerow(fila)
+            if buffer.tell() > 16384:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={nombre}.csv'}
+    )
 
 @app.route('/reportes/empleados')
 @login_required
@@ -3289,156 +4368,117 @@ def cesantias():
                          retiros_mes_actual=retiros_mes_actual,
                          pendientes=pendientes)
 
+# Nómina
+def leer_periodo_nomina(args):
+    """Año y mes de la nómina desde los parámetros (mes actual por defecto; mes vacío = todo el año)"""
+    hoy = colombia_now().date()
+    try:
+        ano = int(args.get('ano', hoy.year))
+    except ValueError:
+        ano = hoy.year
+    mes = args.get('mes', str(hoy.month))
+    try:
+        mes = int(mes) if mes else None
+    except ValueError:
+        mes = hoy.month
+    if mes is not None and not 1 <= mes <= 12:
+        mes = hoy.month
+    return ano, mes
+
+@app.route('/nomina')
+@login_required
+def nomina():
+    """Cálculo de nómina del mes a partir de las asistencias"""
+    if not current_user.is_admin:
+        flash('Solo los administradores pueden acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    ano, mes = leer_periodo_nomina(request.args)
+    mes = mes or colombia_now().month
+    try:
+        nomina_data = NominaPeriodo.obtener(ano, [mes], recalcular=request.args.get('recalcular') == '1')
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"❌ Error calculando nómina {ano}-{mes:02d}: {e}")
+        flash(f'Error al calcular la nómina: {str(e)}', 'error')
+        nomina_data = []
+    
+    return render_template('nomina.html',
+                         nomina_data=nomina_data,
+                         periodo_mes=mes,
+                         periodo_ano=ano,
+                         periodo_cerrado=rango_periodo(ano, mes)[1] < colombia_now().date())
+
+@app.route('/nomina/exportar')
+@login_required
+def exportar_nomina():
+    """Exportar la nómina de un mes (o de todo el año si no se indica mes) a Excel"""
+    if not current_user.is_admin:
+        flash('Solo los administradores pueden acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    
+    ano, mes = leer_periodo_nomina(request.args)
+    try:
+        from openpyxl import Workbook
+        from io import BytesIO
+        
+        filas = NominaPeriodo.obtener(ano, [mes] if mes else None)
+        
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=f'Nómina {ano}')
+        encabezados = ['Período', 'Cédula', 'Empleado', 'Cargo', 'Tipo Salario', 'Salario Base', 'Valor Hora',
+                       'Días', 'Horas Totales', 'Horas Ordinarias', 'Horas Extras', 'Horas Nocturnas',
+                       'Horas Dominicales', 'Horas Festivas', 'Salario Devengado', 'Valor Horas Extras',
+                       'Recargos', 'Total a Pagar']
+        ws.append(encabezados)
+        for fila in filas:
+            ws.append([
+                fila['periodo'], fila['empleado']['cedula'], fila['empleado']['nombre_completo'],
+                fila['empleado']['cargo_puesto'], fila['tipo_salario'], fila['salario_base'], fila['valor_hora'],
+                fila['total_dias'], fila['total_horas'], fila['horas_ordinarias'], fila['horas_extras'],
+                fila['horas_nocturnas'], fila['horas_dominicales'], fila['horas_festivas'],
+                fila['salario_devengado'], fila['valor_horas_extras'], fila['valor_recargos'], fila['total_pagar']
+            ])
+        
+        buffer = BytesIO()
+        wb.save(buffer)
+        buffer.seek(0)
+        nombre = f'Nomina_{ano}-{mes:02d}.xlsx' if mes else f'Nomina_{ano}.xlsx'
+        return send_file(
+            buffer,
+            as_attachment=True,
+            download_name=nombre,
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error al exportar la nómina: {str(e)}', 'error')
+        return redirect(url_for('nomina', ano=ano, mes=mes or ''))
+
 # Inicialización de la base de datos
+def crear_tablas():
+    """Crea las tablas de los modelos que aún no existen"""
+    logger.info("📊 Creando tablas de la base de datos...")
+    db.create_all()
+    cache_referencias.crear_tabla()
+    limite_peticiones.crear_tabla()
+    logger.info("✅ Tablas principales creadas")
+
 def init_db():
+    """Aplica las migraciones pendientes (ver migraciones/). Si el esquema está al día solo hace una consulta."""
     try:
-        print("🚀 INICIANDO INICIALIZACIÓN DE BASE DE DATOS")
-        print("=" * 60)
-        
         with app.app_context():
-            print("📊 Creando tablas de la base de datos...")
-            db.create_all()
-            print("✅ Tablas principales creadas")
-            
-            # Ejecutar migración de tablas de inventario
-            print("🔄 Iniciando migración de tablas de inventario...")
-            from sqlalchemy import text
-            
-            # Crear tablas de inventario si no existen
-            tablas_inventario = [
-                {
-                    'nombre': 'categoria_inventario',
-                    'sql': """
-                        CREATE TABLE IF NOT EXISTS categoria_inventario (
-                            id SERIAL PRIMARY KEY,
-                            nombre VARCHAR(100) NOT NULL UNIQUE,
-                            descripcion TEXT,
-                            activa BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """
-                },
-                {
-                    'nombre': 'producto',
-                    'sql': """
-                        CREATE TABLE IF NOT EXISTS producto (
-                            id SERIAL PRIMARY KEY,
-                            codigo VARCHAR(50) NOT NULL UNIQUE,
-                            nombre VARCHAR(200) NOT NULL,
-                            descripcion TEXT,
-                            categoria_id INTEGER NOT NULL REFERENCES categoria_inventario(id),
-                            unidad_medida VARCHAR(20) NOT NULL,
-                            precio_unitario NUMERIC(10, 2) DEFAULT 0,
-                            stock_minimo INTEGER DEFAULT 0,
-                            stock_actual INTEGER DEFAULT 0,
-                            ubicacion VARCHAR(100),
-                            proveedor VARCHAR(200),
-                            fecha_vencimiento DATE,
-                            lote VARCHAR(50),
-                            activo BOOLEAN DEFAULT TRUE,
-                            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                        );
-                    """
-                },
-                {
-                    'nombre': 'movimiento_inventario',
-                    'sql': """
-                        CREATE TABLE IF NOT EXISTS movimiento_inventario (
-                            id SERIAL PRIMARY KEY,
-                            producto_id INTEGER NOT NULL REFERENCES producto(id),
-                            tipo_movimiento VARCHAR(20) NOT NULL,
-                            cantidad INTEGER NOT NULL,
-                            precio_unitario NUMERIC(10, 2),
-                            total NUMERIC(10, 2),
-                            motivo VARCHAR(200),
-                            referencia VARCHAR(100),
-                            responsable VARCHAR(200),
-                            observaciones TEXT,
-                            fecha_movimiento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                            created_by INTEGER REFERENCES "user"(id)
-                        );
-                    """
-                }
-            ]
-            
-            for tabla in tablas_inventario:
-                print(f"📝 Procesando tabla {tabla['nombre']}...")
-                try:
-                    with db.engine.connect() as conn:
-                        conn.execute(text(tabla['sql']))
-                        conn.commit()
-                    print(f"✅ Tabla {tabla['nombre']} creada/verificada exitosamente")
-                except Exception as e:
-                    print(f"❌ ERROR con tabla {tabla['nombre']}: {str(e)}")
-                    # Continuar con las demás tablas
-                    continue
-            
-            # Verificar columna archivo_data en contrato_generado
-            print("📝 Verificando columna archivo_data en contrato_generado...")
-            try:
-                with db.engine.connect() as conn:
-                    conn.execute(text("""
-                        ALTER TABLE contrato_generado 
-                        ADD COLUMN IF NOT EXISTS archivo_data BYTEA;
-                    """))
-                    conn.commit()
-                print("✅ Columna archivo_data verificada exitosamente")
-            except Exception as e:
-                print(f"⚠️ Columna archivo_data: {str(e)}")
-            
-            print("✅ Migración de inventarios completada")
-            
-            print("✅ Sistema de inventarios simplificado - categorías fijas: ALMACEN GENERAL, QUIMICOS, POSCOSECHA")
-            
-            # Crear tabla de notificaciones
-            print("🔔 Creando tabla de notificaciones...")
-            try:
-                with db.engine.connect() as conn:
-                    conn.execute(text("""
-                        CREATE TABLE IF NOT EXISTS notificacion (
-                            id SERIAL PRIMARY KEY,
-                            titulo VARCHAR(200) NOT NULL,
-                            mensaje TEXT NOT NULL,
-                            tipo VARCHAR(20) NOT NULL DEFAULT 'info',
-                            tipo_sonido VARCHAR(20) NOT NULL DEFAULT 'alerta',
-                            icono VARCHAR(50) NOT NULL DEFAULT 'fas fa-bell',
-                            leida BOOLEAN NOT NULL DEFAULT FALSE,
-                            fecha_creacion TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                            usuario_id INTEGER REFERENCES "user"(id)
-                        )
-                    """))
-                    conn.commit()
-                print("✅ Tabla de notificaciones creada exitosamente")
-            except Exception as e:
-                print(f"⚠️ Tabla de notificaciones: {str(e)}")
-            
-            # Crear usuario administrador por defecto
-            print("👤 Verificando usuario administrador...")
-            admin_user = User.query.filter_by(email='admin@floresjuncalito.com').first()
-            if not admin_user:
-                admin_user = User(
-                    email='admin@floresjuncalito.com',
-                    username='Administrador',
-                    password_hash=generate_password_hash('nueva_contraseña_2024'),
-                    is_admin=True
-                )
-                db.session.add(admin_user)
-                db.session.commit()
-                print("✅ Usuario administrador creado: admin@floresjuncalito.com / nueva_contraseña_2024")
-            else:
-                print("✅ Usuario administrador ya existe")
-            
-            print("=" * 60)
-            print("🎉 BASE DE DATOS INICIALIZADA CORRECTAMENTE")
-            print("=" * 60)
+            aplicadas = migraciones.migrar(db, crear_tablas, modelos={
+                'User': User,
+                'PerfilVisitante': PerfilVisitante,
+                'ArchivoSolicitud': ArchivoSolicitud,
+                'Asistencia': Asistencia
+            })
+            if aplicadas:
+                logger.info(f"🎉 BASE DE DATOS INICIALIZADA CORRECTAMENTE ({aplicadas} migraciones)")
             
     except Exception as e:
-        print("=" * 60)
-        print(f"❌ ERROR CRÍTICO al inicializar la base de datos: {str(e)}")
-        print("=" * 60)
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ ERROR CRÍTICO al inicializar la base de datos: {str(e)}")
         raise
 
 # ===== RUTAS PARA SISTEMA DE INVENTARIOS =====
@@ -3456,7 +4496,7 @@ def inventarios():
     try:
         productos = Producto.query.filter_by(activo=True, periodo=periodo_actual).all()
     except Exception as e:
-        print(f"⚠️ Error obteniendo productos por período: {e}")
+        logger.warning(f"⚠️ Error obteniendo productos por período: {e}")
         # Fallback: obtener todos los productos activos
         productos = Producto.query.filter_by(activo=True).all()
     
@@ -3512,10 +4552,9 @@ def inventarios():
     
     # Obtener períodos disponibles para el selector
     try:
-        periodos_disponibles = db.session.query(Producto.periodo).distinct().order_by(Producto.periodo.desc()).all()
-        periodos_disponibles = [p[0] for p in periodos_disponibles if p[0] is not None]
+        periodos_disponibles = obtener_periodos_productos()
     except Exception as e:
-        print(f"⚠️ Error obteniendo períodos: {e}")
+        logger.warning(f"⚠️ Error obteniendo períodos: {e}")
         periodos_disponibles = [periodo_actual]
     
     return render_template('inventarios.html', 
@@ -3532,6 +4571,7 @@ def inventarios():
 
 @app.route('/inventarios/productos')
 @login_required
+@cache_http.pagina_condicional('productos', 'solicitudes')
 def productos_inventario():
     """Lista de productos del inventario con búsqueda avanzada"""
     categoria = request.args.get('categoria', '')
@@ -3601,8 +4641,7 @@ def productos_inventario():
     
     # Obtener períodos disponibles
     try:
-        periodos_disponibles = db.session.query(Producto.periodo).distinct().order_by(Producto.periodo.desc()).all()
-        periodos_disponibles = [p[0] for p in periodos_disponibles if p[0] is not None]
+        periodos_disponibles = obtener_periodos_productos()
     except:
         periodos_disponibles = []
     
@@ -3715,7 +4754,7 @@ def nuevo_producto_inventario():
                     periodo=periodo_actual
                 ).first()
             except Exception as e:
-                print(f"⚠️ Error verificando código único: {e}")
+                logger.warning(f"⚠️ Error verificando código único: {e}")
                 # Fallback: verificar solo por código y categoría
                 producto_existente = Producto.query.filter_by(
                     codigo=codigo, 
@@ -3766,6 +4805,7 @@ def nuevo_producto_inventario():
 
 @app.route('/inventarios/movimientos')
 @login_required
+@cache_http.pagina_condicional('movimientos', 'productos', 'solicitudes')
 def movimientos_inventario():
     """Historial de movimientos de inventario con búsqueda avanzada"""
     # Parámetros de búsqueda y filtros
@@ -3844,20 +4884,18 @@ def movimientos_inventario():
         query = query.order_by(Producto.nombre, MovimientoInventario.fecha_movimiento.desc())
     
     movimientos = query.all()
-    productos = Producto.query.filter_by(activo=True).order_by(Producto.nombre).all()
+    productos = obtener_productos_activos_selector()
     
     # Obtener categorías y períodos disponibles
     categorias_fijas = ['ALMACEN GENERAL', 'QUIMICOS', 'POSCOSECHA']
     try:
-        periodos_disponibles = db.session.query(MovimientoInventario.periodo).distinct().order_by(MovimientoInventario.periodo.desc()).all()
-        periodos_disponibles = [p[0] for p in periodos_disponibles if p[0] is not None]
+        periodos_disponibles = obtener_periodos_movimientos()
     except:
         periodos_disponibles = []
     
     # Obtener responsables únicos
     try:
-        responsables = db.session.query(MovimientoInventario.responsable).distinct().filter(MovimientoInventario.responsable.isnot(None)).all()
-        responsables = sorted([r[0] for r in responsables if r[0] and r[0].strip()])
+        responsables = obtener_responsables_movimientos()
     except:
         responsables = []
     
@@ -3898,45 +4936,45 @@ def fix_database():
             engine = db.engine
             with engine.connect() as conn:
                 # Ejecutar el script de arreglo
-                print("🔧 Iniciando arreglo de base de datos...")
+                logger.info("🔧 Iniciando arreglo de base de datos...")
                 
                 try:
                     conn.execute(text("ALTER TABLE producto DROP CONSTRAINT IF EXISTS producto_categoria_id_fkey"))
-                    print("✅ Constraint eliminado")
+                    logger.info("✅ Constraint eliminado")
                 except Exception as e:
-                    print(f"⚠️ Error eliminando constraint: {e}")
+                    logger.warning(f"⚠️ Error eliminando constraint: {e}")
                 
                 try:
                     conn.execute(text("ALTER TABLE producto DROP COLUMN IF EXISTS categoria_id"))
-                    print("✅ Columna categoria_id eliminada")
+                    logger.info("✅ Columna categoria_id eliminada")
                 except Exception as e:
-                    print(f"⚠️ Error eliminando columna: {e}")
+                    logger.warning(f"⚠️ Error eliminando columna: {e}")
                 
                 try:
                     conn.execute(text("ALTER TABLE producto ADD COLUMN IF NOT EXISTS categoria VARCHAR(50)"))
-                    print("✅ Columna categoria agregada")
+                    logger.info("✅ Columna categoria agregada")
                 except Exception as e:
-                    print(f"⚠️ Error agregando columna: {e}")
+                    logger.warning(f"⚠️ Error agregando columna: {e}")
                 
                 try:
                     conn.execute(text("DROP TABLE IF EXISTS categoria_inventario"))
-                    print("✅ Tabla categoria_inventario eliminada")
+                    logger.info("✅ Tabla categoria_inventario eliminada")
                 except Exception as e:
-                    print(f"⚠️ Error eliminando tabla: {e}")
+                    logger.warning(f"⚠️ Error eliminando tabla: {e}")
                 
                 try:
                     conn.execute(text("UPDATE producto SET categoria = 'ALMACEN GENERAL' WHERE categoria IS NULL OR categoria = ''"))
-                    print("✅ Productos actualizados")
+                    logger.info("✅ Productos actualizados")
                 except Exception as e:
-                    print(f"⚠️ Error actualizando productos: {e}")
+                    logger.warning(f"⚠️ Error actualizando productos: {e}")
                 
                 conn.commit()
-                print("🎉 Base de datos arreglada correctamente")
+                logger.info("🎉 Base de datos arreglada correctamente")
             
             return jsonify({'success': True, 'message': 'Base de datos arreglada correctamente'})
             
         except Exception as e:
-            print(f"❌ Error al arreglar la base de datos: {str(e)}")
+            logger.error(f"❌ Error al arreglar la base de datos: {str(e)}")
             return jsonify({'success': False, 'message': f'Error: {str(e)}'})
     
     # GET: Mostrar página de arreglo
@@ -4322,10 +5360,9 @@ def reportes_inventarios():
     
     # Obtener períodos disponibles para el selector
     try:
-        periodos_disponibles = db.session.query(Producto.periodo).distinct().order_by(Producto.periodo.desc()).all()
-        periodos_disponibles = [p[0] for p in periodos_disponibles if p[0] is not None]
+        periodos_disponibles = obtener_periodos_productos()
     except Exception as e:
-        print(f"⚠️ Error obteniendo períodos: {e}")
+        logger.warning(f"⚠️ Error obteniendo períodos: {e}")
         periodos_disponibles = [periodo]
     
     return render_template('reportes_inventarios.html',
@@ -4381,6 +5418,7 @@ def abrir_mes_procedimiento(periodo):
         else:
             flash(f'Mes {periodo} abierto exitosamente', 'success')
         
+        cache_referencias.invalidar('productos')
         db.session.commit()
     except Exception as e:
         db.session.rollback()
@@ -4955,7 +5993,7 @@ def exportar_excel_inventario(periodo):
                     ws.merge_cells(merge_range)
                 except Exception as e:
                     # Si hay un error en un merge, continuar con los demás
-                    print(f"Advertencia: No se pudo hacer merge de {merge_range}: {e}")
+                    logger.warning(f"Advertencia: No se pudo hacer merge de {merge_range}: {e}")
             
             # Fila de totales
             total_row = len(productos_cat) + 6
@@ -5043,9 +6081,9 @@ def migrate_inventory_monthly():
                 conn.execute(text("ALTER TABLE producto ADD COLUMN IF NOT EXISTS periodo VARCHAR(7)"))
                 conn.execute(text("ALTER TABLE movimiento_inventario ADD COLUMN IF NOT EXISTS periodo VARCHAR(7)"))
                 conn.commit()
-                print("✅ Columnas periodo agregadas")
+                logger.info("✅ Columnas periodo agregadas")
             except Exception as e:
-                print(f"⚠️ Error agregando columnas: {e}")
+                logger.warning(f"⚠️ Error agregando columnas: {e}")
         
         # Obtener productos sin período (después de agregar la columna)
         try:
@@ -5068,7 +6106,7 @@ def migrate_inventory_monthly():
             flash(f'{productos_migrados} productos migrados al período {periodo_actual}', 'success')
             
         except Exception as e:
-            print(f"⚠️ Error migrando productos: {e}")
+            logger.warning(f"⚠️ Error migrando productos: {e}")
             flash(f'Columnas agregadas, pero error migrando productos: {str(e)}', 'warning')
         
     except Exception as e:
@@ -5142,6 +6180,8 @@ def importar_inventarios():
                         productos_importados = 0
                         productos_duplicados = 0
                         errores = []
+                        filas = []
+                        nombres_vistos = set()
                         
                         # Procesar filas según el tipo de inventario
                         for row in range(2, ws.max_row + 1):  # Saltar encabezado
@@ -5193,26 +6233,11 @@ def importar_inventarios():
                                 if not producto or producto == "" or producto == "NONE":
                                     continue
                                 
-                                # Generar código único basado en el nombre del producto
-                                prefijo = {'ALMACEN GENERAL': 'ALM', 'QUIMICOS': 'QUI', 'POSCOSECHA': 'POS'}
-                                # Crear código más legible usando las primeras letras del producto
-                                codigo_base = ''.join([c for c in producto if c.isalnum()])[:8]
-                                codigo = f"{prefijo[tipo_inventario]}-{codigo_base}-{row-1:03d}"
-                                
-                                # Verificar si ya existe en el mismo período y categoría
-                                result = conn.execute(text("""
-                                    SELECT id FROM producto WHERE codigo = :codigo AND categoria = :categoria AND periodo = :periodo
-                                """), {
-                                    'codigo': codigo,
-                                    'categoria': tipo_inventario,
-                                    'periodo': periodo_importacion
-                                })
-                                
-                                if result.fetchone():
+                                if producto in nombres_vistos:
                                     productos_duplicados += 1
                                     continue
+                                nombres_vistos.add(producto)
                                 
-                                # Insertar producto con manejo de errores mejorado
                                 descripcion = f'Importado desde Excel - {tipo_inventario} - {periodo_importacion}'
                                 if tipo_inventario == 'QUIMICOS' and clase:
                                     descripcion += f' - Clase: {clase}'
@@ -5222,16 +6247,7 @@ def importar_inventarios():
                                 saldo_final = int(saldo) if saldo >= 0 else 0
                                 proveedor_final = proveedor if proveedor else 'SIN PROVEEDOR'
                                 
-                                conn.execute(text("""
-                                    INSERT INTO producto (
-                                        codigo, nombre, descripcion, categoria, periodo, unidad_medida,
-                                        precio_unitario, stock_actual, saldo_inicial, proveedor, activo, created_at
-                                    ) VALUES (
-                                        :codigo, :nombre, :descripcion, :categoria, :periodo, :unidad_medida,
-                                        :precio_unitario, :stock_actual, :saldo_inicial, :proveedor, true, CURRENT_TIMESTAMP
-                                    )
-                                """), {
-                                    'codigo': codigo,
+                                filas.append({
                                     'nombre': producto,
                                     'descripcion': descripcion,
                                     'categoria': tipo_inventario,
@@ -5243,12 +6259,39 @@ def importar_inventarios():
                                     'proveedor': proveedor_final
                                 })
                                 
-                                productos_importados += 1
-                                
                             except Exception as e:
                                 errores.append(f"Fila {row}: {str(e)}")
                                 continue
                         
+                        # Omitir productos que ya existen en la categoría y período (una sola consulta)
+                        if filas:
+                            existentes = {
+                                nombre for (nombre,) in conn.execute(text("""
+                                    SELECT nombre FROM producto WHERE categoria = :categoria AND periodo = :periodo
+                                """), {'categoria': tipo_inventario, 'periodo': periodo_importacion})
+                            }
+                            productos_duplicados += sum(1 for f in filas if f['nombre'] in existentes)
+                            filas = [f for f in filas if f['nombre'] not in existentes]
+                        
+                        if filas:
+                            # Reservar de una vez el rango de códigos para todo el archivo
+                            codigos = Producto.reservar_codigos(tipo_inventario, periodo_importacion, len(filas))
+                            db.session.commit()
+                            for fila, codigo in zip(filas, codigos):
+                                fila['codigo'] = codigo
+                            
+                            conn.execute(text("""
+                                INSERT INTO producto (
+                                    codigo, nombre, descripcion, categoria, periodo, unidad_medida,
+                                    precio_unitario, stock_actual, saldo_inicial, proveedor, activo, created_at
+                                ) VALUES (
+                                    :codigo, :nombre, :descripcion, :categoria, :periodo, :unidad_medida,
+                                    :precio_unitario, :stock_actual, :saldo_inicial, :proveedor, true, CURRENT_TIMESTAMP
+                                )
+                            """), filas)
+                            cache_referencias.invalidar('productos', conexion=conn)
+                            productos_importados = len(filas)
+                        
                         conn.commit()
                         
                         # Mensaje de resultado
@@ -5336,12 +6379,12 @@ def nuevo_movimiento_inventario():
                 return redirect(url_for('nuevo_movimiento_inventario'))
             
             producto = Producto.query.get_or_404(producto_id)
-            
-            # Verificar stock para salidas
+
+            # Validación rápida de stock para salidas (la definitiva es el UPDATE atómico)
             if tipo_movimiento == 'SALIDA' and producto.stock_actual < cantidad:
                 flash(f'Stock insuficiente. Stock actual: {producto.stock_actual}', 'error')
                 return redirect(url_for('nuevo_movimiento_inventario'))
-            
+
             if tipo_movimiento == 'ENTRADA' and not proveedor:
                 flash('El proveedor es obligatorio para las entradas.', 'error')
                 return redirect(url_for('nuevo_movimiento_inventario'))
@@ -5349,21 +6392,11 @@ def nuevo_movimiento_inventario():
                 proveedor = ''
             
             # Calcular precio y total según tipo de ingreso
-            if tipo_movimiento == 'ENTRADA':
-                if tipo_ingreso == 'EMPAQUE' and cantidad_empaques and contenido_por_empaque and precio_por_empaque:
-                    # Ingreso por empaques
-                    precio_final = precio_por_empaque / contenido_por_empaque  # Precio por unidad base
-                    total = cantidad_empaques * precio_por_empaque
-                    # Actualizar cantidad a la cantidad total en unidad base
-                    cantidad = int(cantidad_empaques * contenido_por_empaque)
-                else:
-                    # Ingreso individual
-                    precio_final = precio_unitario
-                    total = cantidad * precio_unitario
-            else:
-                precio_final = 0
-                total = 0
-            
+            cantidad, precio_final, total = MovimientoInventario.calcular_valores(
+                tipo_movimiento, tipo_ingreso, cantidad, precio_unitario,
+                cantidad_empaques, contenido_por_empaque, precio_por_empaque
+            )
+
             # Obtener período del producto
             periodo_movimiento = producto.periodo if hasattr(producto, 'periodo') and producto.periodo else get_periodo_actual()
             
@@ -5387,27 +6420,31 @@ def nuevo_movimiento_inventario():
                 proveedor=proveedor or None
             )
             
-            # Actualizar stock del producto automáticamente
+            # Actualizar proveedor del producto si se proporciona
+            if tipo_movimiento == 'ENTRADA' and proveedor:
+                producto.proveedor = proveedor
+
             db.session.add(nuevo_movimiento)
             db.session.flush()  # Asegura que el movimiento esté en la sesión
-            
-            # Actualizar stock basado en el movimiento
-            stock_anterior = producto.stock_actual
-            if tipo_movimiento == 'ENTRADA':
-                producto.stock_actual += cantidad
-                # Actualizar proveedor del producto si se proporciona
-                if proveedor:
-                    producto.proveedor = proveedor
-            elif tipo_movimiento == 'SALIDA':
-                producto.stock_actual -= cantidad
-            
+
+            # Actualizar stock con un UPDATE atómico (evita perder salidas concurrentes)
+            delta = cantidad if tipo_movimiento == 'ENTRADA' else -cantidad
+            stock_nuevo = Producto.ajustar_stock(producto.id, delta)
+            if stock_nuevo is None:
+                db.session.rollback()
+                stock_disponible = db.session.query(Producto.stock_actual).filter_by(id=producto.id).scalar()
+                flash(f'Stock insuficiente. Stock actual: {stock_disponible}', 'error')
+                return redirect(url_for('nuevo_movimiento_inventario'))
+            stock_anterior = stock_nuevo - delta
+            stock_minimo = producto.stock_minimo
+
             db.session.commit()
-            
+
             # Verificar si stock está bajo
-            if producto.verificar_stock_bajo():
-                flash(f'⚠️ Movimiento registrado. Stock actual: {producto.stock_actual} (⚠️ STOCK BAJO - Mínimo: {producto.stock_minimo})', 'warning')
+            if stock_minimo and stock_minimo > 0 and stock_nuevo < stock_minimo:
+                flash(f'⚠️ Movimiento registrado. Stock actual: {stock_nuevo} (⚠️ STOCK BAJO - Mínimo: {stock_minimo})', 'warning')
             else:
-                flash(f'✓ Movimiento registrado exitosamente. Stock actualizado: {stock_anterior} → {producto.stock_actual}', 'success')
+                flash(f'✓ Movimiento registrado exitosamente. Stock actualizado: {stock_anterior} → {stock_nuevo}', 'success')
             
             return redirect(url_for('movimientos_inventario'))
             
@@ -5419,36 +6456,324 @@ def nuevo_movimiento_inventario():
     productos = Producto.query.filter_by(activo=True).all()
     return render_template('nuevo_movimiento_inventario.html', productos=productos)
 
+MAX_LINEAS_LOTE_MOVIMIENTOS = 500
+
+def leer_lineas_lote_movimientos():
+    """Lee las líneas del lote desde JSON o desde un archivo CSV subido.
+
+    Devuelve (lineas, datos_generales). Los datos generales (referencia, proveedor,
+    responsable, tipo_movimiento, motivo, periodo) se aplican a las líneas que no los traen.
+    Lanza ValueError si el CSV no se puede leer o el JSON no tiene la forma esperada.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ValueError('El cuerpo JSON debe ser un objeto con la lista "lineas"')
+        lineas = data.get('lineas') or []
+        if not isinstance(lineas, list):
+            raise ValueError('"lineas" debe ser una lista de movimientos')
+        generales = {k: v for k, v in data.items() if k != 'lineas'}
+        for campo, valor in generales.items():
+            if isinstance(valor, (dict, list)):
+                raise ValueError(f'El dato general "{campo}" no es válido')
+        return lineas, generales
+
+    archivo = request.files.get('archivo_csv')
+    if not archivo or not archivo.filename:
+        return [], {}
+
+    import csv
+    contenido = io.TextIOWrapper(archivo.stream, encoding='utf-8-sig')
+    try:
+        muestra = contenido.read(2048)
+        contenido.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;')
+        except csv.Error:
+            dialecto = csv.excel
+        lineas = [
+            {(k or '').strip().lower(): (v or '').strip() for k, v in fila.items()}
+            for fila in csv.DictReader(contenido, dialect=dialecto)
+        ]
+    except UnicodeDecodeError:
+        raise ValueError('El archivo CSV debe estar en UTF-8 (en Excel: Guardar como "CSV UTF-8")')
+    except csv.Error as e:
+        raise ValueError(f'El archivo CSV no es válido: {e}')
+    generales = {k: v.strip() for k, v in request.form.items() if v and v.strip()}
+    return lineas, generales
+
+def _texto_lote(valor):
+    """Texto de una línea del lote; los números del JSON se aceptan como texto"""
+    if valor is None:
+        return ''
+    if isinstance(valor, (dict, list)):
+        raise TypeError('valor de texto inválido')
+    return str(valor).strip()
+
+def _numero_lote(valor, tipo=float):
+    """Convierte un valor de una línea del lote (acepta coma decimal)"""
+    if valor is None or valor == '':
+        return None
+    if isinstance(valor, str):
+        valor = valor.strip().replace(',', '.')
+    return tipo(float(valor)) if tipo is int else tipo(valor)
+
+@app.route('/inventarios/movimientos/lote', methods=['POST'])
+@login_required
+def lote_movimientos_inventario():
+    """Registrar muchos movimientos a la vez (ej. una factura completa de proveedor).
+
+    Acepta JSON {"lineas": [...], ...datos generales} o un CSV en 'archivo_csv'.
+    Valida todas las líneas antes de escribir; si alguna falla no se registra ninguna.
+    """
+    try:
+        lineas, generales = leer_lineas_lote_movimientos()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    if not lineas:
+        return jsonify({'success': False, 'message': 'No se recibieron líneas de movimiento'}), 400
+    if len(lineas) > MAX_LINEAS_LOTE_MOVIMIENTOS:
+        return jsonify({
+            'success': False,
+            'message': f'Máximo {MAX_LINEAS_LOTE_MOVIMIENTOS} líneas por lote'
+        }), 400
+
+    periodo_general = _texto_lote(generales.get('periodo')) or get_periodo_actual()
+    resultados = []
+    movimientos = []
+
+    # 1. Validar y calcular cada línea sin tocar la base de datos
+    for numero, linea in enumerate(lineas, 1):
+        if not isinstance(linea, dict):
+            resultados.append({'linea': numero, 'success': False, 'errores': ['Línea con formato inválido']})
+            continue
+        dato = lambda campo: linea.get(campo) if linea.get(campo) not in (None, '') else generales.get(campo)
+        errores = []
+        try:
+            textos = {campo: _texto_lote(dato(campo)) for campo in (
+                'tipo_movimiento', 'tipo_ingreso', 'proveedor', 'motivo', 'referencia',
+                'responsable', 'observaciones'
+            )}
+            codigo = _texto_lote(linea.get('codigo')).upper()
+            periodo = _texto_lote(linea.get('periodo')) or periodo_general
+        except TypeError:
+            resultados.append({'linea': numero, 'success': False, 'errores': ['Campos de texto inválidos']})
+            continue
+        try:
+            producto_id = _numero_lote(linea.get('producto_id'), int)
+            tipo_movimiento = textos['tipo_movimiento'].upper()
+            tipo_ingreso = (textos['tipo_ingreso'] or 'INDIVIDUAL').upper()
+            cantidad = _numero_lote(dato('cantidad'), int) or 0
+            precio_unitario = _numero_lote(dato('precio_unitario')) or 0
+            cantidad_empaques = contenido_por_empaque = precio_por_empaque = None
+            if tipo_ingreso == 'EMPAQUE':
+                cantidad_empaques = _numero_lote(dato('cantidad_empaques'), int)
+                contenido_por_empaque = _numero_lote(dato('contenido_por_empaque'))
+                precio_por_empaque = _numero_lote(dato('precio_por_empaque')) or 0
+                if not cantidad and cantidad_empaques and contenido_por_empaque:
+                    cantidad = int(cantidad_empaques * contenido_por_empaque)
+        except (TypeError, ValueError):
+            resultados.append({'linea': numero, 'success': False, 'errores': ['Valores numéricos inválidos']})
+            continue
+
+        proveedor = textos['proveedor']
+        if tipo_movimiento not in ('ENTRADA', 'SALIDA'):
+            errores.append('tipo_movimiento debe ser ENTRADA o SALIDA')
+        if tipo_ingreso not in ('INDIVIDUAL', 'EMPAQUE'):
+            errores.append('tipo_ingreso debe ser INDIVIDUAL o EMPAQUE')
+        if cantidad <= 0:
+            errores.append('La cantidad debe ser mayor a 0')
+        if tipo_movimiento == 'ENTRADA' and not proveedor:
+            errores.append('El proveedor es obligatorio para las entradas')
+        if not producto_id and not codigo:
+            errores.append('Debe indicar producto_id o codigo')
+
+        if tipo_movimiento == 'SALIDA':
+            proveedor = ''
+            tipo_ingreso = 'INDIVIDUAL'
+            cantidad_empaques = contenido_por_empaque = precio_por_empaque = None
+
+        cantidad, precio_final, total = MovimientoInventario.calcular_valores(
+            tipo_movimiento, tipo_ingreso, cantidad, precio_unitario,
+            cantidad_empaques, contenido_por_empaque, precio_por_empaque
+        )
+
+        resultados.append({'linea': numero, 'success': not errores, 'errores': errores})
+        movimientos.append({
+            'linea': numero,
+            'producto_id': producto_id,
+            'codigo': codigo,
+            'periodo': periodo,
+            'tipo_movimiento': tipo_movimiento,
+            'cantidad': cantidad,
+            'precio_unitario': precio_final,
+            'total': total,
+            'motivo': textos['motivo'],
+            'referencia': textos['referencia'],
+            'responsable': textos['responsable'],
+            'observaciones': textos['observaciones'],
+            'proveedor': proveedor or None,
+            'tipo_ingreso': tipo_ingreso,
+            'cantidad_empaques': cantidad_empaques,
+            'contenido_por_empaque': contenido_por_empaque,
+            'precio_por_empaque': precio_por_empaque,
+        })
+
+    resultados_por_linea = {r['linea']: r for r in resultados}
+
+    try:
+        # 2. Resolver productos por código (una sola consulta)
+        codigos = {(m['codigo'], m['periodo']) for m in movimientos if not m['producto_id'] and m['codigo']}
+        if codigos:
+            candidatos = db.session.query(Producto.id, Producto.codigo, Producto.periodo).filter(
+                Producto.codigo.in_({c for c, _ in codigos}),
+                Producto.periodo.in_({p for _, p in codigos})
+            ).all()
+            ids_por_codigo = {}
+            for producto_id, codigo, periodo in candidatos:
+                ids_por_codigo.setdefault((codigo, periodo), []).append(producto_id)
+            for m in movimientos:
+                if m['producto_id'] or not m['codigo']:
+                    continue
+                encontrados = ids_por_codigo.get((m['codigo'], m['periodo']), [])
+                if len(encontrados) == 1:
+                    m['producto_id'] = encontrados[0]
+                else:
+                    resultado = resultados_por_linea[m['linea']]
+                    resultado['success'] = False
+                    resultado['errores'].append(
+                        f'Código {m["codigo"]} no encontrado en {m["periodo"]}' if not encontrados
+                        else f'Código {m["codigo"]} es ambiguo en {m["periodo"]}; use producto_id'
+                    )
+
+        # 3. Bloquear una sola vez los productos afectados (orden fijo para evitar deadlocks)
+        ids_productos = sorted({m['producto_id'] for m in movimientos if m['producto_id']})
+        productos = {
+            p.id: p for p in Producto.query.filter(Producto.id.in_(ids_productos))
+            .order_by(Producto.id).with_for_update().all()
+        } if ids_productos else {}
+
+        # 4. Validar existencia y stock acumulado línea por línea
+        stock_proyectado = {pid: p.stock_actual for pid, p in productos.items()}
+        for m in movimientos:
+            resultado = resultados_por_linea[m['linea']]
+            producto = productos.get(m['producto_id'])
+            if m['producto_id'] and not producto:
+                resultado['success'] = False
+                resultado['errores'].append(f'Producto {m["producto_id"]} no existe')
+            if not producto or not resultado['success']:
+                continue
+            if not producto.activo:
+                resultado['success'] = False
+                resultado['errores'].append(f'El producto {producto.codigo} está inactivo')
+                continue
+            delta = m['cantidad'] if m['tipo_movimiento'] == 'ENTRADA' else -m['cantidad']
+            if stock_proyectado[producto.id] + delta < 0:
+                resultado['success'] = False
+                resultado['errores'].append(
+                    f'Stock insuficiente para {producto.codigo}. Disponible: {stock_proyectado[producto.id]}'
+                )
+                continue
+            stock_proyectado[producto.id] += delta
+            m['stock_despues'] = stock_proyectado[producto.id]
+
+        if not all(r['success'] for r in resultados):
+            db.session.rollback()
+            return jsonify({
+                'success': False,
+                'message': 'El lote tiene errores; no se registró ningún movimiento',
+                'resultados': resultados
+            }), 400
+
+        # 5. Insertar todos los movimientos en un INSERT multi-fila
+        ahora = colombia_now()
+        filas = []
+        for m in movimientos:
+            producto = productos[m['producto_id']]
+            filas.append({
+                'producto_id': producto.id,
+                'periodo': producto.periodo or get_periodo_actual(),
+                'tipo_movimiento': m['tipo_movimiento'],
+                'cantidad': m['cantidad'],
+                'precio_unitario': m['precio_unitario'],
+                'total': m['total'],
+                'motivo': m['motivo'],
+                'referencia': m['referencia'],
+                'responsable': m['responsable'],
+                'observaciones': m['observaciones'],
+                'fecha_movimiento': ahora,
+                'created_by': current_user.id,
+                'proveedor': m['proveedor'],
+                'tipo_ingreso': m['tipo_ingreso'],
+                'cantidad_empaques': m['cantidad_empaques'],
+                'contenido_por_empaque': m['contenido_por_empaque'],
+                'precio_por_empaque': m['precio_por_empaque'],
+            })
+            if m['tipo_movimiento'] == 'ENTRADA' and m['proveedor']:
+                producto.proveedor = m['proveedor']
+
+        ids_movimientos = db.session.execute(
+            db.insert(MovimientoInventario).returning(MovimientoInventario.id, sort_by_parameter_order=True),
+            filas
+        ).scalars().all()
+
+        # 6. Actualizar todos los stocks con un solo UPDATE
+        deltas = {}
+        for m in movimientos:
+            delta = m['cantidad'] if m['tipo_movimiento'] == 'ENTRADA' else -m['cantidad']
+            deltas[m['producto_id']] = deltas.get(m['producto_id'], 0) + delta
+        Producto.ajustar_stock_lote(deltas)
+        cache_referencias.invalidar('movimientos')
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Error al registrar el lote: {str(e)}'}), 500
+
+    for m, movimiento_id in zip(movimientos, ids_movimientos):
+        resultados_por_linea[m['linea']].update({
+            'movimiento_id': movimiento_id,
+            'producto_id': m['producto_id'],
+            'cantidad': m['cantidad'],
+            'stock_actual': m['stock_despues']
+        })
+
+    return jsonify({
+        'success': True,
+        'message': f'{len(movimientos)} movimientos registrados',
+        'resultados': resultados
+    })
+
 @app.route('/inventarios/movimientos/eliminar/<int:id>', methods=['DELETE'])
 @login_required
 def eliminar_movimiento_inventario(id):
     """Eliminar un movimiento de inventario y revertir el stock"""
     try:
         movimiento = MovimientoInventario.query.get_or_404(id)
-        producto = movimiento.producto
-        
+        producto_id = movimiento.producto_id
+
         # Guardar información para el mensaje
-        stock_anterior = producto.stock_actual
         cantidad = movimiento.cantidad
         tipo_movimiento = movimiento.tipo_movimiento
-        
-        # Revertir el stock
-        if tipo_movimiento == 'ENTRADA':
-            # Si era entrada, restar del stock
-            producto.stock_actual -= cantidad
-        elif tipo_movimiento == 'SALIDA':
-            # Si era salida, sumar al stock
-            producto.stock_actual += cantidad
-        
+
+        # Revertir el stock con un UPDATE atómico
+        # Si era entrada, restar del stock; si era salida, sumar al stock
+        delta = -cantidad if tipo_movimiento == 'ENTRADA' else cantidad
+        stock_actual = Producto.ajustar_stock(producto_id, delta, permitir_negativo=True)
+        stock_anterior = stock_actual - delta
+
         # Eliminar el movimiento
         db.session.delete(movimiento)
         db.session.commit()
-        
+
         return jsonify({
             'success': True,
             'message': 'Movimiento eliminado exitosamente',
             'stock_anterior': stock_anterior,
-            'stock_actual': producto.stock_actual,
+            'stock_actual': stock_actual,
             'cantidad_revertida': cantidad,
             'tipo_movimiento': tipo_movimiento
         })
@@ -5505,6 +6830,78 @@ def kardex_producto(id):
                          total_salidas=total_salidas,
                          saldo_final=saldo_final)
 
+@app.route('/api/solicitudes/pendientes')
+@login_required
+def api_solicitudes_pendientes():
+    """API liviana para el contador de solicitudes pendientes del menú"""
+    return jsonify({'success': True, 'pendientes': contar_solicitudes_pendientes_badge()})
+
+# ===== CACHÉ DE DATOS DE REFERENCIA =====
+
+@app.route('/api/admin/cache')
+@login_required
+def api_metricas_cache():
+    """Métricas de la caché de datos de referencia de este worker"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    return jsonify({'success': True, 'metricas': cache_referencias.metricas()})
+
+@app.route('/api/admin/bd')
+@login_required
+def api_metricas_bd():
+    """Métricas del pool de conexiones de este worker"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    return jsonify({'success': True, 'metricas': metricas_pool.resumen(db.engine.pool)})
+
+# ===== RENDIMIENTO POR ENDPOINT =====
+
+@app.route('/admin/rendimiento')
+@login_required
+def rendimiento():
+    """Duración p50/p95 y consultas por endpoint en las peticiones recientes de este worker"""
+    if not current_user.is_admin:
+        flash('No tienes permisos para acceder a esta sección', 'error')
+        return redirect(url_for('dashboard'))
+    return render_template('rendimiento.html',
+                         endpoints=instrumentacion.resumen(),
+                         desde=datetime.fromtimestamp(instrumentacion.inicio, COLOMBIA_TZ),
+                         pid=os.getpid(),
+                         consulta_lenta_ms=CONSULTA_LENTA_MS,
+                         umbral_n_mas_1=UMBRAL_N_MAS_1,
+                         metricas_bd=metricas_pool.resumen(db.engine.pool))
+
+@app.route('/api/admin/rendimiento')
+@login_required
+def api_rendimiento():
+    """Estadísticas por endpoint de este worker en JSON"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    return jsonify({'success': True, 'pid': os.getpid(), 'endpoints': instrumentacion.resumen(),
+                    'notificaciones': difusion_notificaciones.estado(),
+                    'usuarios': cache_usuarios.metricas(),
+                    'limites': limite_peticiones.metricas()})
+
+@app.route('/api/admin/rendimiento/reiniciar', methods=['POST'])
+@login_required
+def api_reiniciar_rendimiento():
+    """Descarta las mediciones acumuladas de este worker"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    instrumentacion.reiniciar()
+    return jsonify({'success': True, 'message': 'Mediciones reiniciadas'})
+
+@app.route('/api/admin/cache/limpiar', methods=['POST'])
+@login_required
+def api_limpiar_cache():
+    """Invalida todos los grupos de la caché en todos los workers"""
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': 'No autorizado'}), 403
+    cache_referencias.invalidar(*sorted({g for grupos in GRUPOS_CACHE_POR_MODELO.values() for g in grupos}))
+    db.session.commit()
+    cache_referencias.limpiar()
+    return jsonify({'success': True, 'message': 'Caché invalidada'})
+
 # ===== RUTAS PARA SISTEMA DE NOTIFICACIONES =====
 
 @app.route('/api/notificaciones')
@@ -5512,9 +6909,17 @@ def kardex_producto(id):
 def api_notificaciones():
     """API para obtener notificaciones"""
     no_leidas = request.args.get('no_leidas', 'false').lower() == 'true'
-    print(f"📡 API notificaciones llamada - no_leidas: {no_leidas}")
+    logger.info(f"📡 API notificaciones llamada - no_leidas: {no_leidas}", extra={'evento': 'api_notificaciones'})
     return obtener_notificaciones_api(no_leidas)
 
+@app.route('/api/notificaciones/novedades')
+@login_required
+def api_novedades_notificaciones():
+    """Notificaciones posteriores a las que ya tiene el navegador, desde la memoria del worker (sin consultar la BD)"""
+    desde = request.args.get('desde', 0, type=int)
+    cambio = request.args.get('cambio', 0, type=float)
+    return jsonify({'success': True, **difusion_notificaciones.novedades(desde, cambio)})
+
 @app.route('/api/notificaciones/<int:notificacion_id>/leida', methods=['POST'])
 @login_required
 def api_marcar_notificacion_leida(notificacion_id):
@@ -5530,12 +6935,13 @@ def api_marcar_todas_leidas():
         notificaciones = Notificacion.query.filter_by(leida=False).all()
         for notificacion in notificaciones:
             notificacion.leida = True
+        difusion_notificaciones.publicar_cambio(db.session, 'leida')
         db.session.commit()
-        print(f"✅ {len(notificaciones)} notificaciones marcadas como leídas en BD")
+        logger.info(f"✅ {len(notificaciones)} notificaciones marcadas como leídas en BD")
         return jsonify({'success': True, 'message': 'Todas las notificaciones marcadas como leídas'})
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error marcando todas como leídas: {e}")
+        logger.error(f"❌ Error marcando todas como leídas: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/notificaciones/<int:notificacion_id>/eliminar', methods=['DELETE'])
@@ -5547,14 +6953,15 @@ def api_eliminar_notificacion(notificacion_id):
         notificacion = Notificacion.query.get(notificacion_id)
         if notificacion:
             db.session.delete(notificacion)
+            difusion_notificaciones.publicar_cambio(db.session, 'eliminada', notificacion_id)
             db.session.commit()
-            print(f"🗑️ Notificación {notificacion_id} eliminada de la BD")
+            logger.info(f"🗑️ Notificación {notificacion_id} eliminada de la BD")
             return jsonify({'success': True, 'message': 'Notificación eliminada'})
         else:
             return jsonify({'success': False, 'message': 'Notificación no encontrada'}), 404
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error eliminando notificación: {e}")
+        logger.error(f"❌ Error eliminando notificación: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/notificaciones/limpiar', methods=['POST'])
@@ -5565,12 +6972,13 @@ def api_limpiar_notificaciones():
         # Eliminar todas las notificaciones de la base de datos
         count = Notificacion.query.count()
         Notificacion.query.delete()
+        difusion_notificaciones.publicar_cambio(db.session, 'limpiar')
         db.session.commit()
-        print(f"🗑️ {count} notificaciones eliminadas de la BD")
+        logger.info(f"🗑️ {count} notificaciones eliminadas de la BD")
         return jsonify({'success': True, 'message': f'{count} notificaciones eliminadas'})
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error limpiando notificaciones: {e}")
+        logger.error(f"❌ Error limpiando notificaciones: {e}")
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/notificaciones/crear', methods=['POST'])
@@ -5603,8 +7011,9 @@ def api_crear_notificacion():
 def servir_sonidos(filename):
     """Servir archivos de sonido"""
     try:
-        return send_file(f'sounds/{filename}', mimetype='audio/wav')
-    except FileNotFoundError:
+        # send_from_directory rechaza rutas fuera de sounds/; ETag y Last-Modified para revalidar
+        return send_from_directory(os.path.join(app.root_path, 'sounds'), filename, mimetype='audio/wav')
+    except NotFound:
         return jsonify({'error': 'Archivo de sonido no encontrado'}), 404
 
 @app.route('/test-notificacion')
@@ -5612,13 +7021,13 @@ def servir_sonidos(filename):
 def test_notificacion():
     """Ruta de prueba para notificaciones"""
     try:
-        print("🧪 TEST: Creando notificación de prueba...")
+        logger.info("🧪 TEST: Creando notificación de prueba...")
         notif_id = notificar_asistencia_entrada("Usuario Prueba", "12:00")
-        print(f"✅ TEST: Notificación creada con ID: {notif_id}")
+        logger.debug("✅ TEST: Notificación creada con ID: %s", notif_id)
         flash('Notificación de prueba creada', 'success')
         return redirect(url_for('dashboard'))
     except Exception as e:
-        print(f"❌ TEST: Error creando notificación: {e}")
+        logger.error(f"❌ TEST: Error creando notificación: {e}")
         flash(f'Error en prueba: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
 
@@ -5635,7 +7044,7 @@ def limpiar_bd_ruta():
         
         # Lista de tablas a eliminar
         tablas_a_eliminar = [
-            'asistencia', 'visitante', 'notificacion',
+            'asistencia', 'nomina_periodo', 'registro_kiosco', 'visitante', 'perfil_visitante', 'notificacion',
             'categoria_inventario', 'producto', 'movimiento_inventario', 'contrato_generado'
         ]
         
@@ -5664,6 +7073,14 @@ def limpiar_bd_ruta():
             except Exception as e:
                 mensajes.append(f"❌ Error con {tabla}: {str(e)}")
         
+        # Recrear las tablas eliminadas volviendo a aplicar todas las migraciones
+        try:
+            migraciones.reiniciar(db)
+            init_db()
+            mensajes.append("✅ Tablas recreadas con las migraciones")
+        except Exception as e:
+            mensajes.append(f"❌ Error recreando tablas: {str(e)}")
+        
         # Regenerar secuencias
         mensajes.append("🔄 Regenerando secuencias...")
         secuencias = [('user', 'id'), ('empleado', 'id'), ('contrato', 'id')]
@@ -5725,7 +7142,7 @@ def limpiar_todo_bd_ruta():
         
         # Lista de tablas a eliminar (TODO excepto user)
         tablas_a_eliminar = [
-            'asistencia', 'visitante', 'notificacion',
+            'asistencia', 'nomina_periodo', 'registro_kiosco', 'visitante', 'perfil_visitante', 'notificacion',
             'categoria_inventario', 'producto', 'movimiento_inventario', 
             'contrato_generado', 'contrato', 'empleado'
         ]
@@ -5756,6 +7173,14 @@ def limpiar_todo_bd_ruta():
             except Exception as e:
                 mensajes.append(f"❌ Error con {tabla}: {str(e)}")
         
+        # Recrear las tablas eliminadas volviendo a aplicar todas las migraciones
+        try:
+            migraciones.reiniciar(db)
+            init_db()
+            mensajes.append("✅ Tablas recreadas con las migraciones")
+        except Exception as e:
+            mensajes.append(f"❌ Error recreando tablas: {str(e)}")
+        
         # Regenerar secuencia de user
         mensajes.append("🔄 Regenerando secuencias...")
         try:
@@ -5808,27 +7233,24 @@ def limpiar_todo_bd_ruta():
 
 if __name__ == '__main__':
     try:
-        print("🚀 Iniciando aplicación...")
-        print("🔄 Llamando a init_db()...")
+        logger.info("🚀 Iniciando aplicación...")
+        logger.info("🔄 Llamando a init_db()...")
         init_db()
-        print("✅ init_db() completado exitosamente")
+        logger.info("✅ init_db() completado exitosamente")
         port = int(os.environ.get('PORT', 5000))
-        print(f"🌐 Servidor iniciado en puerto {port}")
+        logger.info(f"🌐 Servidor iniciado en puerto {port}")
         app.run(host='0.0.0.0', port=port, debug=False)
     except Exception as e:
-        print(f"❌ Error al iniciar la aplicación: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error al iniciar la aplicación: {str(e)}")
         raise
 
 # Configuración para gunicorn en producción
-if __name__ != '__main__':
-    # Inicializar la base de datos cuando se ejecuta con gunicorn
+if __name__ != '__main__' and not os.environ.get('MIGRACIONES_CLI'):
+    # Las migraciones se aplican en el despliegue (python -m migraciones); aquí solo se
+    # verifica la versión del esquema, por si se arrancó sin ese paso
     try:
-        print("🚀 Inicializando aplicación con gunicorn...")
+        logger.info("🚀 Inicializando aplicación con gunicorn...")
         init_db()
-        print("✅ Aplicación lista para gunicorn")
+        logger.info("✅ Aplicación lista para gunicorn")
     except Exception as e:
-        print(f"❌ Error al inicializar con gunicorn: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error al inicializar con gunicorn: {str(e)}")
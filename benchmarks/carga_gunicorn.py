@@ -0,0 +1,230 @@
+"""
+Rendimiento de gunicorn con cada tipo de worker
+
+Levanta gunicorn con gunicorn.conf.py y una base SQLite temporal (migraciones aplicadas)
+para cada configuración y mide throughput y latencia (p50/p95/p99) de:
+
+- las páginas públicas de los QR (asistencia, visitantes y solicitudes),
+- el dashboard con una sesión iniciada,
+- opcionalmente, las mismas rutas mientras otros clientes piden una exportación lenta
+  (--exportacion), que es el caso en el que los workers sync se quedan sin capacidad.
+
+    python benchmarks/carga_gunicorn.py
+    python benchmarks/carga_gunicorn.py --concurrencia 16 --duracion 15 --exportacion
+    python benchmarks/carga_gunicorn.py --configuraciones sync,gthread
+
+En SQLite las escrituras se serializan: las cifras sirven para comparar configuraciones
+entre sí, no como capacidad de producción (usar DATABASE_URL de PostgreSQL para eso).
+"""
+
+import argparse
+import hashlib
+import http.cookiejar
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIGURACIONES = {
+    'sync': {'GUNICORN_WORKER_CLASS': 'sync', 'GUNICORN_WORKERS': '2'},
+    'gthread': {'GUNICORN_WORKER_CLASS': 'gthread', 'GUNICORN_WORKERS': '2', 'GUNICORN_THREADS': '4'},
+    'gevent': {'GUNICORN_WORKER_CLASS': 'gevent', 'GUNICORN_WORKERS': '2', 'GUNICORN_WORKER_CONNECTIONS': '100'},
+}
+
+ADMIN = {'email': 'admin@floresjuncalito.com', 'password': 'nueva_contraseña_2024'}
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _token_publico():
+    secreto = os.environ.get('QR_TOKEN_GLOBAL', 'flores_juncalito_qr_global')
+    return hashlib.sha256(secreto.encode()).hexdigest()[:32]
+
+
+def _esperar_puerto(puerto, proceso, limite=30):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise SystemExit("❌ gunicorn terminó al arrancar (ver la salida de arriba)")
+        try:
+            with socket.create_connection(('127.0.0.1', puerto), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"❌ gunicorn no abrió el puerto {puerto} en {limite}s")
+
+
+def _cliente(base, con_sesion):
+    abridor = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    if con_sesion:
+        datos = urllib.parse.urlencode(ADMIN).encode()
+        abridor.open(f'{base}/login', data=datos, timeout=30).read()
+    return abridor
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+class Carga:
+    """Clientes concurrentes que piden una lista de rutas en ciclo durante un tiempo"""
+
+    def __init__(self, base, rutas, concurrencia, con_sesion):
+        self.base = base
+        self.rutas = rutas
+        self.concurrencia = concurrencia
+        self.con_sesion = con_sesion
+        self.latencias = {ruta: [] for ruta in rutas}
+        self.errores = 0
+        self.lock = threading.Lock()
+
+    def _trabajar(self, indice, fin):
+        abridor = _cliente(self.base, self.con_sesion)
+        i = indice
+        while time.monotonic() < fin:
+            ruta = self.rutas[i % len(self.rutas)]
+            i += 1
+            inicio = time.perf_counter()
+            try:
+                with abridor.open(self.base + ruta, timeout=60) as respuesta:
+                    respuesta.read()
+                ok = True
+            except Exception:
+                ok = False
+            duracion = (time.perf_counter() - inicio) * 1000
+            with self.lock:
+                if ok:
+                    self.latencias[ruta].append(duracion)
+                else:
+                    self.errores += 1
+
+    def ejecutar(self, duracion):
+        fin = time.monotonic() + duracion
+        hilos = [threading.Thread(target=self._trabajar, args=(i, fin), daemon=True)
+                 for i in range(self.concurrencia)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+
+def medir_configuracion(nombre, entorno_base, args):
+    puerto = _puerto_libre()
+    entorno = dict(entorno_base, PORT=str(puerto), **CONFIGURACIONES[nombre])
+    proceso = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '-c', 'gunicorn.conf.py'],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL
+    )
+    try:
+        _esperar_puerto(puerto, proceso)
+        base = f'http://127.0.0.1:{puerto}'
+        token = _token_publico()
+        publicas = [f'/asistencia-publica/{token}', f'/visitantes-publico/{token}',
+                    f'/solicitudes-publico/{token}']
+
+        # Calentar: importación perezosa de módulos y cachés de cada worker
+        calentamiento = Carga(base, publicas + ['/dashboard'], 4, True)
+        calentamiento.ejecutar(1)
+
+        lentas = None
+        if args.exportacion:
+            lentas = Carga(base, ['/reportes/asistencia/exportar?formato=xlsx&vista=registros'],
+                           args.clientes_lentos, True)
+            hilo_lento = threading.Thread(target=lentas.ejecutar, args=(args.duracion,), daemon=True)
+            hilo_lento.start()
+
+        mitad = max(1, args.concurrencia // 2)
+        publico = Carga(base, publicas, mitad, False)
+        panel = Carga(base, ['/dashboard'], max(1, args.concurrencia - mitad), True)
+        hilos = [threading.Thread(target=carga.ejecutar, args=(args.duracion,)) for carga in (publico, panel)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        if lentas is not None:
+            hilo_lento.join()
+        return {'publico': publico, 'dashboard': panel, 'exportacion': lentas}
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=35)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+
+
+def _resumen(carga, duracion):
+    latencias = [ms for valores in carga.latencias.values() for ms in valores]
+    return {
+        'peticiones': len(latencias),
+        'rps': len(latencias) / duracion,
+        'p50': statistics.median(latencias) if latencias else 0,
+        'p95': _percentil(latencias, 95),
+        'p99': _percentil(latencias, 99),
+        'errores': carga.errores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--configuraciones', default='sync,gthread,gevent',
+                        help='Lista separada por comas: sync, gthread, gevent')
+    parser.add_argument('--concurrencia', type=int, default=8, help='Clientes simultáneos')
+    parser.add_argument('--duracion', type=float, default=10, help='Segundos por configuración')
+    parser.add_argument('--exportacion', action='store_true',
+                        help='Mantener clientes pidiendo la exportación de asistencia a Excel')
+    parser.add_argument('--clientes-lentos', type=int, default=2)
+    args = parser.parse_args()
+
+    nombres = [n.strip() for n in args.configuraciones.split(',') if n.strip()]
+    for nombre in nombres:
+        if nombre not in CONFIGURACIONES:
+            raise SystemExit(f"❌ Configuración desconocida: {nombre}")
+    if 'gevent' in nombres:
+        if importlib.util.find_spec('gevent') is None:
+            print("⏭️ gevent no está instalado, se omite esa configuración")
+            nombres.remove('gevent')
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = dict(os.environ)
+        entorno.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(carpeta, 'benchmark.db')}")
+        entorno['LOG_NIVEL'] = 'WARNING'
+        entorno['PYTHONDONTWRITEBYTECODE'] = '1'
+        subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                       capture_output=True, check=True)
+
+        resultados = {}
+        for nombre in nombres:
+            print(f"🔄 {nombre}: {args.concurrencia} clientes durante {args.duracion:.0f}s...")
+            resultados[nombre] = medir_configuracion(nombre, entorno, args)
+
+    print()
+    print(f"{'configuración':<14}{'grupo':<13}{'peticiones':>11}{'req/s':>9}{'p50 ms':>9}"
+          f"{'p95 ms':>9}{'p99 ms':>9}{'errores':>9}")
+    for nombre, cargas in resultados.items():
+        for grupo, carga in cargas.items():
+            if carga is None:
+                continue
+            r = _resumen(carga, args.duracion)
+            print(f"{nombre:<14}{grupo:<13}{r['peticiones']:>11}{r['rps']:>9.1f}{r['p50']:>9.1f}"
+                  f"{r['p95']:>9.1f}{r['p99']:>9.1f}{r['errores']:>9}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
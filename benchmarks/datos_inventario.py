@@ -0,0 +1,217 @@
+"""
+Datos sintéticos de inventario para los benchmarks
+
+Genera N períodos × M productos (SKU) × K movimientos por producto y período, repartidos
+entre las tres categorías y con una mezcla de entradas por EMPAQUE e INDIVIDUAL. Los
+períodos terminan en el mes anterior al actual, que queda vacío para que
+copiar_inventario_mes_anterior() tenga algo que copiar. Cada período empieza con el
+saldo final del anterior y todos menos el último quedan cerrados, como en producción.
+
+Las filas se insertan con executemany por lotes (sin pasar por la sesión del ORM).
+Lo usa benchmarks/rendimiento_inventario.py; también se puede ejecutar solo contra una
+base vacía:
+
+    python benchmarks/datos_inventario.py --bd sqlite:////tmp/inventario.db --periodos 6 --productos 500
+
+Se niega a escribir en una base que ya tenga productos.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIAS = ('ALMACEN GENERAL', 'QUIMICOS', 'POSCOSECHA')
+UNIDADES = ('UNIDAD', 'KG', 'LITROS', 'GALON', 'CAJA')
+PROVEEDORES = ('AGROINSUMOS SAS', 'QUIMICOS DEL CAMPO', 'EMPAQUES ANDINOS', 'FERRETERIA CENTRAL', 'SIN PROVEEDOR')
+RESPONSABLES = ('BODEGA', 'POSCOSECHA', 'FUMIGACION', 'MANTENIMIENTO')
+TAMANO_LOTE = 1000
+
+
+def periodos_hasta_mes_anterior(cantidad, hoy=None):
+    """Los `cantidad` períodos YYYY-MM que terminan en el mes anterior a hoy, del más viejo al más nuevo"""
+    hoy = hoy or datetime.now()
+    año, mes = hoy.year, hoy.month
+    periodos = []
+    for _ in range(cantidad):
+        mes -= 1
+        if mes == 0:
+            año, mes = año - 1, 12
+        periodos.append(f"{año:04d}-{mes:02d}")
+    return periodos[::-1]
+
+
+def _insertar_por_lotes(conexion, tabla, filas):
+    for inicio in range(0, len(filas), TAMANO_LOTE):
+        conexion.execute(tabla.insert(), filas[inicio:inicio + TAMANO_LOTE])
+
+
+def _fecha_en_periodo(azar, periodo):
+    inicio = datetime.strptime(periodo, '%Y-%m')
+    return inicio + timedelta(days=azar.randint(0, 27), hours=azar.randint(6, 17), minutes=azar.randint(0, 59))
+
+
+def _movimientos_de_producto(azar, MovimientoInventario, producto_id, periodo, saldo, precio,
+                             cantidad, proporcion_empaque):
+    """(filas de movimientos, saldo final) sin dejar el saldo negativo"""
+    filas = []
+    fechas = sorted(_fecha_en_periodo(azar, periodo) for _ in range(cantidad))
+    for fecha in fechas:
+        salida = saldo > 0 and azar.random() < 0.45
+        fila = {
+            'producto_id': producto_id,
+            'periodo': periodo,
+            'fecha_movimiento': fecha,
+            'responsable': azar.choice(RESPONSABLES),
+            'tipo_ingreso': 'INDIVIDUAL',
+            # executemany necesita las mismas columnas en todas las filas
+            'cantidad_empaques': None, 'contenido_por_empaque': None, 'precio_por_empaque': None,
+            'proveedor': None,
+        }
+        if salida:
+            unidades = azar.randint(1, min(saldo, 40))
+            fila.update(tipo_movimiento='SALIDA', cantidad=unidades, precio_unitario=0, total=0,
+                        motivo='Consumo', referencia=f'OS-{azar.randint(1000, 9999)}')
+            saldo -= unidades
+        elif azar.random() < proporcion_empaque:
+            empaques = azar.randint(1, 10)
+            contenido = Decimal(azar.choice((6, 12, 20, 24, 50)))
+            precio_empaque = (precio * contenido).quantize(Decimal('0.01'))
+            unidades, precio_final, total = MovimientoInventario.calcular_valores(
+                'ENTRADA', 'EMPAQUE', 0, 0, empaques, contenido, precio_empaque
+            )
+            fila.update(tipo_movimiento='ENTRADA', tipo_ingreso='EMPAQUE', cantidad=unidades,
+                        precio_unitario=Decimal(precio_final).quantize(Decimal('0.01')), total=total,
+                        cantidad_empaques=empaques, contenido_por_empaque=contenido,
+                        precio_por_empaque=precio_empaque, motivo='Compra',
+                        referencia=f'FAC-{azar.randint(10000, 99999)}', proveedor=azar.choice(PROVEEDORES))
+            saldo += unidades
+        else:
+            unidades = azar.randint(1, 60)
+            fila.update(tipo_movimiento='ENTRADA', cantidad=unidades, precio_unitario=precio,
+                        total=precio * unidades, motivo='Compra',
+                        referencia=f'FAC-{azar.randint(10000, 99999)}', proveedor=azar.choice(PROVEEDORES))
+            saldo += unidades
+        filas.append(fila)
+    return filas, saldo
+
+
+def generar(db, Producto, MovimientoInventario, periodos=3, productos=300, movimientos=10,
+            proporcion_empaque=0.3, semilla=2024):
+    """Inserta los datos y devuelve un resumen con los períodos y el número de filas.
+
+    Cada SKU conserva su código en todos los períodos (PREFIJO-NNN, como reservar_codigos).
+    """
+    from cache_referencias import cache_referencias
+
+    azar = random.Random(semilla)
+    lista_periodos = periodos_hasta_mes_anterior(periodos)
+    prefijos = {'ALMACEN GENERAL': 'ALM', 'QUIMICOS': 'QUI', 'POSCOSECHA': 'POS'}
+
+    skus = []
+    consecutivos = dict.fromkeys(CATEGORIAS, 0)
+    for i in range(productos):
+        categoria = CATEGORIAS[i % len(CATEGORIAS)]
+        consecutivos[categoria] += 1
+        skus.append({
+            'codigo': f"{prefijos[categoria]}-{consecutivos[categoria]:03d}",
+            'nombre': f"PRODUCTO {categoria.split()[0]} {consecutivos[categoria]:05d}",
+            'categoria': categoria,
+            'unidad_medida': azar.choice(UNIDADES),
+            'precio_unitario': Decimal(azar.randint(500, 250000)) / 100,
+            'stock_minimo': azar.randint(0, 20),
+            'ubicacion': f"ESTANTE {azar.randint(1, 30)}",
+            'proveedor': azar.choice(PROVEEDORES),
+            'saldo': azar.randint(0, 200),
+        })
+
+    total_movimientos = 0
+    with db.engine.begin() as conexion:
+        for indice, periodo in enumerate(lista_periodos):
+            ultimo = indice == len(lista_periodos) - 1
+            creado = datetime.strptime(periodo, '%Y-%m')
+            _insertar_por_lotes(conexion, Producto.__table__, [{
+                'codigo': sku['codigo'], 'nombre': sku['nombre'], 'categoria': sku['categoria'],
+                'periodo': periodo, 'unidad_medida': sku['unidad_medida'],
+                'precio_unitario': sku['precio_unitario'], 'stock_minimo': sku['stock_minimo'],
+                'saldo_inicial': sku['saldo'], 'stock_actual': sku['saldo'],
+                'ubicacion': sku['ubicacion'], 'proveedor': sku['proveedor'],
+                'descripcion': 'Generado para benchmark', 'activo': True, 'mes_cerrado': not ultimo,
+                'created_at': creado, 'updated_at': creado,
+            } for sku in skus])
+
+            ids = dict(conexion.execute(
+                db.select(Producto.codigo, Producto.id).where(Producto.periodo == periodo)
+            ).all())
+            filas = []
+            saldos_finales = []
+            for sku in skus:
+                movs, saldo_final = _movimientos_de_producto(
+                    azar, MovimientoInventario, ids[sku['codigo']], periodo, sku['saldo'],
+                    sku['precio_unitario'], movimientos, proporcion_empaque
+                )
+                filas.extend(movs)
+                saldos_finales.append({'id_producto': ids[sku['codigo']], 'saldo': saldo_final})
+                sku['saldo'] = saldo_final
+            _insertar_por_lotes(conexion, MovimientoInventario.__table__, filas)
+            total_movimientos += len(filas)
+
+            conexion.execute(
+                db.update(Producto.__table__)
+                .where(Producto.__table__.c.id == db.bindparam('id_producto'))
+                .values(stock_actual=db.bindparam('saldo')),
+                saldos_finales
+            )
+        # Las inserciones no pasan por la sesión: avisar a las cachés de los workers
+        cache_referencias.invalidar('productos', 'movimientos', conexion=conexion)
+
+    return {
+        'periodos': lista_periodos,
+        'productos_por_periodo': productos,
+        'productos': productos * len(lista_periodos),
+        'movimientos': total_movimientos,
+        'proporcion_empaque': proporcion_empaque,
+        'semilla': semilla,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bd', required=True, help='URL de la base (sqlite:///... o postgresql://...)')
+    parser.add_argument('--periodos', type=int, default=3)
+    parser.add_argument('--productos', type=int, default=300, help='SKU por período')
+    parser.add_argument('--movimientos', type=int, default=10, help='Movimientos por producto y período')
+    parser.add_argument('--proporcion-empaque', type=float, default=0.3,
+                        help='Fracción de las entradas registradas por EMPAQUE')
+    parser.add_argument('--semilla', type=int, default=2024)
+    args = parser.parse_args()
+
+    entorno = dict(os.environ, DATABASE_URL=args.bd, LOG_NIVEL='ERROR', PYTHONDONTWRITEBYTECODE='1')
+    subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                   capture_output=True, check=True)
+    os.environ.update(entorno)
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+    import app as aplicacion
+
+    with aplicacion.app.app_context():
+        if aplicacion.db.session.query(aplicacion.Producto.id).first() is not None:
+            print("❌ La base ya tiene productos; usa una base vacía")
+            return 1
+        inicio = time.perf_counter()
+        resumen = generar(aplicacion.db, aplicacion.Producto, aplicacion.MovimientoInventario,
+                          args.periodos, args.productos, args.movimientos,
+                          args.proporcion_empaque, args.semilla)
+    print(f"✅ {resumen['productos']} productos y {resumen['movimientos']} movimientos "
+          f"({resumen['periodos'][0]} a {resumen['periodos'][-1]}) en {time.perf_counter() - inicio:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
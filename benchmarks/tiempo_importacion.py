@@ -0,0 +1,133 @@
+"""
+Tiempo de importación de app.py (lo que paga cada worker de gunicorn al arrancar)
+
+Prepara una base SQLite temporal con las migraciones aplicadas, así la importación
+medida solo hace la consulta de versión, igual que un worker en producción. Luego
+ejecuta `python -X importtime -c "import app"` varias veces y muestra la mediana y
+los módulos que más tardan.
+
+    python benchmarks/tiempo_importacion.py
+    python benchmarks/tiempo_importacion.py --repeticiones 5 --limite-ms 1500
+
+Además importa app.py en un proceso aparte y revisa sys.modules y los hilos vivos:
+termina con código 1 si se cargó alguno de los módulos pesados de PESADOS o si quedó un
+hilo en segundo plano corriendo. Con --limite-ms también falla si la mediana supera el
+límite (útil en CI).
+
+La reestructuración de app.py en una fábrica de aplicación con blueprints no está
+hecha; esta verificación cuida que la importación siga siendo liviana mientras tanto.
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINEA_IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# Módulos pesados que no deben cargarse al importar app.py
+PESADOS = ('openpyxl', 'qrcode', 'PIL', 'pandas', 'numpy', 'playsound')
+
+
+def _entorno(ruta_bd):
+    entorno = dict(os.environ)
+    entorno['DATABASE_URL'] = f'sqlite:///{ruta_bd}'
+    entorno['PYTHONDONTWRITEBYTECODE'] = '1'
+    return entorno
+
+
+def medir(entorno):
+    """(total_ms, {modulo_de_primer_nivel: acumulado_ms}) de una importación"""
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        print(resultado.stderr[-2000:])
+        raise SystemExit("❌ No se pudo importar app.py")
+
+    modulos = {}
+    total = 0
+    for linea in resultado.stderr.splitlines():
+        coincidencia = LINEA_IMPORTTIME.match(linea)
+        if not coincidencia:
+            continue
+        acumulado_us = int(coincidencia.group(2))
+        nivel = len(coincidencia.group(3)) // 2
+        modulo = coincidencia.group(4)
+        if nivel == 0:
+            total += acumulado_us
+        modulos[modulo] = max(modulos.get(modulo, 0), acumulado_us / 1000)
+    return total / 1000, modulos
+
+
+def verificar_importacion(entorno):
+    """(módulos pesados en sys.modules, hilos vivos además del principal) después de `import app`"""
+    # El QueueListener del log asíncrono de registro.py es el único hilo esperado
+    codigo = (
+        "import json, sys, threading, logging.handlers; import app; "
+        "print(json.dumps({'modulos': sorted(sys.modules), 'hilos': ["
+        "h.name for h in threading.enumerate() if h is not threading.main_thread() and not "
+        "isinstance(getattr(getattr(h, '_target', None), '__self__', None), logging.handlers.QueueListener)]}))"
+    )
+    resultado = subprocess.run([sys.executable, '-c', codigo], cwd=RAIZ, env=entorno,
+                               capture_output=True, text=True)
+    if resultado.returncode != 0:
+        print(resultado.stderr[-2000:])
+        raise SystemExit("❌ No se pudo importar app.py")
+    datos = json.loads(resultado.stdout.strip().splitlines()[-1])
+    pesados = sorted({m.split('.')[0] for m in datos['modulos']} & set(PESADOS))
+    return pesados, datos['hilos']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--top', type=int, default=15, help='Módulos más lentos a mostrar')
+    parser.add_argument('--limite-ms', type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = _entorno(os.path.join(carpeta, 'benchmark.db'))
+        # Aplicar migraciones antes de medir (no cuenta en el tiempo)
+        subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                       capture_output=True, check=True)
+
+        mediciones = [medir(entorno) for _ in range(args.repeticiones)]
+        pesados, hilos = verificar_importacion(entorno)
+
+    totales = [total for total, _ in mediciones]
+    mediana = statistics.median(totales)
+    _, modulos = mediciones[-1]
+
+    print(f"⏱️ import app: mediana {mediana:.0f} ms "
+          f"(min {min(totales):.0f}, max {max(totales):.0f}, {args.repeticiones} repeticiones)")
+    print("📦 Módulos más lentos (acumulado, última medición):")
+    for modulo, ms in sorted(modulos.items(), key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"   {ms:8.1f} ms  {modulo}")
+
+    fallas = 0
+    if pesados:
+        print(f"❌ Módulos pesados cargados al importar: {', '.join(pesados)}")
+        fallas += 1
+    else:
+        print("✅ Ningún módulo pesado se carga al importar")
+    if hilos:
+        print(f"❌ Hilos en segundo plano iniciados al importar: {', '.join(hilos)}")
+        fallas += 1
+    else:
+        print("✅ Ningún hilo en segundo plano se inicia al importar")
+
+    if args.limite_ms is not None and mediana > args.limite_ms:
+        print(f"❌ La mediana supera el límite de {args.limite_ms:.0f} ms")
+        fallas += 1
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
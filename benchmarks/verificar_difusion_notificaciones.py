@@ -0,0 +1,135 @@
+"""
+Verificación de la reconexión LISTEN de las notificaciones
+
+El hilo de difusion_notificaciones escucha pg_notify en una conexión propia. Si esa
+conexión se cae, lo publicado mientras tanto no llega por el canal: al reconectar el
+worker debe leer de la base las notificaciones nuevas (aunque sean más de MAX_RECIENTES)
+y aplicar las leídas y eliminadas, avisando a los navegadores que recarguen la lista.
+
+No necesita PostgreSQL: usa una base SQLite temporal para las consultas y reemplaza la
+conexión LISTEN por una falsa que entrega un aviso, se cae y vuelve a conectar.
+
+    python benchmarks/verificar_difusion_notificaciones.py
+
+Termina con código 1 si alguna comprobación falla.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ConexionFalsa:
+    """Imita la conexión psycopg de _escuchar: execute (LISTEN) y notifies"""
+
+    def __init__(self, avisos, al_terminar):
+        self.avisos = avisos
+        self.al_terminar = al_terminar
+        self.ordenes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, orden):
+        self.ordenes.append(orden)
+
+    def notifies(self, timeout=None):
+        for payload in self.avisos:
+            yield type('Aviso', (), {'payload': payload})
+        self.al_terminar()
+
+
+def main():
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(carpeta, 'verificacion.db')}",
+                       LOG_NIVEL='ERROR', PYTHONDONTWRITEBYTECODE='1')
+        subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                       capture_output=True, check=True)
+        os.environ.update(entorno)
+        sys.path.insert(0, RAIZ)
+        os.chdir(RAIZ)
+        import app as aplicacion
+        from difusion_notificaciones import MAX_RECIENTES, DifusionNotificaciones, como_dict
+
+        db, Notificacion = aplicacion.db, aplicacion.Notificacion
+        with aplicacion.app.app_context():
+            iniciales = [Notificacion(titulo=f'Inicial {i}', mensaje='x') for i in range(3)]
+            db.session.add_all(iniciales)
+            db.session.commit()
+            leida_id, eliminada_id, intacta_id = [n.id for n in iniciales]
+
+        # Un worker aparte, sin los eventos de sesión: solo se entera por el canal o la base
+        difusion = DifusionNotificaciones()
+        difusion.app, difusion.db, difusion.Notificacion = aplicacion.app, db, Notificacion
+        with aplicacion.app.app_context():
+            difusion.motor = db.engine
+
+        estado = {}
+
+        def memoria():
+            with difusion.lock:
+                return {datos['id']: datos['leida'] for _, datos in difusion.recientes}
+
+        def primera_caida():
+            # Mientras la conexión está caída otro worker marca una como leída y elimina otra
+            with aplicacion.app.app_context():
+                db.session.get(Notificacion, leida_id).leida = True
+                db.session.delete(db.session.get(Notificacion, eliminada_id))
+                db.session.commit()
+            estado['cambio_antes'] = difusion.ultimo_cambio
+            raise ConnectionError('conexión LISTEN perdida (simulada)')
+
+        def segunda_caida():
+            estado['memoria'] = memoria()
+            estado['cambio_despues'] = difusion.ultimo_cambio
+            # Esta vez se acumulan más notificaciones de las que caben en memoria
+            with aplicacion.app.app_context():
+                db.session.add_all(Notificacion(titulo=f'Durante la caída {i}', mensaje='x')
+                                   for i in range(MAX_RECIENTES + 50))
+                db.session.commit()
+                estado['maximo'] = db.session.query(db.func.max(Notificacion.id)).scalar()
+            raise ConnectionError('conexión LISTEN perdida (simulada)')
+
+        with aplicacion.app.app_context():
+            nueva = Notificacion(titulo='Por el canal', mensaje='x')
+            db.session.add(nueva)
+            db.session.commit()
+            aviso = json.dumps({'evento': 'nueva', **como_dict(nueva)})
+
+        conexiones = [ConexionFalsa([aviso], primera_caida), ConexionFalsa([], segunda_caida),
+                      ConexionFalsa([], difusion.detener.set)]
+        pendientes = iter(conexiones)
+        difusion._conectar = lambda: next(pendientes)
+        difusion._escuchar()
+
+        tras_primera = estado.get('memoria', {})
+        en_memoria = memoria()
+        comprobaciones = [
+            ('se reconectó y escuchó el canal en cada conexión', all(c.ordenes for c in conexiones)),
+            ('el aviso del canal llegó a memoria', nueva.id in tras_primera),
+            ('la leída durante la caída se ve leída', tras_primera.get(leida_id) is True),
+            ('la eliminada durante la caída salió de memoria', eliminada_id not in tras_primera),
+            ('la intacta sigue sin leer', tras_primera.get(intacta_id) is False),
+            ('los navegadores recargan la lista',
+             estado.get('cambio_despues', 0) > estado.get('cambio_antes', 0)),
+            ('ultimo_id llegó a max(id) pese a superar MAX_RECIENTES', difusion.ultimo_id == estado.get('maximo')),
+            ('memoria limitada a MAX_RECIENTES', len(en_memoria) == MAX_RECIENTES),
+            ('la última notificación quedó en memoria', estado.get('maximo') in en_memoria),
+        ]
+
+    fallas = 0
+    for nombre, correcto in comprobaciones:
+        print(f"{'✅' if correcto else '❌'} {nombre}")
+        fallas += not correcto
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""
+Verificación del GET condicional de las listas de inventario
+
+Las listas de productos y movimientos responden 304 mientras no cambien las versiones
+de cache_referencias de sus grupos. El stock se cambia con UPDATE directos
+(Producto.ajustar_stock y ajustar_stock_lote) que el after_flush no ve, así que aquí se
+comprueba que cada forma de registrar un movimiento cambia el ETag de las dos listas.
+
+Usa una base SQLite temporal con las migraciones aplicadas y el cliente de pruebas de Flask:
+
+    python benchmarks/verificar_etag_inventario.py
+
+Termina con código 1 si alguna lista sigue respondiendo 304 después de un movimiento.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN = {'email': 'admin@floresjuncalito.com', 'password': 'nueva_contraseña_2024'}
+LISTAS = ('/inventarios/productos', '/inventarios/movimientos')
+
+
+def _etag(cliente, ruta, anterior=None):
+    """(estado, etag) de la lista, enviando If-None-Match si se indica un ETag anterior"""
+    cabeceras = {'If-None-Match': f'W/"{anterior}"'} if anterior else {}
+    respuesta = cliente.get(ruta, headers=cabeceras)
+    return respuesta.status_code, respuesta.get_etag()[0]
+
+
+def _sin_flashes(cliente):
+    # Con mensajes pendientes la lista se renderiza completa y no se puede medir el 304
+    with cliente.session_transaction() as sesion:
+        sesion.pop('_flashes', None)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(carpeta, 'verificacion.db')}",
+                       LOG_NIVEL='ERROR', PYTHONDONTWRITEBYTECODE='1')
+        subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                       capture_output=True, check=True)
+        os.environ.update(entorno)
+        sys.path.insert(0, RAIZ)
+        os.chdir(RAIZ)
+        import app as aplicacion
+
+        with aplicacion.app.app_context():
+            producto = aplicacion.Producto(
+                codigo='ALM-001', nombre='PRODUCTO ETAG', categoria='ALMACEN GENERAL',
+                periodo=aplicacion.get_periodo_actual(), unidad_medida='UNIDAD',
+                saldo_inicial=100, stock_actual=100
+            )
+            aplicacion.db.session.add(producto)
+            aplicacion.db.session.commit()
+            producto_id = producto.id
+
+        cliente = aplicacion.app.test_client()
+        if cliente.post('/login', data=ADMIN).status_code != 302:
+            print("❌ No se pudo iniciar sesión como administrador")
+            return 1
+
+        movimientos = {
+            'salida individual': lambda: cliente.post('/inventarios/movimientos/nuevo', data={
+                'producto_id': producto_id, 'tipo_movimiento': 'SALIDA', 'cantidad': 7,
+            }),
+            'salida por lote': lambda: cliente.post('/inventarios/movimientos/lote', json={
+                'lineas': [{'producto_id': producto_id, 'tipo_movimiento': 'SALIDA', 'cantidad': 5}],
+            }),
+        }
+
+        fallas = 0
+        for nombre, registrar in movimientos.items():
+            _sin_flashes(cliente)
+            etags = {ruta: _etag(cliente, ruta)[1] for ruta in LISTAS}
+            for ruta, etag in etags.items():
+                estado, _ = _etag(cliente, ruta, etag)
+                if estado != 304:
+                    print(f"❌ {ruta} no respondió 304 sin cambios (estado {estado})")
+                    fallas += 1
+
+            respuesta = registrar()
+            if respuesta.status_code not in (200, 302):
+                print(f"❌ {nombre}: el movimiento falló con estado {respuesta.status_code}")
+                fallas += 1
+                continue
+            _sin_flashes(cliente)
+
+            for ruta, etag in etags.items():
+                estado, nuevo = _etag(cliente, ruta, etag)
+                if estado == 304 or nuevo == etag:
+                    print(f"❌ {nombre}: {ruta} sigue con el ETag anterior")
+                    fallas += 1
+                else:
+                    print(f"✅ {nombre}: {ruta} cambió de ETag")
+
+        with aplicacion.app.app_context():
+            stock = aplicacion.db.session.get(aplicacion.Producto, producto_id).stock_actual
+        if stock != 88:
+            print(f"❌ Stock final {stock}, se esperaba 88")
+            fallas += 1
+
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
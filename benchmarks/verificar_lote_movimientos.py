@@ -0,0 +1,101 @@
+"""
+Verificación de los lotes de movimientos mal formados
+
+/inventarios/movimientos/lote recibe JSON o CSV de otros sistemas. Un cuerpo o una línea
+con la forma equivocada debe responder 400 con el error (por línea cuando se puede), nunca
+500, y no registrar ningún movimiento. Aquí se envían esos casos y un lote válido de control.
+
+Usa una base SQLite temporal con las migraciones aplicadas y el cliente de pruebas de Flask:
+
+    python benchmarks/verificar_lote_movimientos.py
+
+Termina con código 1 si algún caso no responde lo esperado.
+"""
+
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN = {'email': 'admin@floresjuncalito.com', 'password': 'nueva_contraseña_2024'}
+RUTA = '/inventarios/movimientos/lote'
+
+
+def _casos(producto_id):
+    """(nombre, argumentos del POST, estado esperado)"""
+    salida = {'producto_id': producto_id, 'tipo_movimiento': 'SALIDA', 'cantidad': 1}
+    csv_latin1 = 'codigo;tipo_movimiento;cantidad;proveedor;motivo\nALM-001;ENTRADA;3;X;Año\n'.encode('latin-1')
+    return [
+        ('cuerpo con lista', {'json': [salida]}, 400),
+        ('cuerpo con texto', {'json': 'lineas'}, 400),
+        ('lineas no es lista', {'json': {'lineas': {'0': salida}}}, 400),
+        ('dato general no escalar', {'json': {'periodo': ['2025-01'], 'lineas': [salida]}}, 400),
+        ('línea que no es objeto', {'json': {'lineas': ['basura', 5, None, salida]}}, 400),
+        ('codigo numérico inexistente', {'json': {'lineas': [
+            {'codigo': 5, 'tipo_movimiento': 'SALIDA', 'cantidad': 1}]}}, 400),
+        ('periodo numérico', {'json': {'lineas': [
+            {'codigo': 'ALM-001', 'periodo': 202501, 'tipo_movimiento': 'SALIDA', 'cantidad': 1}]}}, 400),
+        ('tipo_movimiento numérico', {'json': {'lineas': [dict(salida, tipo_movimiento=1)]}}, 400),
+        ('texto como objeto', {'json': {'lineas': [dict(salida, motivo={'a': 1})]}}, 400),
+        ('producto_id no numérico', {'json': {'lineas': [dict(salida, producto_id='abc')]}}, 400),
+        ('cantidad como lista', {'json': {'lineas': [dict(salida, cantidad=[1])]}}, 400),
+        ('CSV que no es UTF-8', {'data': {'archivo_csv': (io.BytesIO(csv_latin1), 'lote.csv')},
+                                'content_type': 'multipart/form-data'}, 400),
+        ('lote válido', {'json': {'referencia': 12345, 'lineas': [salida]}}, 200),
+    ]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as carpeta:
+        entorno = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(carpeta, 'verificacion.db')}",
+                       LOG_NIVEL='ERROR', PYTHONDONTWRITEBYTECODE='1')
+        subprocess.run([sys.executable, '-m', 'migraciones'], cwd=RAIZ, env=entorno,
+                       capture_output=True, check=True)
+        os.environ.update(entorno)
+        sys.path.insert(0, RAIZ)
+        os.chdir(RAIZ)
+        import app as aplicacion
+
+        Producto, MovimientoInventario = aplicacion.Producto, aplicacion.MovimientoInventario
+        with aplicacion.app.app_context():
+            producto = Producto(
+                codigo='ALM-001', nombre='PRODUCTO LOTE', categoria='ALMACEN GENERAL',
+                periodo=aplicacion.get_periodo_actual(), unidad_medida='UNIDAD',
+                saldo_inicial=10, stock_actual=10
+            )
+            aplicacion.db.session.add(producto)
+            aplicacion.db.session.commit()
+            producto_id = producto.id
+
+        cliente = aplicacion.app.test_client()
+        if cliente.post('/login', data=ADMIN).status_code != 302:
+            print("❌ No se pudo iniciar sesión como administrador")
+            return 1
+
+        fallas = 0
+        for nombre, argumentos, esperado in _casos(producto_id):
+            with aplicacion.app.app_context():
+                antes = MovimientoInventario.query.count()
+            respuesta = cliente.post(RUTA, **argumentos)
+            with aplicacion.app.app_context():
+                registrados = MovimientoInventario.query.count() - antes
+            cuerpo = respuesta.get_json(silent=True) or {}
+            detalle = cuerpo.get('message', '')
+            errores = [f"línea {r['linea']}: {', '.join(r['errores'])}"
+                       for r in cuerpo.get('resultados') or [] if r['errores']]
+            if errores:
+                detalle += ' | ' + '; '.join(errores)
+            if respuesta.status_code != esperado or registrados != (1 if esperado == 200 else 0):
+                print(f"❌ {nombre}: estado {respuesta.status_code} (esperado {esperado}), "
+                      f"{registrados} movimientos registrados. {detalle}")
+                fallas += 1
+            else:
+                print(f"✅ {nombre}: {respuesta.status_code} {detalle}")
+
+    return 1 if fallas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
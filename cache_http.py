@@ -0,0 +1,203 @@
+"""
+Compresión de respuestas y caché HTTP
+Varios usuarios trabajan desde el campo con datos móviles, y las listas de inventario y
+visitantes pesan cientos de KB de HTML sin comprimir.
+
+- Las respuestas HTML, JSON, CSS y JS de más de COMPRESION_MINIMO bytes se comprimen
+  con brotli (si el paquete está instalado y el navegador lo acepta) o con gzip.
+- Las páginas de listas usan GET condicional: el ETag sale de las versiones de
+  cache_referencias de las tablas que muestran, así que mientras nadie escriba en ellas
+  el navegador recibe un 304 sin que se consulte ni se renderice nada más.
+- Los archivos de static/ y sounds/ llevan en la URL un parámetro v con la fecha de
+  modificación del archivo y se sirven con caché inmutable de un año.
+"""
+
+import os
+import gzip
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from cache_referencias import cache_referencias
+from registro import obtener_logger
+
+logger = obtener_logger('cache_http')
+
+_brotli = None
+
+
+def _importar_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+            logger.info("ℹ️ brotli no está instalado, las respuestas se comprimen solo con gzip")
+    return _brotli
+
+
+TIPOS_COMPRIMIBLES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'image/svg+xml'
+}
+
+# Endpoints de archivos que se versionan por fecha de modificación: endpoint -> carpeta
+CARPETAS_VERSIONADAS = {
+    'static': 'static',
+    'servir_sonidos': 'sounds',
+}
+
+UN_ANO = 365 * 24 * 3600
+COLOMBIA_TZ = timezone(timedelta(hours=-5))
+
+
+def _entero(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        logger.warning(f"⚠️ {nombre} inválido, usando {defecto}")
+        return defecto
+
+
+class CacheHTTP:
+    def __init__(self):
+        self.minimo = _entero('COMPRESION_MINIMO', 1024)
+        self.nivel_gzip = _entero('COMPRESION_NIVEL_GZIP', 6)
+        self.nivel_brotli = _entero('COMPRESION_NIVEL_BROTLI', 5)
+        self.versiones_archivos = {}  # ruta -> versión, por worker (los archivos no cambian sin redesplegar)
+        self.raiz = None
+        self.version_despliegue = ''
+
+    def init_app(self, app):
+        self.raiz = app.root_path
+        self.version_despliegue = self._calcular_version_despliegue(app)
+        app.url_defaults(self._versionar_url)
+        app.after_request(self._cabeceras_archivos)
+        app.after_request(self._comprimir)
+        app.extensions['cache_http'] = self
+
+    def _calcular_version_despliegue(self, app):
+        """Cambia con cada despliegue, para que un 304 nunca sirva HTML de plantillas viejas"""
+        commit = os.environ.get('RAILWAY_GIT_COMMIT_SHA')
+        if commit:
+            return commit[:12]
+        carpeta = os.path.join(app.root_path, app.template_folder or 'templates')
+        rutas = [os.path.join(app.root_path, 'app.py')]
+        for directorio, _, archivos in os.walk(carpeta):
+            rutas.extend(os.path.join(directorio, archivo) for archivo in archivos)
+        return format(int(max((os.path.getmtime(r) for r in rutas if os.path.exists(r)), default=0)), 'x')
+
+    # Archivos estáticos
+
+    def _version_archivo(self, carpeta, nombre):
+        ruta = os.path.join(self.raiz, carpeta, nombre)
+        version = self.versiones_archivos.get(ruta)
+        if version is None:
+            try:
+                version = format(int(os.path.getmtime(ruta)), 'x')
+            except OSError:
+                return None
+            self.versiones_archivos[ruta] = version
+        return version
+
+    def _versionar_url(self, endpoint, values):
+        carpeta = CARPETAS_VERSIONADAS.get(endpoint)
+        if carpeta and 'filename' in values and 'v' not in values:
+            version = self._version_archivo(carpeta, values['filename'])
+            if version:
+                values['v'] = version
+
+    def _cabeceras_archivos(self, response):
+        # Las URL sin versión (escritas a mano) conservan la revalidación por ETag de send_file
+        if (request.endpoint in CARPETAS_VERSIONADAS and request.args.get('v')
+                and response.status_code in (200, 304)):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = UN_ANO
+            response.cache_control.immutable = True
+        return response
+
+    # Compresión
+
+    def _codificacion_aceptada(self):
+        aceptadas = request.accept_encodings
+        if aceptadas['br'] and _importar_brotli():
+            return 'br'
+        if aceptadas['gzip']:
+            return 'gzip'
+        return None
+
+    def _comprimir(self, response):
+        if (response.mimetype not in TIPOS_COMPRIMIBLES
+                or response.status_code != 200
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or request.method == 'HEAD'):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if response.cache_control.no_transform:
+            return response
+        codificacion = self._codificacion_aceptada()
+        if codificacion is None:
+            return response
+        datos = response.get_data()
+        if len(datos) < self.minimo:
+            return response
+
+        if codificacion == 'br':
+            comprimidos = _brotli.compress(datos, quality=self.nivel_brotli)
+        else:
+            comprimidos = gzip.compress(datos, compresslevel=self.nivel_gzip, mtime=0)
+        response.set_data(comprimidos)
+        response.headers['Content-Encoding'] = codificacion
+        # El ETag fuerte identifica los bytes sin comprimir: pasa a débil
+        etag, debil = response.get_etag()
+        if etag and not debil:
+            response.set_etag(etag, weak=True)
+        return response
+
+    # GET condicional de páginas
+
+    def pagina_condicional(self, *grupos):
+        """Decorador: responde 304 si no cambió ninguna tabla de los grupos de caché indicados.
+
+        El ETag combina la URL con sus filtros, el usuario, la fecha, el despliegue y las
+        versiones de los grupos. Se omite si hay mensajes flash pendientes: solo los
+        muestra el HTML completo.
+        """
+        def decorador(vista):
+            @wraps(vista)
+            def envoltura(*args, **kwargs):
+                versiones = cache_referencias.versiones(grupos)
+                if versiones is None or session.get('_flashes'):
+                    return vista(*args, **kwargs)
+
+                base = '|'.join([
+                    request.full_path, str(current_user.get_id()), str(current_user.is_admin),
+                    datetime.now(COLOMBIA_TZ).date().isoformat(), self.version_despliegue,
+                    *(f'{grupo}:{version}' for grupo, version in versiones.items())
+                ])
+                etag = hashlib.sha1(base.encode('utf-8')).hexdigest()[:20]
+
+                if request.if_none_match.contains_weak(etag):
+                    response = current_app.response_class(status=304)
+                else:
+                    response = make_response(vista(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                response.set_etag(etag, weak=True)
+                response.vary.add('Accept-Encoding')
+                # privada: depende del usuario; no-cache: revalidar siempre con el ETag
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+            return envoltura
+        return decorador
+
+
+cache_http = CacheHTTP()
@@ -0,0 +1,140 @@
+"""
+Caché en memoria para datos de referencia
+Períodos, responsables, empleados activos y productos activos para selectores.
+
+Cada valor se guarda por grupo con un TTL. Las escrituras invalidan el grupo
+incrementando su versión en la tabla version_cache, así todos los workers de
+gunicorn se enteran: cada request lee las versiones una sola vez (flask.g) y
+descarta las entradas guardadas con una versión anterior.
+"""
+
+import os
+import time
+import threading
+from flask import g, has_request_context
+from sqlalchemy import text
+from registro import obtener_logger
+
+logger = obtener_logger('cache_referencias')
+
+TTL_POR_DEFECTO = int(os.environ.get('CACHE_REFERENCIAS_TTL', 300))
+
+
+class CacheReferencias:
+    def __init__(self, ttl=TTL_POR_DEFECTO):
+        self.ttl = ttl
+        self.db = None
+        self.entradas = {}  # (grupo, clave) -> (valor, expira, version)
+        self.metricas_grupo = {}  # grupo -> {'hits', 'misses', 'invalidaciones'}
+        self.lock = threading.Lock()
+
+    def init_app(self, app, db):
+        """Asocia la caché con la aplicación y la base de datos"""
+        self.db = db
+        app.extensions['cache_referencias'] = self
+
+    def crear_tabla(self):
+        """Crea la tabla de versiones compartida entre workers"""
+        with self.db.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS version_cache (
+                    grupo VARCHAR(50) PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """))
+
+    def _metrica(self, grupo, campo):
+        with self.lock:
+            datos = self.metricas_grupo.setdefault(grupo, {'hits': 0, 'misses': 0, 'invalidaciones': 0})
+            datos[campo] += 1
+
+    def _versiones(self):
+        """Versiones de todos los grupos, leídas una vez por request"""
+        if has_request_context() and 'versiones_cache' in g:
+            return g.versiones_cache
+        try:
+            with self.db.engine.connect() as conn:
+                versiones = dict(conn.execute(text("SELECT grupo, version FROM version_cache")).all())
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron leer versiones de caché: {e}")
+            versiones = None
+        if has_request_context():
+            g.versiones_cache = versiones
+        return versiones
+
+    def versiones(self, grupos):
+        """{grupo: versión} de los grupos indicados, o None si no se pudieron leer"""
+        versiones = self._versiones()
+        if versiones is None:
+            return None
+        return {grupo: versiones.get(grupo, 0) for grupo in sorted(grupos)}
+
+    def obtener(self, grupo, clave, calcular, ttl=None):
+        """Devuelve el valor en caché o lo calcula con calcular() y lo guarda.
+
+        calcular debe devolver datos simples (listas, dicts, números), nunca objetos ORM.
+        """
+        versiones = self._versiones()
+        if versiones is None:
+            # Sin tabla de versiones no hay forma de saber si otro worker escribió
+            self._metrica(grupo, 'misses')
+            return calcular()
+
+        version = versiones.get(grupo, 0)
+        ahora = time.monotonic()
+        with self.lock:
+            entrada = self.entradas.get((grupo, clave))
+        if entrada and entrada[1] > ahora and entrada[2] == version:
+            self._metrica(grupo, 'hits')
+            return entrada[0]
+
+        self._metrica(grupo, 'misses')
+        valor = calcular()
+        with self.lock:
+            self.entradas[(grupo, clave)] = (valor, ahora + (ttl or self.ttl), version)
+        return valor
+
+    def invalidar(self, *grupos, conexion=None):
+        """Invalida los grupos en este worker y en los demás.
+
+        El incremento de versión se ejecuta en la transacción de la sesión (o en la
+        conexión indicada), de modo que se confirma junto con la escritura.
+        """
+        ejecutor = conexion if conexion is not None else self.db.session
+        for grupo in grupos:
+            ejecutor.execute(text("""
+                INSERT INTO version_cache (grupo, version) VALUES (:grupo, 1)
+                ON CONFLICT (grupo) DO UPDATE SET version = version_cache.version + 1
+            """), {'grupo': grupo})
+            with self.lock:
+                for llave in [k for k in self.entradas if k[0] == grupo]:
+                    del self.entradas[llave]
+            if has_request_context() and g.get('versiones_cache') is not None:
+                g.versiones_cache[grupo] = g.versiones_cache.get(grupo, 0) + 1
+            self._metrica(grupo, 'invalidaciones')
+
+    def limpiar(self):
+        """Vacía la caché local de este worker"""
+        with self.lock:
+            self.entradas.clear()
+
+    def metricas(self):
+        """Hits, misses e invalidaciones por grupo"""
+        with self.lock:
+            grupos = {grupo: dict(datos) for grupo, datos in self.metricas_grupo.items()}
+            entradas = len(self.entradas)
+        hits = sum(d['hits'] for d in grupos.values())
+        misses = sum(d['misses'] for d in grupos.values())
+        return {
+            'ttl_segundos': self.ttl,
+            'entradas': entradas,
+            'hits': hits,
+            'misses': misses,
+            'tasa_aciertos': round(hits / (hits + misses), 3) if hits + misses else 0,
+            'grupos': grupos,
+            'pid': os.getpid()
+        }
+
+
+# Instancia global de la caché
+cache_referencias = CacheReferencias()
@@ -0,0 +1,142 @@
+"""
+Caché de identidad de usuarios para el user_loader de Flask-Login
+Sin caché, cada petición autenticada (incluidos los sondeos de notificaciones cada
+pocos segundos) hace un SELECT a la tabla user solo para saber quién es el usuario.
+
+Se guarda por worker una identidad liviana (id, email, username, is_admin) en un LRU
+con TTL corto, en vez de la instancia del ORM: esa quedaría desligada de la sesión y
+expirada después de cada commit. La clave incluye el sello del usuario, un hash de
+password_hash, is_admin y email que se guarda en la sesión firmada al iniciar sesión.
+Cuando vence el TTL se relee el usuario; si el sello cambió (otra contraseña o se le
+quitó el rol de administrador) la sesión deja de ser válida. En el worker que hace el
+cambio la entrada se descarta de inmediato con los eventos del modelo.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import session
+from flask_login import UserMixin
+from sqlalchemy import event
+from registro import obtener_logger
+
+logger = obtener_logger('cache_usuarios')
+
+TTL_POR_DEFECTO = int(os.environ.get('USUARIOS_CACHE_TTL', 60))
+MAXIMO_POR_DEFECTO = int(os.environ.get('USUARIOS_CACHE_MAXIMO', 256))
+CLAVE_SESION = '_usuario_sello'
+
+
+class IdentidadUsuario(UserMixin):
+    """Datos del usuario que usan las vistas y plantillas (current_user)"""
+
+    def __init__(self, id, email, username, is_admin, sello):
+        self.id = id
+        self.email = email
+        self.username = username
+        self.is_admin = bool(is_admin)
+        self.sello = sello
+
+    def __repr__(self):
+        return f'<IdentidadUsuario {self.id} {self.email}>'
+
+
+def sello_usuario(usuario):
+    """Hash corto de los datos que, si cambian, deben invalidar las sesiones abiertas"""
+    base = f'{usuario.password_hash}|{bool(usuario.is_admin)}|{usuario.email}'
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()[:16]
+
+
+class CacheUsuarios:
+    def __init__(self, ttl=TTL_POR_DEFECTO, maximo=MAXIMO_POR_DEFECTO):
+        self.ttl = ttl
+        self.maximo = maximo
+        self.modelo = None
+        self.entradas = OrderedDict()  # id -> (identidad, expira)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rechazos = 0
+
+    def init_app(self, app, modelo):
+        """Asocia la caché con el modelo de usuarios y escucha sus cambios"""
+        self.modelo = modelo
+        app.extensions['cache_usuarios'] = self
+
+        @event.listens_for(modelo, 'after_update')
+        @event.listens_for(modelo, 'after_delete')
+        def _usuario_modificado(mapper, connection, target):
+            self.invalidar(target.id)
+
+    def cargar(self, user_id):
+        """Identidad del usuario de la sesión actual, o None si no existe o su sello cambió"""
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        sello_sesion = session.get(CLAVE_SESION)
+        ahora = time.monotonic()
+
+        with self.lock:
+            entrada = self.entradas.get(user_id)
+            if entrada and entrada[1] > ahora and entrada[0].sello == sello_sesion:
+                self.entradas.move_to_end(user_id)
+                self.hits += 1
+                return entrada[0]
+            self.misses += 1
+
+        usuario = self.modelo.query.get(user_id)
+        if usuario is None:
+            self.invalidar(user_id)
+            return None
+        identidad = IdentidadUsuario(usuario.id, usuario.email, usuario.username,
+                                     usuario.is_admin, sello_usuario(usuario))
+
+        if sello_sesion is None:
+            # Sesiones iniciadas antes de existir el sello: se adopta el actual
+            session[CLAVE_SESION] = identidad.sello
+        elif sello_sesion != identidad.sello:
+            with self.lock:
+                self.rechazos += 1
+            logger.info(f"🔒 Sesión del usuario {user_id} invalidada: cambiaron sus credenciales o permisos")
+            return None
+
+        with self.lock:
+            self.entradas[user_id] = (identidad, ahora + self.ttl)
+            self.entradas.move_to_end(user_id)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+        return identidad
+
+    def registrar_inicio(self, usuario):
+        """Guarda en la sesión el sello del usuario que acaba de iniciar sesión"""
+        session[CLAVE_SESION] = sello_usuario(usuario)
+        self.invalidar(usuario.id)
+
+    def cerrar_sesion(self):
+        session.pop(CLAVE_SESION, None)
+
+    def invalidar(self, user_id=None):
+        """Descarta un usuario, o todos si no se indica"""
+        with self.lock:
+            if user_id is None:
+                self.entradas.clear()
+            else:
+                self.entradas.pop(int(user_id), None)
+
+    def metricas(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entradas': len(self.entradas),
+                'ttl_segundos': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'sesiones_rechazadas': self.rechazos,
+                'tasa_aciertos': round(self.hits / total * 100, 1) if total else 0
+            }
+
+
+cache_usuarios = CacheUsuarios()
@@ -0,0 +1,213 @@
+"""
+Carnets de empleado con QR firmado
+El QR del carnet lleva el id del empleado y una firma HMAC corta: el kiosco lo lee con
+el escáner y el servidor identifica al empleado por llave primaria, sin que nadie
+escriba su cédula ni su nombre.
+
+    FJ1.<id>.<firma>      p. ej. FJ1.128.kq3ZB0x8hL2f
+
+Cambiar CARNET_SECRETO invalida todos los carnets impresos.
+
+Las hojas para imprimir se dibujan con un pool de procesos (qrcode y PIL son trabajo
+de CPU). Las funciones que corren en los procesos no tocan la app ni la base de datos.
+El pool es uno por worker, se crea con la primera hoja grande y sus procesos salen de un
+forkserver: el worker ya tiene hilos (registro, notificaciones, otras peticiones) y un
+fork directo podría heredar un lock tomado por alguno de ellos.
+"""
+
+import base64
+import hashlib
+import hmac
+import io
+import multiprocessing
+import os
+import re
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+VERSION_CARNET = 'FJ1'
+LARGO_FIRMA = 12  # Caracteres base64url (72 bits)
+FORMATO_CARNET = re.compile(r'^FJ1\.(\d{1,10})\.([A-Za-z0-9_-]{12})$')
+
+# Carnet CR80 vertical (54 x 86 mm) y hoja A4, a 300 dpi
+DPI = 300
+TAMANO_CARNET = (638, 1016)
+TAMANO_HOJA = (2480, 3508)
+COLUMNAS_HOJA, FILAS_HOJA = 3, 3
+CARNETS_POR_HOJA = COLUMNAS_HOJA * FILAS_HOJA
+
+PROCESOS_CARNETS = int(os.environ.get('CARNETS_PROCESOS', min(4, os.cpu_count() or 1)))
+MINIMO_PARA_POOL = 8  # Con menos carnets no vale la pena repartirlos entre procesos
+
+_pool = None
+_pid_pool = None
+_lock_pool = threading.Lock()
+
+
+class FirmaCarnets:
+    def __init__(self):
+        self.secreto = os.environ.get('CARNET_SECRETO', '').encode() or None
+
+    def init_app(self, app):
+        """Sin CARNET_SECRETO la firma se deriva de la SECRET_KEY de la app"""
+        if self.secreto is None:
+            self.secreto = hashlib.sha256(b'carnet:' + app.config['SECRET_KEY'].encode()).digest()
+        app.extensions['carnets'] = self
+
+    def _firma(self, empleado_id):
+        digest = hmac.new(self.secreto, f'{VERSION_CARNET}.{empleado_id}'.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode()[:LARGO_FIRMA]
+
+    def firmar(self, empleado_id):
+        """Contenido del QR del carnet"""
+        return f'{VERSION_CARNET}.{int(empleado_id)}.{self._firma(int(empleado_id))}'
+
+    def verificar(self, contenido):
+        """Id del empleado si el contenido es un carnet con firma válida, si no None"""
+        coincidencia = FORMATO_CARNET.match((contenido or '').strip())
+        if not coincidencia:
+            return None
+        empleado_id = int(coincidencia.group(1))
+        if not hmac.compare_digest(coincidencia.group(2), self._firma(empleado_id)):
+            return None
+        return empleado_id
+
+
+def _fuente(tamano, negrita=False):
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype('DejaVuSans-Bold.ttf' if negrita else 'DejaVuSans.ttf', tamano)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=tamano)
+        except TypeError:  # Pillow < 10.1
+            return ImageFont.load_default()
+
+
+def _partir_nombre(dibujo, nombre, fuente, ancho):
+    """Hasta dos líneas que quepan en el ancho del carnet"""
+    lineas, actual = [], ''
+    for palabra in nombre.split():
+        prueba = f'{actual} {palabra}'.strip()
+        if actual and dibujo.textlength(prueba, font=fuente) > ancho:
+            lineas.append(actual)
+            actual = palabra
+        else:
+            actual = prueba
+    lineas.append(actual)
+    return lineas[:2]
+
+
+def dibujar_carnet(datos):
+    """PNG de un carnet. datos: dict con contenido, nombre, cedula y cargo (se ejecuta en otro proceso)"""
+    import qrcode
+    from PIL import Image, ImageDraw
+
+    ancho, alto = TAMANO_CARNET
+    carnet = Image.new('RGB', TAMANO_CARNET, 'white')
+    dibujo = ImageDraw.Draw(carnet)
+
+    # Franja superior con el nombre de la empresa
+    dibujo.rectangle([0, 0, ancho, 150], fill=(40, 167, 69))
+    dibujo.text((ancho // 2, 75), 'Flores Juncalito SAS', font=_fuente(44, True), fill='white', anchor='mm')
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=2)
+    qr.add_data(datos['contenido'])
+    qr.make(fit=True)
+    imagen_qr = qr.make_image(fill_color='black', back_color='white').get_image().convert('RGB')
+    imagen_qr = imagen_qr.resize((500, 500), Image.NEAREST)
+    carnet.paste(imagen_qr, ((ancho - 500) // 2, 180))
+
+    fuente_nombre = _fuente(40, True)
+    y = 720
+    for linea in _partir_nombre(dibujo, datos['nombre'], fuente_nombre, ancho - 60):
+        dibujo.text((ancho // 2, y), linea, font=fuente_nombre, fill='black', anchor='mm')
+        y += 52
+    dibujo.text((ancho // 2, y + 10), f"C.C. {datos['cedula']}", font=_fuente(34), fill=(60, 60, 60), anchor='mm')
+    if datos.get('cargo'):
+        dibujo.text((ancho // 2, y + 62), datos['cargo'][:30], font=_fuente(30), fill=(100, 100, 100), anchor='mm')
+
+    # Borde de corte
+    dibujo.rectangle([0, 0, ancho - 1, alto - 1], outline=(200, 200, 200), width=2)
+
+    salida = io.BytesIO()
+    carnet.save(salida, 'PNG', dpi=(DPI, DPI))
+    return salida.getvalue()
+
+
+def _pool_carnets():
+    """Pool de procesos de este worker (se crea la primera vez; el pid detecta un fork posterior)"""
+    global _pool, _pid_pool
+    with _lock_pool:
+        if _pool is None or _pid_pool != os.getpid():
+            metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=PROCESOS_CARNETS,
+                                        mp_context=multiprocessing.get_context(metodo))
+            _pid_pool = os.getpid()
+        return _pool
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _lock_pool:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def dibujar_carnets(lista_datos):
+    """PNG de cada carnet, en el mismo orden. Con muchos carnets usa el pool de procesos."""
+    if len(lista_datos) < MINIMO_PARA_POOL or PROCESOS_CARNETS <= 1:
+        return [dibujar_carnet(datos) for datos in lista_datos]
+    pool = _pool_carnets()
+    tamano_bloque = max(1, len(lista_datos) // (PROCESOS_CARNETS * 4))
+    try:
+        return list(pool.map(dibujar_carnet, lista_datos, chunksize=tamano_bloque))
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. sin memoria): este lote se dibuja aquí y el próximo crea otro pool
+        _descartar_pool(pool)
+        return [dibujar_carnet(datos) for datos in lista_datos]
+
+
+def armar_hojas(carnets_png):
+    """Hojas A4 (imágenes PIL) con los carnets en una cuadrícula de 3 x 3"""
+    from PIL import Image
+
+    ancho_hoja, alto_hoja = TAMANO_HOJA
+    ancho_carnet, alto_carnet = TAMANO_CARNET
+    margen_x = (ancho_hoja - COLUMNAS_HOJA * ancho_carnet) // (COLUMNAS_HOJA + 1)
+    margen_y = (alto_hoja - FILAS_HOJA * alto_carnet) // (FILAS_HOJA + 1)
+
+    hojas = []
+    for inicio in range(0, len(carnets_png), CARNETS_POR_HOJA):
+        hoja = Image.new('RGB', TAMANO_HOJA, 'white')
+        for posicion, png in enumerate(carnets_png[inicio:inicio + CARNETS_POR_HOJA]):
+            fila, columna = divmod(posicion, COLUMNAS_HOJA)
+            x = margen_x + columna * (ancho_carnet + margen_x)
+            y = margen_y + fila * (alto_carnet + margen_y)
+            hoja.paste(Image.open(io.BytesIO(png)), (x, y))
+        hojas.append(hoja)
+    return hojas
+
+
+def generar_hojas(lista_datos, formato='pdf'):
+    """(BytesIO, mimetype, extension) con las hojas: un PDF de varias páginas o un ZIP con un PNG por hoja"""
+    hojas = armar_hojas(dibujar_carnets(lista_datos))
+    salida = io.BytesIO()
+    if formato == 'png':
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo:  # Los PNG ya van comprimidos
+            for numero, hoja in enumerate(hojas, start=1):
+                imagen = io.BytesIO()
+                hoja.save(imagen, 'PNG', dpi=(DPI, DPI))
+                archivo.writestr(f'carnets_hoja_{numero:03d}.png', imagen.getvalue())
+        mimetype, extension = 'application/zip', 'zip'
+    else:
+        hojas[0].save(salida, 'PDF', resolution=DPI, save_all=True, append_images=hojas[1:])
+        mimetype, extension = 'application/pdf', 'pdf'
+    salida.seek(0)
+    return salida, mimetype, extension
+
+
+firma_carnets = FirmaCarnets()
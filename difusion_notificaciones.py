@@ -0,0 +1,317 @@
+"""
+Difusión de notificaciones entre workers
+Cada worker de gunicorn guarda en memoria las notificaciones recientes y el navegador le
+pregunta solo por las novedades: mientras no llegue nada, el sondeo no consulta la base.
+
+En PostgreSQL cada notificación nueva (y cada cambio: leída, eliminada, limpiar) se publica
+con pg_notify dentro de la misma transacción, así se entrega solo si se confirma. Un hilo
+por worker escucha el canal con LISTEN en una conexión propia (fuera del pool).
+
+En SQLite (desarrollo) no hay LISTEN: el hilo consulta cada pocos segundos max(id) y la
+versión del grupo 'notificaciones' en version_cache, que cada cambio (leída, eliminada,
+limpiar) incrementa en su transacción. Es una sola consulta por worker sin importar
+cuántos navegadores estén abiertos; si la versión cambió, el worker relee de la base las
+notificaciones que tiene en memoria.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import event, text
+from cache_referencias import cache_referencias
+from registro import obtener_logger
+
+logger = obtener_logger('notificaciones.difusion')
+
+CANAL = 'notificaciones_floresjuncalito'
+INTERVALO_SONDEO = float(os.environ.get('NOTIFICACIONES_INTERVALO_SONDEO', 2))
+MAX_RECIENTES = 200
+# Dos transacciones pueden confirmarse en otro orden que sus ids: lo recibido en esta
+# ventana se devuelve aunque su id sea menor que el último que vio el navegador
+VENTANA_REORDEN = 10
+GRUPO_CAMBIOS = 'notificaciones'  # Grupo de version_cache que marca los cambios en SQLite
+LARGO_MAXIMO_PAYLOAD = 7000  # pg_notify admite hasta 8000 bytes
+
+
+def como_dict(notificacion):
+    """Mismo formato que devuelve /api/notificaciones"""
+    return {
+        'id': notificacion.id,
+        'titulo': notificacion.titulo,
+        'mensaje': notificacion.mensaje,
+        'tipo': notificacion.tipo,
+        'tipo_sonido': notificacion.tipo_sonido,
+        'icono': notificacion.icono,
+        'fecha_creacion': notificacion.fecha_creacion.isoformat(),
+        'leida': notificacion.leida,
+        'usuario_id': notificacion.usuario_id
+    }
+
+
+class DifusionNotificaciones:
+    def __init__(self):
+        self.db = None
+        self.motor = None
+        self.Notificacion = None
+        self.app = None
+        self.lock = threading.Lock()
+        self.recientes = deque(maxlen=MAX_RECIENTES)  # (recibido, datos)
+        self.ultimo_id = 0
+        self.inicializado = False
+        self.ultimo_cambio = 0.0  # Marca de tiempo del último cambio (la pone quien lo publica)
+        self.eventos_recibidos = 0
+        self.version_cambios = None  # Última versión de GRUPO_CAMBIOS vista por el sondeo
+        self.cambios_propios = 0  # Cambios confirmados por este worker aún no vistos en el sondeo
+        self.hilo = None
+        self.detener = threading.Event()
+
+    def init_app(self, app, db, modelo_notificacion):
+        self.app = app
+        self.db = db
+        self.Notificacion = modelo_notificacion
+        with app.app_context():
+            self.motor = db.engine  # El hilo no tiene contexto de aplicación
+        # Sin LISTEN los avisos se aplican en memoria al confirmar la transacción (y se descartan si se revierte)
+        event.listen(db.session, 'after_commit', self._despues_de_commit)
+        event.listen(db.session, 'after_soft_rollback', self._despues_de_rollback)
+        app.extensions['difusion_notificaciones'] = self
+
+    @property
+    def usa_listen(self):
+        return self.motor.dialect.name == 'postgresql'
+
+    # ----- Publicar -----
+
+    def publicar_nueva(self, sesion, datos):
+        """Anuncia una notificación ya agregada a la sesión (llamar antes del commit, después del flush)"""
+        payload = json.dumps({'evento': 'nueva', **datos}, ensure_ascii=False, default=str)
+        if self.usa_listen and len(payload.encode()) > LARGO_MAXIMO_PAYLOAD:
+            # Demasiado grande para NOTIFY: quien la reciba la lee de la base
+            payload = json.dumps({'evento': 'nueva', 'id': datos['id'], 'incompleta': True})
+        self._notificar(sesion, payload)
+
+    def publicar_cambio(self, sesion, tipo, notificacion_id=None):
+        """Anuncia una notificación leída o eliminada, o la limpieza de todas (llamar antes del commit)"""
+        payload = json.dumps({'evento': 'cambio', 'tipo': tipo, 'id': notificacion_id, 'marca': time.time()})
+        self._notificar(sesion, payload)
+        if not self.usa_listen:
+            # Los demás workers lo ven en el sondeo de la versión
+            cache_referencias.invalidar(GRUPO_CAMBIOS, conexion=sesion)
+            sesion.info['cambios_notificaciones'] = sesion.info.get('cambios_notificaciones', 0) + 1
+
+    def _notificar(self, sesion, payload):
+        if self.usa_listen:
+            sesion.execute(text('SELECT pg_notify(:canal, :payload)'), {'canal': CANAL, 'payload': payload})
+        else:
+            # El propio worker se entera al confirmar; los demás, con el sondeo
+            sesion.info.setdefault('avisos_notificaciones', []).append(payload)
+
+    def _despues_de_commit(self, sesion):
+        cambios = sesion.info.pop('cambios_notificaciones', 0)
+        if cambios:
+            with self.lock:
+                self.cambios_propios += cambios
+        for payload in sesion.info.pop('avisos_notificaciones', []):
+            self._recibir(payload)
+
+    def _despues_de_rollback(self, sesion, transaccion_previa):
+        sesion.info.pop('avisos_notificaciones', None)
+        sesion.info.pop('cambios_notificaciones', None)
+
+    # ----- Recibir -----
+
+    def _recibir(self, payload):
+        try:
+            evento = json.loads(payload)
+        except ValueError:
+            logger.warning(f"⚠️ Aviso de notificación inválido: {payload[:100]}")
+            return
+        if evento.pop('evento', None) == 'cambio':
+            self._aplicar_cambio(evento)
+        elif evento.pop('incompleta', False):
+            self._cargar_desde(evento['id'] - 1, hasta=evento['id'])
+        else:
+            self._agregar([evento])
+
+    def _agregar(self, lista):
+        ahora = time.monotonic()
+        with self.lock:
+            conocidos = {datos['id'] for _, datos in self.recientes}
+            for datos in lista:
+                if datos['id'] in conocidos:
+                    continue
+                self.recientes.append((ahora, datos))
+                self.ultimo_id = max(self.ultimo_id, datos['id'])
+                self.eventos_recibidos += 1
+
+    def _aplicar_cambio(self, cambio):
+        with self.lock:
+            if cambio['tipo'] == 'limpiar':
+                self.recientes.clear()
+            elif cambio['tipo'] == 'eliminada':
+                self.recientes = deque(((r, d) for r, d in self.recientes if d['id'] != cambio['id']), maxlen=MAX_RECIENTES)
+            elif cambio['tipo'] == 'leida':
+                for _, datos in self.recientes:
+                    if cambio['id'] is None or datos['id'] == cambio['id']:
+                        datos['leida'] = True
+            self.ultimo_cambio = max(self.ultimo_cambio, cambio['marca'])
+            self.eventos_recibidos += 1
+
+    def _cargar_desde(self, desde_id, hasta=None):
+        """Lee de la base las notificaciones con id mayor que desde_id (al arrancar, al reconectar o si el aviso no trae los datos).
+
+        Lee por bloques de MAX_RECIENTES hasta el final, para que ultimo_id llegue a max(id)
+        aunque se hayan acumulado más notificaciones de las que caben en memoria.
+        """
+        Notificacion = self.Notificacion
+        with self.app.app_context():
+            while True:
+                consulta = Notificacion.query.filter(Notificacion.id > desde_id)
+                if hasta is not None:
+                    consulta = consulta.filter(Notificacion.id <= hasta)
+                filas = consulta.order_by(Notificacion.id).limit(MAX_RECIENTES).all()
+                self._agregar([como_dict(n) for n in filas])
+                if len(filas) < MAX_RECIENTES:
+                    break
+                desde_id = filas[-1].id
+
+    def _id_maximo(self):
+        with self.motor.connect() as conn:
+            return conn.execute(text('SELECT MAX(id) FROM notificacion')).scalar() or 0
+
+    def _estado_sondeo(self):
+        """(max(id), versión de GRUPO_CAMBIOS) en una consulta"""
+        with self.motor.connect() as conn:
+            maximo, version = conn.execute(text(
+                'SELECT (SELECT MAX(id) FROM notificacion), '
+                '(SELECT version FROM version_cache WHERE grupo = :grupo)'
+            ), {'grupo': GRUPO_CAMBIOS}).one()
+        return maximo or 0, version or 0
+
+    def _sincronizar_recientes(self, ajenos):
+        """Relee las notificaciones en memoria: quita las eliminadas y actualiza las leídas.
+
+        Con cambios de otros workers (ajenos) los navegadores recargan la lista aunque las
+        notificaciones afectadas ya no estén en memoria; los propios ya los avisó el commit.
+        """
+        Notificacion = self.Notificacion
+        with self.lock:
+            ids = [datos['id'] for _, datos in self.recientes]
+        with self.app.app_context():
+            leidas = dict(self.db.session.query(Notificacion.id, Notificacion.leida)
+                          .filter(Notificacion.id.in_(ids)).all()) if ids else {}
+            self.db.session.remove()
+        with self.lock:
+            actualizadas = deque(
+                ((r, {**d, 'leida': leidas[d['id']]}) for r, d in self.recientes if d['id'] in leidas),
+                maxlen=MAX_RECIENTES
+            )
+            if ajenos or actualizadas != self.recientes:
+                self.ultimo_cambio = max(self.ultimo_cambio, time.time())
+            self.recientes = actualizadas
+            self.eventos_recibidos += ajenos
+
+    # ----- Hilo por worker -----
+
+    def iniciar(self):
+        """Arranca el hilo de escucha de este worker (con la primera consulta de novedades, no al importar)"""
+        with self.lock:
+            if self.hilo is not None and self.hilo.is_alive():
+                return
+            self.detener.clear()
+            objetivo = self._escuchar if self.usa_listen else self._sondear
+            self.hilo = threading.Thread(target=objetivo, name='difusion-notificaciones', daemon=True)
+            self.hilo.start()
+
+    def _marca_inicial(self):
+        # Las últimas notificaciones quedan en memoria: un navegador que cargó la lista justo
+        # antes de que arrancara el hilo no se pierde las que llegaron en medio
+        if self.inicializado:
+            return
+        maximo = self._id_maximo()
+        self._cargar_desde(max(0, maximo - MAX_RECIENTES // 4))
+        with self.lock:
+            self.ultimo_id = max(self.ultimo_id, maximo)
+        self.inicializado = True
+
+    def _sondear(self):
+        logger.info(f"📡 Notificaciones: sondeo de max(id) y cambios cada {INTERVALO_SONDEO:g}s (sin LISTEN/NOTIFY)")
+        while not self.detener.is_set():
+            try:
+                self._marca_inicial()
+                maximo, version = self._estado_sondeo()
+                if maximo > self.ultimo_id:
+                    self._cargar_desde(self.ultimo_id)
+                if self.version_cambios is not None and version != self.version_cambios:
+                    with self.lock:
+                        propios, self.cambios_propios = self.cambios_propios, 0
+                    self._sincronizar_recientes(max(0, version - self.version_cambios - propios))
+                self.version_cambios = version
+            except Exception as e:
+                logger.warning(f"⚠️ Error en el sondeo de notificaciones: {e}")
+            self.detener.wait(INTERVALO_SONDEO)
+
+    def _conectar(self):
+        import psycopg
+
+        argumentos, parametros = self.motor.dialect.create_connect_args(self.motor.url)
+        parametros.update(autocommit=True, connect_timeout=10, keepalives=1, keepalives_idle=60,
+                          keepalives_interval=10, keepalives_count=5)
+        return psycopg.connect(*argumentos, **parametros)
+
+    def _escuchar(self):
+        espera = 1
+        reconexion = False
+        while not self.detener.is_set():
+            try:
+                with self._conectar() as conexion:
+                    conexion.execute(f'LISTEN {CANAL}')
+                    logger.info(f"📡 Notificaciones: escuchando el canal {CANAL} (pid {os.getpid()})")
+                    # Lo publicado mientras no había conexión se lee de la base: las nuevas por
+                    # id y los cambios (leídas, eliminadas) releyendo las que hay en memoria
+                    self._marca_inicial()
+                    self._cargar_desde(self.ultimo_id)
+                    if reconexion:
+                        self._sincronizar_recientes(1)
+                    reconexion = True
+                    espera = 1
+                    while not self.detener.is_set():
+                        for aviso in conexion.notifies(timeout=30):
+                            self._recibir(aviso.payload)
+            except Exception as e:
+                logger.warning(f"⚠️ Conexión LISTEN de notificaciones perdida: {e}. Reintentando en {espera}s")
+                self.detener.wait(espera)
+                espera = min(espera * 2, 60)
+
+    # ----- Consultar -----
+
+    def novedades(self, desde_id, cambio_conocido):
+        """Notificaciones nuevas para un navegador que ya vio hasta desde_id, sin consultar la base.
+
+        reiniciar=True indica que hubo cambios (leídas, eliminadas) y debe recargar la lista completa.
+        """
+        self.iniciar()
+        limite_reorden = time.monotonic() - VENTANA_REORDEN
+        with self.lock:
+            nuevas = [dict(datos) for recibido, datos in self.recientes
+                      if datos['id'] > desde_id or recibido >= limite_reorden]
+            return {
+                'notificaciones': nuevas,
+                'ultimo_id': max(desde_id, self.ultimo_id),
+                'ultimo_cambio': self.ultimo_cambio,
+                'reiniciar': self.ultimo_cambio > cambio_conocido
+            }
+
+    def estado(self):
+        return {
+            'modo': 'listen' if self.usa_listen else 'sondeo',
+            'hilo_activo': self.hilo is not None and self.hilo.is_alive(),
+            'ultimo_id': self.ultimo_id,
+            'en_memoria': len(self.recientes),
+            'eventos_recibidos': self.eventos_recibidos
+        }
+
+
+difusion_notificaciones = DifusionNotificaciones()
@@ -0,0 +1,89 @@
+"""
+Configuración de gunicorn
+Se carga con `gunicorn app:app -c gunicorn.conf.py` (Procfile, nixpacks.toml y Dockerfile).
+Todos los valores se pueden cambiar con variables de entorno GUNICORN_*.
+
+Por defecto usa workers gthread: cada proceso atiende varias peticiones con hilos, así
+una exportación a Excel lenta o un sondeo de notificaciones no bloquean todo el worker
+como con los workers sync. gevent es opcional y requiere instalar el paquete gevent.
+
+    python benchmarks/carga_gunicorn.py   # compara sync, gthread y gevent
+"""
+
+import importlib.util
+import os
+import sys
+from registro import obtener_logger
+
+logger = obtener_logger('gunicorn')
+
+
+def _entero(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        logger.warning(f"⚠️ {nombre} inválido, usando {defecto}")
+        return defecto
+
+
+def _booleano(nombre, defecto):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+
+
+def _clase_worker():
+    clase = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').strip().lower()
+    if clase not in ('sync', 'gthread', 'gevent'):
+        logger.warning(f"⚠️ GUNICORN_WORKER_CLASS={clase} no soportado, usando gthread")
+        return 'gthread'
+    if clase == 'gevent':
+        if importlib.util.find_spec('gevent') is None:
+            logger.warning("⚠️ gevent no está instalado, usando gthread")
+            return 'gthread'
+    return clase
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = _clase_worker()
+workers = _entero('GUNICORN_WORKERS', 2)
+# Hilos por worker (gthread); cada hilo puede tener una conexión del pool (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+threads = _entero('GUNICORN_THREADS', 4) if worker_class == 'gthread' else 1
+# Peticiones simultáneas por worker con gevent
+worker_connections = _entero('GUNICORN_WORKER_CONNECTIONS', 100)
+
+timeout = _entero('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _entero('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _entero('GUNICORN_KEEPALIVE', 5)
+
+# Reciclar workers cada cierto número de peticiones; el jitter evita que todos reinicien a la vez
+max_requests = _entero('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _entero('GUNICORN_MAX_REQUESTS_JITTER', 100)
+
+# Con preload, app.py se importa una vez en el master y los workers arrancan más rápido
+preload_app = _booleano('GUNICORN_PRELOAD', False)
+
+# Cada petición ya se registra en el log JSON de instrumentacion.py
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('LOG_NIVEL', 'info').strip().lower()
+
+
+def when_ready(server):
+    logger.info(f"🚀 Gunicorn listo en {bind}: {workers} workers {worker_class}"
+                f"{f' x {threads} hilos' if worker_class == 'gthread' else ''}, timeout={timeout}s, "
+                f"max_requests={max_requests}±{max_requests_jitter}, preload={preload_app}")
+
+
+def post_fork(server, worker):
+    # Con preload el motor se creó en el master: sus conexiones no se comparten entre procesos
+    aplicacion = sys.modules.get('app')
+    if aplicacion is not None:
+        with aplicacion.app.app_context():
+            aplicacion.db.engine.dispose(close=False)
+
+
+def worker_abort(worker):
+    logger.error(f"❌ Worker {worker.pid} superó el timeout de {timeout}s y fue reiniciado")
@@ -0,0 +1,192 @@
+"""
+Instrumentación de peticiones
+Mide la duración de cada petición, cuántas consultas SQL hace y cuánto tiempo pasa en la
+base de datos. Registra las consultas lentas y las repetidas (N+1), agrega el header
+Server-Timing y guarda una ventana de duraciones por endpoint para calcular p50/p95.
+
+Las métricas son de cada worker de gunicorn, igual que las del pool (motor_bd.py).
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from registro import obtener_logger
+
+CONSULTA_LENTA_MS = float(os.environ.get('INSTRUMENTACION_CONSULTA_LENTA_MS', 200))
+PETICION_LENTA_MS = float(os.environ.get('INSTRUMENTACION_PETICION_LENTA_MS', 1000))
+UMBRAL_N_MAS_1 = int(os.environ.get('INSTRUMENTACION_UMBRAL_N_MAS_1', 10))
+VENTANA_POR_ENDPOINT = int(os.environ.get('INSTRUMENTACION_VENTANA', 500))
+LOG_PETICIONES = os.environ.get('INSTRUMENTACION_LOG_PETICIONES', 'true').strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+
+# Endpoints que no se miden (archivos estáticos)
+ENDPOINTS_EXCLUIDOS = {'static'}
+# Endpoints que cada pestaña consulta cada pocos segundos: su línea de log se muestrea
+# (evento peticion_sondeo, ver LOG_MUESTREO en registro.py) salvo que la petición sea lenta
+ENDPOINTS_SONDEO = {'api_notificaciones', 'api_novedades_notificaciones', 'api_solicitudes_pendientes'}
+
+logger = obtener_logger('instrumentacion')
+
+_ESPACIOS = re.compile(r'\s+')
+
+
+def _resumir_sentencia(sentencia, largo=300):
+    sentencia = _ESPACIOS.sub(' ', sentencia).strip()
+    return sentencia if len(sentencia) <= largo else sentencia[:largo] + '…'
+
+
+def _registrar(evento, nivel='warning', **datos):
+    getattr(logger, nivel)(evento, extra={'evento': evento, 'datos': datos})
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores_ordenados:
+        return 0
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
+
+
+class EstadisticasEndpoint:
+    def __init__(self, ventana):
+        self.duraciones = deque(maxlen=ventana)
+        self.consultas = deque(maxlen=ventana)
+        self.tiempos_bd = deque(maxlen=ventana)
+        self.total = 0
+        self.errores = 0
+        self.n_mas_1 = 0
+
+
+class Instrumentacion:
+    def __init__(self, ventana=VENTANA_POR_ENDPOINT):
+        self.ventana = ventana
+        self.endpoints = {}  # endpoint -> EstadisticasEndpoint
+        self.lock = threading.Lock()
+        self.inicio = time.time()
+
+    def init_app(self, app):
+        """Registra los hooks de petición y los eventos de SQLAlchemy"""
+        app.before_request(self._antes_de_peticion)
+        app.after_request(self._despues_de_peticion)
+        if not event.contains(Engine, 'before_cursor_execute', _antes_de_consulta):
+            event.listen(Engine, 'before_cursor_execute', _antes_de_consulta)
+            event.listen(Engine, 'after_cursor_execute', _despues_de_consulta)
+            event.listen(Engine, 'handle_error', _error_de_consulta)
+        app.extensions['instrumentacion'] = self
+
+    def _antes_de_peticion(self):
+        g.instrumentacion = {
+            'inicio': time.perf_counter(),
+            'consultas': 0,
+            'tiempo_bd': 0.0,
+            'sentencias': Counter()
+        }
+
+    def _despues_de_peticion(self, respuesta):
+        datos = g.pop('instrumentacion', None)
+        if datos is None:
+            return respuesta
+        endpoint = request.endpoint or 'sin_endpoint'
+        if endpoint in ENDPOINTS_EXCLUIDOS:
+            return respuesta
+
+        duracion_ms = (time.perf_counter() - datos['inicio']) * 1000
+        bd_ms = datos['tiempo_bd'] * 1000
+        consultas = datos['consultas']
+        respuesta.headers.add('Server-Timing', f'app;dur={duracion_ms:.1f}, db;dur={bd_ms:.1f};desc="consultas={consultas}"')
+
+        repetidas = [(sentencia, veces) for sentencia, veces in datos['sentencias'].most_common(3)
+                     if veces > UMBRAL_N_MAS_1]
+        if repetidas:
+            _registrar('n_mas_1', endpoint=endpoint, ruta=request.path,
+                       repetidas=[{'veces': veces, 'sql': _resumir_sentencia(sentencia)} for sentencia, veces in repetidas])
+
+        lenta = duracion_ms >= PETICION_LENTA_MS
+        if LOG_PETICIONES or lenta:
+            evento = 'peticion_sondeo' if endpoint in ENDPOINTS_SONDEO and not lenta else 'peticion'
+            _registrar(evento, nivel='warning' if lenta else 'info',
+                       metodo=request.method, ruta=request.path, endpoint=endpoint,
+                       estado=respuesta.status_code, duracion_ms=round(duracion_ms, 1),
+                       consultas=consultas, bd_ms=round(bd_ms, 1),
+                       lenta=lenta)
+
+        with self.lock:
+            estadisticas = self.endpoints.get(endpoint)
+            if estadisticas is None:
+                estadisticas = self.endpoints[endpoint] = EstadisticasEndpoint(self.ventana)
+            estadisticas.duraciones.append(duracion_ms)
+            estadisticas.consultas.append(consultas)
+            estadisticas.tiempos_bd.append(bd_ms)
+            estadisticas.total += 1
+            if respuesta.status_code >= 500:
+                estadisticas.errores += 1
+            if repetidas:
+                estadisticas.n_mas_1 += 1
+        return respuesta
+
+    def resumen(self):
+        """Estadísticas por endpoint sobre la ventana reciente, de la más lenta (p95) a la más rápida"""
+        with self.lock:
+            copia = [(endpoint, list(e.duraciones), list(e.consultas), list(e.tiempos_bd), e.total, e.errores, e.n_mas_1)
+                     for endpoint, e in self.endpoints.items()]
+        filas = []
+        for endpoint, duraciones, consultas, tiempos_bd, total, errores, n_mas_1 in copia:
+            ordenadas = sorted(duraciones)
+            muestras = len(ordenadas)
+            filas.append({
+                'endpoint': endpoint,
+                'peticiones': total,
+                'muestras': muestras,
+                'p50_ms': round(percentil(ordenadas, 50), 1),
+                'p95_ms': round(percentil(ordenadas, 95), 1),
+                'max_ms': round(ordenadas[-1], 1) if ordenadas else 0,
+                'consultas_promedio': round(sum(consultas) / muestras, 1) if muestras else 0,
+                'consultas_max': max(consultas) if consultas else 0,
+                'bd_promedio_ms': round(sum(tiempos_bd) / muestras, 1) if muestras else 0,
+                'errores': errores,
+                'n_mas_1': n_mas_1
+            })
+        filas.sort(key=lambda f: f['p95_ms'], reverse=True)
+        return filas
+
+    def reiniciar(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.inicio = time.time()
+
+
+def _antes_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('instrumentacion_inicio', []).append(time.perf_counter())
+
+
+def _despues_de_consulta(conn, cursor, statement, parameters, context, executemany):
+    pila = conn.info.get('instrumentacion_inicio')
+    if not pila:
+        return
+    duracion = time.perf_counter() - pila.pop()
+
+    datos = g.get('instrumentacion') if has_request_context() else None
+    if datos is not None:
+        datos['consultas'] += 1
+        datos['tiempo_bd'] += duracion
+        datos['sentencias'][statement] += 1
+
+    if duracion * 1000 >= CONSULTA_LENTA_MS:
+        _registrar('consulta_lenta', duracion_ms=round(duracion * 1000, 1), sql=_resumir_sentencia(statement),
+                   endpoint=request.endpoint if has_request_context() else None)
+
+
+def _error_de_consulta(contexto):
+    # La consulta falló: descartar su hora de inicio para no desalinear la pila
+    if contexto.connection is not None:
+        pila = contexto.connection.info.get('instrumentacion_inicio')
+        if pila:
+            pila.pop()
+
+
+instrumentacion = Instrumentacion()
@@ -0,0 +1,226 @@
+"""
+Límite de peticiones y descarte de carga para las rutas públicas de los QR
+Las páginas de asistencia, visitantes y solicitudes no piden login y su token es
+constante (está impreso en los carteles), así que cualquiera puede llamarlas en bucle.
+
+- Token bucket en memoria por cliente (IP + navegador), por IP y por token. El cliente
+  es lo más fino: muchos celulares de la finca salen por la misma IP pública.
+- Con LIMITE_COMPARTIDO=1 además se cuenta por minuto en la tabla limite_peticion, así
+  el límite vale para la suma de los workers (una consulta más por petición pública).
+- Si el pool de conexiones está agotado o la espera reciente por una conexión supera
+  LIMITE_ESPERA_POOL_MS, las rutas públicas responden 503 de inmediato en vez de hacer
+  cola: las conexiones quedan para el panel de administración.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from flask import request, jsonify, make_response
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from motor_bd import metricas_pool
+from registro import obtener_logger
+
+logger = obtener_logger('limite_peticiones')
+
+
+def _entero(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        logger.warning(f"⚠️ {nombre} inválido, usando {defecto}")
+        return defecto
+
+
+# Rutas públicas protegidas y las que responden JSON
+ENDPOINTS_PUBLICOS = {
+    'asistencia_publica', 'kiosco_asistencia', 'sincronizar_kiosco',
+    'visitantes_publico', 'buscar_visitantes_publico',
+    'solicitudes_publico', 'fecha_reintegro_publico',
+}
+ENDPOINTS_JSON = {'sincronizar_kiosco', 'buscar_visitantes_publico', 'fecha_reintegro_publico'}
+
+# (peticiones por minuto, ráfaga) de cada ámbito
+LIMITES = {
+    'cliente': (_entero('LIMITE_CLIENTE_POR_MINUTO', 60), _entero('LIMITE_CLIENTE_RAFAGA', 30)),
+    'ip': (_entero('LIMITE_IP_POR_MINUTO', 600), _entero('LIMITE_IP_RAFAGA', 200)),
+    'token': (_entero('LIMITE_TOKEN_POR_MINUTO', 1800), _entero('LIMITE_TOKEN_RAFAGA', 300)),
+}
+
+MAXIMO_CUBETAS = 10000
+PROXIES_CONFIABLES = _entero('LIMITE_PROXIES_CONFIABLES', 1)
+
+
+class CubetasTokens:
+    """Token buckets en memoria: cada clave recupera por_minuto/60 fichas por segundo hasta la ráfaga"""
+
+    def __init__(self):
+        self.cubetas = {}  # clave -> [fichas, última actualización]
+        self.lock = threading.Lock()
+
+    def consumir(self, clave, por_minuto, rafaga):
+        """(permitido, segundos hasta la próxima ficha)"""
+        ahora = time.monotonic()
+        por_segundo = por_minuto / 60
+        with self.lock:
+            cubeta = self.cubetas.get(clave)
+            if cubeta is None:
+                if len(self.cubetas) >= MAXIMO_CUBETAS:
+                    self._purgar(ahora)
+                cubeta = self.cubetas[clave] = [float(rafaga), ahora]
+            else:
+                cubeta[0] = min(rafaga, cubeta[0] + (ahora - cubeta[1]) * por_segundo)
+                cubeta[1] = ahora
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return True, 0
+            return False, (1 - cubeta[0]) / por_segundo if por_segundo else 60
+
+    def _purgar(self, ahora):
+        # Las cubetas sin uso en el último minuto ya estarían llenas: se pueden olvidar
+        for clave in [c for c, (_, ultima) in self.cubetas.items() if ahora - ultima > 60]:
+            del self.cubetas[clave]
+        if len(self.cubetas) >= MAXIMO_CUBETAS:
+            self.cubetas.clear()
+
+
+class LimitePeticiones:
+    def __init__(self):
+        self.cubetas = CubetasTokens()
+        self.motor = None
+        self.max_overflow = 0
+        self.compartido = os.environ.get('LIMITE_COMPARTIDO', '').strip().lower() in ('1', 'true', 'si', 'sí')
+        self.espera_maxima_ms = _entero('LIMITE_ESPERA_POOL_MS', 250)
+        self.lock = threading.Lock()
+        self.limitadas = 0
+        self.descartadas = 0
+        self.ultima_limpieza = 0
+
+    def init_app(self, app, db):
+        """Registra la verificación antes de cada petición a una ruta pública"""
+        with app.app_context():
+            self.motor = db.engine
+        self.max_overflow = max(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}).get('max_overflow', 0), 0)
+        app.before_request(self._verificar)
+        app.extensions['limite_peticiones'] = self
+
+    def crear_tabla(self):
+        """Contadores por minuto compartidos entre workers (LIMITE_COMPARTIDO)"""
+        with self.motor.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS limite_peticion (
+                    clave VARCHAR(100) NOT NULL,
+                    minuto INTEGER NOT NULL,
+                    conteo INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (clave, minuto)
+                )
+            """))
+
+    @staticmethod
+    def ip_cliente():
+        """IP del cliente según el X-Forwarded-For que agrega el proxy de Railway.
+
+        Se toma la entrada que agregó el último proxy confiable: las de la izquierda las
+        puede escribir el propio cliente.
+        """
+        reenviadas = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',') if ip.strip()]
+        if PROXIES_CONFIABLES and len(reenviadas) >= PROXIES_CONFIABLES:
+            return reenviadas[-PROXIES_CONFIABLES]
+        return request.remote_addr or 'desconocida'
+
+    def _claves(self):
+        ip = self.ip_cliente()
+        navegador = hashlib.sha1(request.headers.get('User-Agent', '').encode('utf-8')).hexdigest()[:10]
+        token = (request.view_args or {}).get('token', '')
+        return {
+            'cliente': f'c:{ip}:{navegador}',
+            'ip': f'i:{ip}',
+            'token': f't:{hashlib.sha1(token.encode("utf-8")).hexdigest()[:16]}',
+        }
+
+    def _pool_saturado(self):
+        pool = self.motor.pool if self.motor is not None else None
+        if isinstance(pool, QueuePool) and pool.checkedout() >= pool.size() + self.max_overflow:
+            return True
+        return self.espera_maxima_ms > 0 and metricas_pool.espera_reciente_ms() > self.espera_maxima_ms
+
+    def _contar_compartido(self, claves):
+        """Cuenta la petición en la tabla compartida y devuelve el ámbito excedido, o None"""
+        minuto = int(time.time() // 60)
+        try:
+            with self.motor.begin() as conn:
+                for ambito, clave in claves.items():
+                    conteo = conn.execute(text("""
+                        INSERT INTO limite_peticion (clave, minuto, conteo) VALUES (:clave, :minuto, 1)
+                        ON CONFLICT (clave, minuto) DO UPDATE SET conteo = limite_peticion.conteo + 1
+                        RETURNING conteo
+                    """), {'clave': clave, 'minuto': minuto}).scalar()
+                    por_minuto, rafaga = LIMITES[ambito]
+                    if conteo > por_minuto + rafaga:
+                        return ambito
+                if time.monotonic() - self.ultima_limpieza > 60:
+                    self.ultima_limpieza = time.monotonic()
+                    conn.execute(text("DELETE FROM limite_peticion WHERE minuto < :minuto"),
+                                 {'minuto': minuto - 1})
+        except Exception as e:
+            # Sin la tabla compartida siguen valiendo los límites en memoria
+            logger.warning(f"⚠️ No se pudo actualizar el contador compartido: {e}")
+        return None
+
+    def _verificar(self):
+        if request.endpoint not in ENDPOINTS_PUBLICOS:
+            return None
+
+        if self._pool_saturado():
+            with self.lock:
+                self.descartadas += 1
+            logger.warning(f"⚠️ Petición pública descartada ({request.endpoint}): pool de conexiones saturado")
+            return self._respuesta(503, 5, 'El sistema está ocupado. Intenta de nuevo en unos segundos.')
+
+        claves = self._claves()
+        for ambito, clave in claves.items():
+            por_minuto, rafaga = LIMITES[ambito]
+            permitido, espera = self.cubetas.consumir(clave, por_minuto, rafaga)
+            if not permitido:
+                return self._limitada(ambito, espera)
+
+        if self.compartido:
+            ambito = self._contar_compartido(claves)
+            if ambito:
+                return self._limitada(ambito, 60 - time.time() % 60)
+        return None
+
+    def _limitada(self, ambito, espera):
+        with self.lock:
+            self.limitadas += 1
+        logger.warning(f"⚠️ Límite de peticiones por {ambito} excedido en {request.endpoint} "
+                       f"desde {self.ip_cliente()}")
+        return self._respuesta(429, espera, 'Demasiadas solicitudes. Espera un momento e intenta de nuevo.')
+
+    @staticmethod
+    def _respuesta(estado, espera, mensaje):
+        if request.endpoint in ENDPOINTS_JSON:
+            respuesta = jsonify({'success': False, 'message': mensaje})
+        else:
+            respuesta = make_response(
+                '<!doctype html><meta charset="utf-8"><meta name="viewport" content="width=device-width">'
+                f'<p style="font-family:sans-serif;margin:2em;text-align:center">{mensaje}</p>'
+            )
+        respuesta.status_code = estado
+        respuesta.headers['Retry-After'] = str(max(1, int(espera + 0.999)))
+        respuesta.cache_control.no_store = True
+        return respuesta
+
+    def metricas(self):
+        with self.lock:
+            return {
+                'limitadas': self.limitadas,
+                'descartadas_por_carga': self.descartadas,
+                'cubetas': len(self.cubetas.cubetas),
+                'compartido': self.compartido,
+                'espera_pool_reciente_ms': round(metricas_pool.espera_reciente_ms(), 2),
+            }
+
+
+limite_peticiones = LimitePeticiones()
@@ -60,15 +60,3 @@ COMMENT ON COLUMN solicitud_empleado.estado IS 'Estado de la solicitud: PENDIENT
 COMMENT ON COLUMN solicitud_empleado.datos_adicionales IS 'Datos adicionales específicos según el tipo de solicitud almacenados como JSON';
 COMMENT ON COLUMN solicitud_empleado.adjuntos_data IS 'Archivos adjuntos del empleado almacenados como BYTEA (JSON serializado)';
 COMMENT ON COLUMN solicitud_empleado.documentos_admin_data IS 'Documentos del administrador almacenados como BYTEA (JSON serializado)';
-
--- Verificar que la tabla se creó correctamente
-SELECT 
-    table_name,
-    column_name,
-    data_type,
-    is_nullable,
-    column_default
-FROM information_schema.columns
-WHERE table_name = 'solicitud_empleado'
-ORDER BY ordinal_position;
-
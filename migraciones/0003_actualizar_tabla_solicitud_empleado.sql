@@ -13,15 +13,3 @@ ALTER COLUMN fecha_fin DROP NOT NULL;
 
 -- Agregar comentario a la nueva columna
 COMMENT ON COLUMN solicitud_empleado.datos_adicionales IS 'Datos adicionales específicos según el tipo de solicitud almacenados como JSON';
-
--- Verificar que los cambios se aplicaron correctamente
-SELECT 
-    column_name,
-    data_type,
-    is_nullable,
-    column_default
-FROM information_schema.columns
-WHERE table_name = 'solicitud_empleado'
-    AND column_name IN ('datos_adicionales', 'fecha_fin')
-ORDER BY ordinal_position;
-
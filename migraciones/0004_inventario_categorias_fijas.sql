@@ -15,6 +15,3 @@ DROP TABLE IF EXISTS categoria_inventario;
 
 -- Actualizar productos existentes para usar categorías fijas (si hay datos)
 UPDATE producto SET categoria = 'ALMACEN GENERAL' WHERE categoria IS NULL OR categoria = '';
-
--- Verificar que todo esté bien
-SELECT 'Base de datos arreglada correctamente' as status;
@@ -1,5 +1,4 @@
 -- Migración para agregar columna 'periodo' al sistema de inventarios mensuales
--- Ejecutar este script en pgAdmin
 
 -- 1. Agregar columna 'periodo' a la tabla 'producto'
 ALTER TABLE producto ADD COLUMN IF NOT EXISTS periodo VARCHAR(7);
@@ -33,31 +32,3 @@ BEGIN
         UNIQUE (codigo, categoria, periodo);
     END IF;
 END $$;
-
--- 7. Verificar que las columnas se agregaron correctamente
-SELECT 
-    'producto' as tabla,
-    column_name, 
-    data_type, 
-    is_nullable
-FROM information_schema.columns 
-WHERE table_name = 'producto' AND column_name = 'periodo'
-
-UNION ALL
-
-SELECT 
-    'movimiento_inventario' as tabla,
-    column_name, 
-    data_type, 
-    is_nullable
-FROM information_schema.columns 
-WHERE table_name = 'movimiento_inventario' AND column_name = 'periodo';
-
--- 8. Mostrar estadísticas de productos por período
-SELECT 
-    periodo,
-    COUNT(*) as total_productos,
-    COUNT(DISTINCT categoria) as categorias_con_productos
-FROM producto 
-GROUP BY periodo 
-ORDER BY periodo;
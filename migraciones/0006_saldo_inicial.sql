@@ -2,53 +2,29 @@
 -- MIGRACIÓN: Sistema de Saldo Inicial y Cierre Mensual
 -- ============================================
 -- Este script agrega las columnas necesarias para el sistema mejorado de inventarios
--- Ejecutar en pgAdmin o en tu herramienta de PostgreSQL
 
--- 1. Agregar columna 'saldo_inicial' a la tabla 'producto'
-ALTER TABLE producto ADD COLUMN IF NOT EXISTS saldo_inicial INTEGER DEFAULT 0;
+-- 1. Agregar 'saldo_inicial' a la tabla 'producto' y, solo cuando la columna es nueva,
+--    tomar el stock_actual de cada producto como su saldo inicial.
+--    En una base donde la columna ya existe (creada por la aplicación o aplicada a mano)
+--    no se toca: un saldo inicial en 0 puede ser legítimo.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'producto' AND column_name = 'saldo_inicial'
+    ) THEN
+        ALTER TABLE producto ADD COLUMN saldo_inicial INTEGER DEFAULT 0;
+        UPDATE producto SET saldo_inicial = stock_actual;
+    END IF;
+END $$;
 
 -- 2. Agregar columna 'mes_cerrado' a la tabla 'producto'
 ALTER TABLE producto ADD COLUMN IF NOT EXISTS mes_cerrado BOOLEAN DEFAULT FALSE;
 
--- 3. Actualizar saldo_inicial con el stock_actual actual de cada producto
--- (Esto es para productos existentes que no tienen saldo_inicial)
-UPDATE producto 
-SET saldo_inicial = stock_actual 
-WHERE saldo_inicial IS NULL OR saldo_inicial = 0;
-
--- 4. Opcional: Si quieres recalcular el stock_actual basado en movimientos
--- (Descomenta estas líneas solo si quieres recalcular todo desde cero)
-
-/*
--- Recalcular stock_actual para cada producto basado en:
--- saldo_inicial + entradas - salidas
-UPDATE producto p
-SET stock_actual = (
-    SELECT COALESCE(p.saldo_inicial, 0) + 
-           COALESCE(SUM(CASE WHEN m.tipo_movimiento = 'ENTRADA' THEN m.cantidad ELSE 0 END), 0) -
-           COALESCE(SUM(CASE WHEN m.tipo_movimiento = 'SALIDA' THEN m.cantidad ELSE 0 END), 0)
-    FROM movimiento_inventario m
-    WHERE m.producto_id = p.id
-);
-*/
-
--- 5. Verificar la estructura actualizada
-SELECT 
-    codigo,
-    nombre,
-    categoria,
-    periodo,
-    saldo_inicial,
-    stock_actual,
-    mes_cerrado
-FROM producto
-ORDER BY categoria, codigo
-LIMIT 10;
-
 -- ============================================
 -- NOTAS IMPORTANTES:
 -- ============================================
--- 
+--
 -- 1. 'saldo_inicial': Es el saldo al inicio del período (mes)
 --    - Cuando copias un mes nuevo, el saldo final del mes anterior
 --      se convierte en el saldo inicial del nuevo mes
@@ -68,4 +44,3 @@ LIMIT 10;
 --      → Octubre mes_cerrado = TRUE (para evitar cambios)
 --
 -- ============================================
-
@@ -2,7 +2,6 @@
 -- PROCEDIMIENTOS ALMACENADOS PARA INVENTARIO
 -- ============================================
 -- Estos procedimientos automatizan operaciones complejas del inventario mensual
--- Ejecutar en pgAdmin o en tu herramienta de PostgreSQL
 
 -- ============================================
 -- 1. PROCEDIMIENTO: Cerrar Mes de Inventario
@@ -0,0 +1,14 @@
+-- Cambios de esquema que antes se verificaban en cada arranque desde init_db()
+-- (create_all crea las tablas nuevas pero no agrega columnas ni índices a las existentes)
+
+-- 1. Contratos generados: archivo guardado en la base de datos y vista previa en caché
+ALTER TABLE contrato_generado
+ADD COLUMN IF NOT EXISTS archivo_data BYTEA,
+ADD COLUMN IF NOT EXISTS vista_previa_hash VARCHAR(80),
+ADD COLUMN IF NOT EXISTS vista_previa_html TEXT,
+ADD COLUMN IF NOT EXISTS vista_previa_simple_html TEXT;
+
+-- 2. Índices de visitantes
+CREATE INDEX IF NOT EXISTS ix_visitante_documento ON visitante (documento);
+CREATE INDEX IF NOT EXISTS ix_visitante_documento_fecha_entrada ON visitante (documento, fecha_entrada);
+CREATE INDEX IF NOT EXISTS ix_visitante_en_visita ON visitante (id) WHERE estado_visita = 'En visita';
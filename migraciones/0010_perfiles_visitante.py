@@ -0,0 +1,15 @@
+"""Perfiles de visitantes recurrentes a partir del historial de visitas"""
+
+from registro import obtener_logger
+
+logger = obtener_logger('migraciones')
+
+
+def aplicar(db, modelos):
+    PerfilVisitante = modelos['PerfilVisitante']
+    if db.session.query(PerfilVisitante.id).first():
+        return
+    creados = PerfilVisitante.poblar_desde_visitantes()
+    db.session.commit()
+    if creados:
+        logger.info(f"✅ {creados} perfiles de visitantes creados desde el historial")
@@ -0,0 +1,21 @@
+"""Usuario administrador por defecto"""
+
+from werkzeug.security import generate_password_hash
+from registro import obtener_logger
+
+logger = obtener_logger('migraciones')
+
+
+def aplicar(db, modelos):
+    User = modelos['User']
+    if User.query.filter_by(email='admin@floresjuncalito.com').first():
+        logger.info("✅ Usuario administrador ya existe")
+        return
+    db.session.add(User(
+        email='admin@floresjuncalito.com',
+        username='Administrador',
+        password_hash=generate_password_hash('nueva_contraseña_2024'),
+        is_admin=True
+    ))
+    db.session.commit()
+    logger.info("✅ Usuario administrador creado: admin@floresjuncalito.com / nueva_contraseña_2024")
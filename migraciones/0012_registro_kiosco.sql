@@ -0,0 +1,11 @@
+-- Marcaciones del kiosco de asistencia sin conexión (idempotencia por id del dispositivo)
+CREATE TABLE IF NOT EXISTS registro_kiosco (
+    id_cliente VARCHAR(64) PRIMARY KEY,
+    documento VARCHAR(20) NOT NULL,
+    empleado_id INTEGER REFERENCES empleado(id),
+    tipo VARCHAR(10) NOT NULL,
+    marcado_en TIMESTAMP WITHOUT TIME ZONE,
+    estado VARCHAR(30) NOT NULL,
+    mensaje VARCHAR(300),
+    recibido_en TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
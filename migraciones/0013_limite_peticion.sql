@@ -0,0 +1,7 @@
+-- Contadores por minuto del límite de peticiones públicas compartido entre workers (LIMITE_COMPARTIDO)
+CREATE TABLE IF NOT EXISTS limite_peticion (
+    clave VARCHAR(100) NOT NULL,
+    minuto INTEGER NOT NULL,
+    conteo INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (clave, minuto)
+);
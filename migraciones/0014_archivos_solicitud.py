@@ -0,0 +1,50 @@
+"""Adjuntos de solicitudes del JSON en hexadecimal a una fila por archivo en archivo_solicitud"""
+
+import json
+import hashlib
+import mimetypes
+from sqlalchemy import text
+from registro import obtener_logger
+
+logger = obtener_logger('migraciones')
+
+COLUMNAS = (('adjuntos_data', 'empleado'), ('documentos_admin_data', 'admin'))
+
+
+def aplicar(db, modelos):
+    ArchivoSolicitud = modelos['ArchivoSolicitud']
+    migrados = 0
+    for columna, origen in COLUMNAS:
+        # Una solicitud a la vez: cada JSON puede pesar decenas de MB
+        ids = db.session.execute(text(
+            f"SELECT id FROM solicitud_empleado WHERE {columna} IS NOT NULL ORDER BY id"
+        )).scalars().all()
+        for solicitud_id in ids:
+            if db.session.query(ArchivoSolicitud.id).filter_by(solicitud_id=solicitud_id, origen=origen).first():
+                continue
+            datos = db.session.execute(text(
+                f"SELECT {columna} FROM solicitud_empleado WHERE id = :id"
+            ), {'id': solicitud_id}).scalar()
+            try:
+                archivos = json.loads(bytes(datos).decode())
+            except (ValueError, UnicodeDecodeError):
+                logger.warning(f"⚠️ Solicitud {solicitud_id}: {columna} no es un JSON válido, se deja sin migrar")
+                continue
+            for indice, archivo in enumerate(archivos):
+                contenido = bytes.fromhex(archivo['data'])
+                db.session.execute(db.insert(ArchivoSolicitud).values(
+                    solicitud_id=solicitud_id,
+                    origen=origen,
+                    indice=indice,
+                    nombre=archivo['nombre'][:255],
+                    tipo_mime=mimetypes.guess_type(archivo['nombre'])[0] or 'application/octet-stream',
+                    tamano=len(contenido),
+                    sha256=hashlib.sha256(contenido).hexdigest(),
+                    contenido=contenido
+                ))
+                migrados += 1
+            db.session.execute(text(f"UPDATE solicitud_empleado SET {columna} = NULL WHERE id = :id"),
+                               {'id': solicitud_id})
+            db.session.commit()
+    if migrados:
+        logger.info(f"✅ {migrados} adjuntos de solicitudes pasados a archivo_solicitud")
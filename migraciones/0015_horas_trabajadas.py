@@ -0,0 +1,28 @@
+"""Horas trabajadas de las asistencias con salida registrada por el QR público o el kiosco"""
+
+from registro import obtener_logger
+
+logger = obtener_logger('migraciones')
+
+TAMANO_LOTE = 1000
+
+
+def aplicar(db, modelos):
+    Asistencia = modelos['Asistencia']
+    completadas = 0
+    while True:
+        # Al guardar, el after_flush borra la nómina guardada de esos meses
+        lote = Asistencia.query.filter(
+            Asistencia.horas_trabajadas.is_(None),
+            Asistencia.hora_entrada.isnot(None),
+            Asistencia.hora_salida.isnot(None),
+            Asistencia.hora_salida >= Asistencia.hora_entrada
+        ).order_by(Asistencia.id).limit(TAMANO_LOTE).all()
+        if not lote:
+            break
+        for asistencia in lote:
+            asistencia.registrar_salida(asistencia.hora_salida)
+        db.session.commit()
+        completadas += len(lote)
+    if completadas:
+        logger.info(f"✅ Horas trabajadas calculadas en {completadas} asistencias")
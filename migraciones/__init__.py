@@ -0,0 +1,174 @@
+"""
+Migraciones versionadas del esquema
+Cada archivo NNNN_nombre.sql o NNNN_nombre.py de esta carpeta es una versión. La tabla
+version_esquema guarda las versiones aplicadas; si la última ya está registrada, el
+arranque hace una sola consulta y no ejecuta DDL.
+
+- Los .sql son de PostgreSQL (funciones, vistas, ALTER TABLE). En SQLite solo se
+  registran: el esquema de desarrollo lo crea db.create_all() a partir de los modelos.
+- Los .py definen aplicar(db, modelos) y se ejecutan en cualquier motor (datos iniciales).
+
+Se aplican con `python -m migraciones` en el despliegue, antes de arrancar gunicorn.
+"""
+
+import os
+import re
+import time
+import importlib.util
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from registro import obtener_logger
+
+logger = obtener_logger('migraciones')
+
+CARPETA = os.path.dirname(os.path.abspath(__file__))
+PATRON_ARCHIVO = re.compile(r'^(\d{4})_(\w+)\.(sql|py)$')
+
+# Clave del advisory lock de PostgreSQL: un solo proceso migra a la vez
+CLAVE_BLOQUEO = 72210038
+
+
+def listar_migraciones():
+    """[(version, nombre, ruta)] ordenado por versión"""
+    migraciones = []
+    for archivo in os.listdir(CARPETA):
+        coincidencia = PATRON_ARCHIVO.match(archivo)
+        if coincidencia:
+            migraciones.append((int(coincidencia.group(1)), archivo, os.path.join(CARPETA, archivo)))
+    migraciones.sort()
+    versiones = [m[0] for m in migraciones]
+    if len(versiones) != len(set(versiones)):
+        raise RuntimeError("Hay dos migraciones con el mismo número de versión")
+    return migraciones
+
+
+def version_actual(conexion):
+    """Última versión aplicada, 0 si no hay ninguna o None si la tabla no existe"""
+    try:
+        return conexion.execute(text("SELECT COALESCE(MAX(version), 0) FROM version_esquema")).scalar()
+    except DBAPIError:
+        conexion.rollback()
+        return None
+
+
+def _crear_tabla_versiones(conexion):
+    conexion.execute(text("""
+        CREATE TABLE IF NOT EXISTS version_esquema (
+            version INTEGER PRIMARY KEY,
+            nombre VARCHAR(200) NOT NULL,
+            aplicada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """))
+
+
+def _versiones_aplicadas(conexion):
+    return {fila[0] for fila in conexion.execute(text("SELECT version FROM version_esquema"))}
+
+
+def _aplicar_sql(conexion, ruta):
+    if conexion.dialect.name != 'postgresql':
+        return False
+    with open(ruta, encoding='utf-8') as f:
+        sql = f.read()
+    # Sin parámetros: el driver no interpreta los % ni los : de las funciones plpgsql
+    conexion.exec_driver_sql(sql, execution_options={'no_parameters': True})
+    return True
+
+
+def _aplicar_python(db, nombre, ruta, modelos):
+    spec = importlib.util.spec_from_file_location(f'migraciones.m{nombre[:4]}', ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    modulo.aplicar(db, modelos)
+
+
+def _registrar(conexion, version, nombre):
+    conexion.execute(
+        text("INSERT INTO version_esquema (version, nombre) VALUES (:version, :nombre)"),
+        {'version': version, 'nombre': nombre}
+    )
+
+
+def migrar(db, crear_tablas, modelos=None):
+    """
+    Aplica las migraciones pendientes. Devuelve cuántas se registraron.
+    crear_tablas() crea las tablas que falten (db.create_all y similares) y solo se
+    llama si hay algo pendiente. Debe ejecutarse dentro de un app_context.
+    """
+    modelos = modelos or {}
+    migraciones = listar_migraciones()
+    ultima = migraciones[-1][0] if migraciones else 0
+
+    with db.engine.connect() as conexion:
+        if version_actual(conexion) == ultima:
+            logger.info(f"✅ Esquema al día (versión {ultima}), sin migraciones pendientes")
+            return 0
+
+    es_postgres = db.engine.dialect.name == 'postgresql'
+    bloqueo = db.engine.connect()
+    try:
+        if es_postgres:
+            # Si otro proceso está migrando, esperar a que termine
+            bloqueo.execute(text("SELECT pg_advisory_lock(:clave)"), {'clave': CLAVE_BLOQUEO})
+            bloqueo.commit()
+
+        with db.engine.begin() as conexion:
+            _crear_tabla_versiones(conexion)
+        with db.engine.connect() as conexion:
+            aplicadas = _versiones_aplicadas(conexion)
+        pendientes = [m for m in migraciones if m[0] not in aplicadas]
+        if not pendientes:
+            return 0
+
+        logger.info(f"🔄 {len(pendientes)} migraciones pendientes")
+        crear_tablas()
+
+        for version, nombre, ruta in pendientes:
+            inicio = time.perf_counter()
+            try:
+                if ruta.endswith('.sql'):
+                    # El script y su registro van en la misma transacción
+                    with db.engine.begin() as conexion:
+                        ejecutada = _aplicar_sql(conexion, ruta)
+                        _registrar(conexion, version, nombre)
+                else:
+                    # Las de Python usan db.session y confirman sus propios cambios (son idempotentes)
+                    _aplicar_python(db, nombre, ruta, modelos)
+                    ejecutada = True
+                    with db.engine.begin() as conexion:
+                        _registrar(conexion, version, nombre)
+            except Exception as e:
+                logger.error(f"❌ Error en la migración {nombre}: {str(e)}")
+                raise
+            duracion = (time.perf_counter() - inicio) * 1000
+            if ejecutada:
+                logger.info(f"✅ Migración {nombre} aplicada ({duracion:.0f} ms)")
+            else:
+                logger.info(f"⏭️ Migración {nombre} registrada (solo PostgreSQL)")
+        return len(pendientes)
+    finally:
+        if es_postgres:
+            bloqueo.execute(text("SELECT pg_advisory_unlock(:clave)"), {'clave': CLAVE_BLOQUEO})
+            bloqueo.commit()
+        bloqueo.close()
+
+
+def reiniciar(db):
+    """Olvida las versiones aplicadas para que la próxima migración recree todo el esquema"""
+    with db.engine.begin() as conexion:
+        _crear_tabla_versiones(conexion)
+        conexion.execute(text("DELETE FROM version_esquema"))
+
+
+def estado(db):
+    """Versiones aplicadas y pendientes"""
+    migraciones = listar_migraciones()
+    with db.engine.connect() as conexion:
+        if version_actual(conexion) is None:
+            aplicadas = set()
+        else:
+            aplicadas = _versiones_aplicadas(conexion)
+    return {
+        'aplicadas': [nombre for version, nombre, _ in migraciones if version in aplicadas],
+        'pendientes': [nombre for version, nombre, _ in migraciones if version not in aplicadas]
+    }
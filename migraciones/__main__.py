@@ -0,0 +1,32 @@
+"""
+Aplica las migraciones pendientes (paso de despliegue, antes de arrancar gunicorn)
+
+    python -m migraciones            aplica lo pendiente
+    python -m migraciones --estado   lista las versiones aplicadas y pendientes
+"""
+
+import os
+import sys
+
+# Evita que importar app dispare la inicialización automática de los workers
+os.environ['MIGRACIONES_CLI'] = '1'
+
+import app as aplicacion  # noqa: E402
+import migraciones  # noqa: E402
+
+
+def main(argumentos):
+    if '--estado' in argumentos:
+        with aplicacion.app.app_context():
+            resultado = migraciones.estado(aplicacion.db)
+        for nombre in resultado['aplicadas']:
+            print(f"✅ {nombre}")
+        for nombre in resultado['pendientes']:
+            print(f"⏳ {nombre}")
+        return 0
+    aplicacion.init_db()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
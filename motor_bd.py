@@ -0,0 +1,185 @@
+"""
+Configuración del motor de base de datos
+Opciones del pool de conexiones tomadas de variables de entorno y métricas de uso.
+
+PostgreSQL en Railway cierra las conexiones inactivas: sin pre-ping ni reciclaje, la
+primera petición después de un rato sin tráfico recibe una conexión muerta del pool.
+"""
+
+import os
+import time
+import threading
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as TimeoutPool
+from sqlalchemy.pool import QueuePool
+from registro import obtener_logger
+
+logger = obtener_logger('motor_bd')
+
+
+def _entero(nombre, defecto):
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except ValueError:
+        logger.warning(f"⚠️ {nombre} inválido, usando {defecto}")
+        return defecto
+
+
+def _booleano(nombre, defecto):
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in ('1', 'true', 'si', 'sí', 'yes', 'on')
+
+
+# Promedio móvil de la espera por conexión: peso de cada medición y vida media sin tráfico
+PESO_ESPERA = 0.2
+VIDA_MEDIA_ESPERA = 2.0
+
+
+class MetricasPool:
+    """Contadores de uso del pool (por worker)"""
+
+    def __init__(self):
+        self.pool_timeout = _entero('DB_POOL_TIMEOUT', 30)
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.checkouts = 0
+            self.checkins = 0
+            self.conexiones_creadas = 0
+            self.invalidaciones = 0
+            self.timeouts = 0
+            self.espera_total = 0.0
+            self.espera_maxima = 0.0
+            self.esperas_lentas = 0  # Más de 100 ms para obtener conexión
+            self.espera_reciente = 0.0  # Promedio móvil exponencial, en segundos
+            self.ultima_espera = time.monotonic()
+
+    def registrar_espera(self, segundos, timeout=False):
+        with self.lock:
+            self.espera_reciente = self._espera_decaida() * (1 - PESO_ESPERA) + (
+                self.pool_timeout if timeout else segundos) * PESO_ESPERA
+            self.ultima_espera = time.monotonic()
+            if timeout:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_maxima = max(self.espera_maxima, segundos)
+            if segundos > 0.1:
+                self.esperas_lentas += 1
+
+    def _espera_decaida(self):
+        # Sin checkouts no hay mediciones nuevas: el promedio se reduce a la mitad cada VIDA_MEDIA_ESPERA
+        transcurrido = time.monotonic() - self.ultima_espera
+        return self.espera_reciente * 0.5 ** (transcurrido / VIDA_MEDIA_ESPERA)
+
+    def espera_reciente_ms(self):
+        """Espera típica reciente para obtener una conexión del pool"""
+        with self.lock:
+            return self._espera_decaida() * 1000
+
+    def incrementar(self, campo):
+        with self.lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def resumen(self, pool=None):
+        """Contadores y, si se pasa el pool, su estado actual"""
+        with self.lock:
+            datos = {
+                'checkouts': self.checkouts,
+                'checkins': self.checkins,
+                'conexiones_creadas': self.conexiones_creadas,
+                'invalidaciones': self.invalidaciones,
+                'timeouts': self.timeouts,
+                'espera_promedio_ms': round(self.espera_total / self.checkouts * 1000, 2) if self.checkouts else 0,
+                'espera_maxima_ms': round(self.espera_maxima * 1000, 2),
+                'esperas_lentas': self.esperas_lentas,
+                'espera_reciente_ms': round(self._espera_decaida() * 1000, 2),
+                'pid': os.getpid()
+            }
+        if isinstance(pool, QueuePool):
+            datos['pool'] = {
+                'tamano': pool.size(),
+                'en_uso': pool.checkedout(),
+                'disponibles': pool.checkedin(),
+                'overflow': pool.overflow(),
+                'estado': pool.status()
+            }
+        return datos
+
+
+metricas_pool = MetricasPool()
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que mide cuánto se espera para obtener una conexión"""
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexion = super()._do_get()
+        except TimeoutPool:
+            metricas_pool.registrar_espera(0, timeout=True)
+            raise
+        metricas_pool.registrar_espera(time.perf_counter() - inicio)
+        return conexion
+
+
+@event.listens_for(PoolMedido, 'connect')
+def _al_conectar(dbapi_connection, connection_record):
+    metricas_pool.incrementar('conexiones_creadas')
+
+
+@event.listens_for(PoolMedido, 'checkin')
+def _al_devolver(dbapi_connection, connection_record):
+    metricas_pool.incrementar('checkins')
+
+
+@event.listens_for(PoolMedido, 'invalidate')
+def _al_invalidar(dbapi_connection, connection_record, exception):
+    metricas_pool.incrementar('invalidaciones')
+
+
+def opciones_motor(database_uri):
+    """SQLALCHEMY_ENGINE_OPTIONS según la base de datos y las variables DB_*"""
+    if not database_uri.startswith('postgresql'):
+        # SQLite en desarrollo: opciones por defecto
+        return {}
+
+    connect_args = {
+        'connect_timeout': _entero('DB_CONNECT_TIMEOUT', 10),
+        # Keepalives TCP para detectar antes las conexiones cortadas por el proxy
+        'keepalives': 1,
+        'keepalives_idle': _entero('DB_KEEPALIVES_IDLE', 60),
+        'keepalives_interval': 10,
+        'keepalives_count': 5,
+    }
+
+    statement_timeout = _entero('DB_STATEMENT_TIMEOUT_MS', 30000)
+    if statement_timeout > 0:
+        connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+
+    # psycopg 3 prepara en el servidor las consultas que se repiten en una conexión.
+    # Usar 'none' con PgBouncer en modo transacción, que no admite sentencias preparadas.
+    umbral = os.environ.get('DB_PREPARE_THRESHOLD', '1').strip().lower()
+    connect_args['prepare_threshold'] = None if umbral in ('', 'none', 'off') else int(umbral)
+
+    opciones = {
+        'poolclass': PoolMedido,
+        'pool_size': _entero('DB_POOL_SIZE', 5),
+        'max_overflow': _entero('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _entero('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _entero('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _booleano('DB_POOL_PRE_PING', True),
+        # LIFO: las conexiones que sobran quedan quietas y se reciclan, en vez de rotar todas
+        'pool_use_lifo': True,
+        'connect_args': connect_args,
+    }
+    logger.info(f"🔌 Pool de conexiones: size={opciones['pool_size']}, overflow={opciones['max_overflow']}, "
+                f"recycle={opciones['pool_recycle']}s, pre_ping={opciones['pool_pre_ping']}, "
+                f"statement_timeout={statement_timeout}ms")
+    return opciones
@@ -11,40 +11,29 @@ import threading
 import queue
 import os
 import warnings
+from difusion_notificaciones import difusion_notificaciones
+from registro import obtener_logger
+
+logger = obtener_logger('notificaciones')
 
 # Suprimir advertencias de playsound
 warnings.filterwarnings("ignore", category=UserWarning, module="playsound")
 
-# Intentar importar db y Notificacion desde app.py
-# Usar import lazy para evitar import circular
-DB_AVAILABLE = False
-db = None
-Notificacion = None
+# Se importa al reproducir el primer sonido (en el servidor normalmente no está instalado)
+PLAYSOUND_AVAILABLE = None
+playsound = None
 
-def _import_db_models():
-    global DB_AVAILABLE, db, Notificacion
-    if not DB_AVAILABLE:
+def _importar_playsound():
+    global PLAYSOUND_AVAILABLE, playsound
+    if PLAYSOUND_AVAILABLE is None:
         try:
-            from app import db as _db, Notificacion as _Notificacion
-            db = _db
-            Notificacion = _Notificacion
-            DB_AVAILABLE = True
-            print("✅ DB y Notificacion importados correctamente")
-        except ImportError as e:
-            print(f"⚠️ No se pudo importar db y Notificacion de app.py: {e}")
-            DB_AVAILABLE = False
-        except Exception as e:
-            print(f"⚠️ Error al importar db y Notificacion: {e}")
-            DB_AVAILABLE = False
-    return DB_AVAILABLE
-
-# Intentar importar playsound, si no está disponible usar un fallback
-try:
-    from playsound import playsound
-    PLAYSOUND_AVAILABLE = True
-except ImportError:
-    PLAYSOUND_AVAILABLE = False
-    print("⚠️ playsound no está disponible. Las notificaciones de sonido estarán deshabilitadas.")
+            from playsound import playsound as _playsound
+            playsound = _playsound
+            PLAYSOUND_AVAILABLE = True
+        except ImportError:
+            PLAYSOUND_AVAILABLE = False
+            logger.warning("⚠️ playsound no está disponible. Las notificaciones de sonido estarán deshabilitadas.")
+    return PLAYSOUND_AVAILABLE
 
 class NotificacionManager:
     def __init__(self):
@@ -57,13 +46,33 @@ class NotificacionManager:
         }
         self.queue_notificaciones = queue.Queue()
         self.thread_procesador = None
-        self.iniciar_procesador()
+        self.lock_procesador = threading.Lock()
+        self.app = None
+        self.db = None
+        self.Notificacion = None
+    
+    def init_app(self, app, db, modelo_notificacion):
+        """Asocia el manager con la aplicación, la base de datos y el modelo Notificacion"""
+        self.app = app
+        self.db = db
+        self.Notificacion = modelo_notificacion
+        difusion_notificaciones.init_app(app, db, modelo_notificacion)
+        app.extensions['notificaciones'] = self
+    
+    @property
+    def bd_disponible(self):
+        return self.db is not None
     
     def iniciar_procesador(self):
-        """Inicia el hilo que procesa las notificaciones"""
-        if self.thread_procesador is None or not self.thread_procesador.is_alive():
-            self.thread_procesador = threading.Thread(target=self._procesar_notificaciones, daemon=True)
-            self.thread_procesador.start()
+        """Inicia el hilo que procesa las notificaciones (solo cuando se encola la primera)"""
+        with self.lock_procesador:
+            if self.thread_procesador is None or not self.thread_procesador.is_alive():
+                self.thread_procesador = threading.Thread(target=self._procesar_notificaciones, daemon=True)
+                self.thread_procesador.start()
+    
+    def _encolar(self, notificacion_data):
+        self.iniciar_procesador()
+        self.queue_notificaciones.put(notificacion_data)
     
     def _procesar_notificaciones(self):
         """Procesa las notificaciones en cola"""
@@ -73,17 +82,15 @@ class NotificacionManager:
                 if notificacion_data is None:
                     break
                 
-                print(f"⚙️ Procesando notificación: {notificacion_data['titulo']}")
+                logger.debug("⚙️ Procesando notificación: %s", notificacion_data['titulo'])
 
                 # Guardar en la base de datos si está disponible
-                if _import_db_models():
+                if self.bd_disponible:
+                    db = self.db
                     try:
-                        # Usar el contexto de aplicación actual
-                        from flask import current_app
-                        app = current_app._get_current_object() if hasattr(current_app, '_get_current_object') else current_app
-                        
-                        with app.app_context():
-                            nueva_notificacion_db = Notificacion(
+                        # El hilo no tiene contexto propio: usar el de la aplicación registrada
+                        with self.app.app_context():
+                            nueva_notificacion_db = self.Notificacion(
                                 titulo=notificacion_data['titulo'],
                                 mensaje=notificacion_data['mensaje'],
                                 tipo=notificacion_data['tipo'],
@@ -94,15 +101,17 @@ class NotificacionManager:
                                 usuario_id=notificacion_data.get('usuario_id')
                             )
                             db.session.add(nueva_notificacion_db)
-                            db.session.commit()
+                            db.session.flush()
                             notificacion_data['id'] = nueva_notificacion_db.id
-                            print(f"✅ Notificación guardada en BD con ID: {nueva_notificacion_db.id}")
+                            difusion_notificaciones.publicar_nueva(db.session, notificacion_data)
+                            db.session.commit()
+                            logger.debug("✅ Notificación guardada en BD con ID: %s", nueva_notificacion_db.id)
                     except Exception as e:
                         try:
                             db.session.rollback()
                         except:
                             pass
-                        print(f"❌ Error al guardar notificación en BD: {e}")
+                        logger.error(f"❌ Error al guardar notificación en BD: {e}")
 
                 # Agregar a la lista de notificaciones (para compatibilidad)
                 self.notificaciones.append(notificacion_data)
@@ -119,7 +128,7 @@ class NotificacionManager:
             except queue.Empty:
                 continue
             except Exception as e:
-                print(f"Error procesando notificación: {e}")
+                logger.error(f"Error procesando notificación: {e}")
     
     def _reproducir_sonido(self, tipo_sonido):
         """Reproduce un sonido según el tipo"""
@@ -130,23 +139,23 @@ class NotificacionManager:
                 archivo_sonido = self.sonidos_disponibles.get('alerta')
             
             if archivo_sonido and os.path.exists(archivo_sonido):
-                print(f"🔊 Reproduciendo sonido: {archivo_sonido}")
+                logger.debug("🔊 Reproduciendo sonido: %s", archivo_sonido)
                 
-                if PLAYSOUND_AVAILABLE:
+                if _importar_playsound():
                     # Reproducir en un hilo separado para no bloquear
                     def reproducir_silencioso():
                         try:
                             # Intentar reproducir con diferentes métodos
                             playsound(archivo_sonido, block=False)
                         except Exception as e:
-                            print(f"⚠️ Error reproduciendo sonido: {e}")
-                            print("⚠️ Continuando sin sonido...")
+                            logger.warning(f"⚠️ Error reproduciendo sonido: {e}")
+                            logger.debug("⚠️ Continuando sin sonido...")
                     
                     threading.Thread(target=reproducir_silencioso, daemon=True).start()
                 else:
-                    print("⚠️ playsound no disponible, usando sonido del navegador")
+                    logger.debug("⚠️ playsound no disponible, usando sonido del navegador")
         except Exception as e:
-            print(f"Error reproduciendo sonido: {e}")
+            logger.error(f"Error reproduciendo sonido: {e}")
     
     def agregar_notificacion(self, titulo, mensaje, tipo='info', tipo_sonido='alerta', icono='fas fa-bell', usuario_id=None):
         """Agrega una nueva notificación"""
@@ -165,14 +174,14 @@ class NotificacionManager:
             'usuario_id': usuario_id
         }
         
-        print(f"🔔 Agregando notificación: {titulo} - {mensaje}")
+        logger.info(f"🔔 Agregando notificación: {titulo} - {mensaje}")
         
         # Guardar directamente en la BD si estamos en contexto de Flask
-        if _import_db_models():
+        if self.bd_disponible:
+            db = self.db
             try:
-                from flask import current_app
-                with current_app.app_context():
-                    nueva_notificacion_db = Notificacion(
+                with self.app.app_context():
+                    nueva_notificacion_db = self.Notificacion(
                         titulo=notificacion_data['titulo'],
                         mensaje=notificacion_data['mensaje'],
                         tipo=notificacion_data['tipo'],
@@ -183,25 +192,28 @@ class NotificacionManager:
                         usuario_id=notificacion_data.get('usuario_id')
                     )
                     db.session.add(nueva_notificacion_db)
-                    db.session.commit()
+                    db.session.flush()
                     notificacion_data['id'] = nueva_notificacion_db.id
-                    print(f"✅ Notificación guardada directamente en BD con ID: {nueva_notificacion_db.id}")
+                    # Se publica en la misma transacción: los demás workers la reciben al confirmar
+                    difusion_notificaciones.publicar_nueva(db.session, notificacion_data)
+                    db.session.commit()
+                    logger.debug("✅ Notificación guardada directamente en BD con ID: %s", nueva_notificacion_db.id)
             except Exception as e:
-                print(f"❌ Error al guardar notificación directamente en BD: {e}")
+                logger.error(f"❌ Error al guardar notificación directamente en BD: {e}")
                 # Si falla, agregar a la cola como fallback
-                self.queue_notificaciones.put(notificacion_data)
+                self._encolar(notificacion_data)
         else:
             # Si no hay BD, agregar a la cola
-            self.queue_notificaciones.put(notificacion_data)
+            self._encolar(notificacion_data)
         
         return notificacion_data['id']
     
     def obtener_notificaciones(self, no_leidas=False):
         """Obtiene las notificaciones de la base de datos"""
-        if _import_db_models():
+        if self.bd_disponible:
+            Notificacion = self.Notificacion
             try:
-                from flask import current_app
-                with current_app.app_context():
+                with self.app.app_context():
                     query = Notificacion.query
                     if no_leidas:
                         query = query.filter_by(leida=False)
@@ -224,7 +236,7 @@ class NotificacionManager:
                         })
                     return result
             except Exception as e:
-                print(f"❌ Error al obtener notificaciones de la BD: {e}")
+                logger.error(f"❌ Error al obtener notificaciones de la BD: {e}")
                 return []
         else:
             # Fallback a la lista en memoria
@@ -234,21 +246,22 @@ class NotificacionManager:
     
     def marcar_como_leida(self, notificacion_id):
         """Marca una notificación como leída"""
-        if _import_db_models():
+        if self.bd_disponible:
+            db = self.db
             try:
-                from flask import current_app
-                with current_app.app_context():
-                    notificacion = Notificacion.query.get(notificacion_id)
+                with self.app.app_context():
+                    notificacion = self.Notificacion.query.get(notificacion_id)
                     if notificacion:
                         notificacion.leida = True
+                        difusion_notificaciones.publicar_cambio(db.session, 'leida', notificacion_id)
                         db.session.commit()
-                        print(f"✅ Notificación {notificacion_id} marcada como leída en BD")
+                        logger.debug("✅ Notificación %s marcada como leída en BD", notificacion_id)
                         return True
                     else:
-                        print(f"⚠️ Notificación {notificacion_id} no encontrada")
+                        logger.warning(f"⚠️ Notificación {notificacion_id} no encontrada")
                         return False
             except Exception as e:
-                print(f"❌ Error marcando notificación como leída: {e}")
+                logger.error(f"❌ Error marcando notificación como leída: {e}")
                 return False
         
         # Fallback a la lista en memoria
@@ -260,16 +273,17 @@ class NotificacionManager:
     
     def limpiar_notificaciones(self):
         """Limpia todas las notificaciones"""
-        if _import_db_models():
+        if self.bd_disponible:
+            db = self.db
             try:
-                from flask import current_app
-                with current_app.app_context():
-                    Notificacion.query.delete()
+                with self.app.app_context():
+                    self.Notificacion.query.delete()
+                    difusion_notificaciones.publicar_cambio(db.session, 'limpiar')
                     db.session.commit()
-                    print("🗑️ Todas las notificaciones eliminadas de la BD")
+                    logger.info("🗑️ Todas las notificaciones eliminadas de la BD")
                     return True
             except Exception as e:
-                print(f"❌ Error limpiando notificaciones: {e}")
+                logger.error(f"❌ Error limpiando notificaciones: {e}")
                 return False
         
         # Fallback a la lista en memoria
@@ -321,22 +335,22 @@ class NotificacionManager:
             sf.write(os.path.join(directorio_sonidos, 'visitante.wav'), sonido_visitante, 44100)
             sf.write(os.path.join(directorio_sonidos, 'alerta.wav'), sonido_alerta, 44100)
             
-            print("✅ Sonidos por defecto creados exitosamente")
+            logger.info("✅ Sonidos por defecto creados exitosamente")
             
         except ImportError:
-            print("⚠️ numpy y soundfile no están disponibles. No se pueden crear sonidos por defecto.")
+            logger.warning("⚠️ numpy y soundfile no están disponibles. No se pueden crear sonidos por defecto.")
         except Exception as e:
-            print(f"⚠️ Error creando sonidos por defecto: {e}")
+            logger.warning(f"⚠️ Error creando sonidos por defecto: {e}")
 
 # Instancia global del manager de notificaciones
 notificacion_manager = NotificacionManager()
 
 def notificar_asistencia_entrada(empleado_nombre, hora):
     """Notifica cuando un empleado registra entrada"""
-    print(f"🚪 FUNCIÓN LLAMADA: notificar_asistencia_entrada({empleado_nombre}, {hora})")
+    logger.debug("🚪 FUNCIÓN LLAMADA: notificar_asistencia_entrada(%s, %s)", empleado_nombre, hora)
     titulo = "Entrada Registrada"
     mensaje = f"{empleado_nombre} registró entrada a las {hora}"
-    print(f"🔔 Creando notificación: {titulo} - {mensaje}")
+    logger.debug("🔔 Creando notificación: %s - %s", titulo, mensaje)
     try:
         notif_id = notificacion_manager.agregar_notificacion(
             titulo=titulo,
@@ -345,17 +359,15 @@ def notificar_asistencia_entrada(empleado_nombre, hora):
             tipo_sonido='entrada',
             icono='fas fa-sign-in-alt'
         )
-        print(f"✅ Notificación creada con ID: {notif_id}")
+        logger.debug("✅ Notificación creada con ID: %s", notif_id)
         return notif_id
     except Exception as e:
-        print(f"❌ Error creando notificación: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ Error creando notificación: {e}")
         return None
 
 def notificar_asistencia_salida(empleado_nombre, hora):
     """Notifica cuando un empleado registra salida"""
-    print(f"🚪 Notificando salida de {empleado_nombre} a las {hora}")
+    logger.debug("🚪 Notificando salida de %s a las %s", empleado_nombre, hora)
     titulo = "Salida Registrada"
     mensaje = f"{empleado_nombre} registró salida a las {hora}"
     return notificacion_manager.agregar_notificacion(
@@ -368,7 +380,7 @@ def notificar_asistencia_salida(empleado_nombre, hora):
 
 def notificar_visitante_nuevo(visitante_nombre, empresa):
     """Notifica cuando llega un nuevo visitante"""
-    print(f"👥 Notificando llegada de visitante: {visitante_nombre} ({empresa})")
+    logger.debug("👥 Notificando llegada de visitante: %s (%s)", visitante_nombre, empresa)
     titulo = "Nuevo Visitante"
     mensaje = f"{visitante_nombre} ({empresa}) ha llegado"
     return notificacion_manager.agregar_notificacion(
@@ -418,7 +430,7 @@ def obtener_notificaciones_api(no_leidas=False):
         notificaciones = notificacion_manager.obtener_notificaciones(no_leidas)
         total_notificaciones = len(notificaciones)
         no_leidas_count = len([n for n in notificaciones if not n['leida']])
-        print(f"📋 API: Obteniendo notificaciones - Total: {total_notificaciones}, No leídas: {no_leidas_count}")
+        logger.info(f"📋 API: Obteniendo notificaciones - Total: {total_notificaciones}, No leídas: {no_leidas_count}", extra={'evento': 'api_notificaciones'})
         return jsonify({
             'success': True,
             'notificaciones': notificaciones,
@@ -426,7 +438,7 @@ def obtener_notificaciones_api(no_leidas=False):
             'no_leidas': no_leidas_count
         })
     except Exception as e:
-        print(f"❌ API Error al obtener notificaciones: {e}")
+        logger.error(f"❌ API Error al obtener notificaciones: {e}")
         return jsonify({'success': False, 'message': str(e), 'notificaciones': [], 'total': 0, 'no_leidas': 0}), 500
 
 def marcar_notificacion_leida_api(notificacion_id):
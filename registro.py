@@ -0,0 +1,178 @@
+"""
+Registro (logging) de la aplicación
+Los módulos escriben con obtener_logger('nombre') en vez de print(). Los mensajes pasan
+por una cola (QueueHandler) y un solo hilo por worker los formatea y escribe en stdout
+(QueueListener), así las peticiones no esperan la escritura.
+
+Variables de entorno:
+    LOG_FORMATO     json (por defecto) o texto
+    LOG_NIVEL       nivel general, por defecto INFO
+    LOG_NIVELES     niveles por módulo, p. ej. "notificaciones=WARNING,app=DEBUG"
+    LOG_MUESTREO    eventos frecuentes que se registran 1 de cada N, p. ej. "api_notificaciones=100"
+
+Para muestrear un mensaje se le pasa el evento: logger.info('...', extra={'evento': 'api_notificaciones'}).
+Con extra={'datos': {...}} los campos van como claves propias en la línea JSON.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+RAIZ = 'floresjuncalito'
+
+# Eventos de alta frecuencia muestreados aunque no se configure LOG_MUESTREO
+MUESTREO_POR_DEFECTO = {'api_notificaciones': 100, 'peticion_sondeo': 100}
+
+
+def _leer_pares(valor):
+    """'a=1,b=2' -> {'a': '1', 'b': '2'}"""
+    pares = {}
+    for parte in (valor or '').split(','):
+        if '=' in parte:
+            clave, _, dato = parte.partition('=')
+            pares[clave.strip()] = dato.strip()
+    return pares
+
+
+class FormateadorJSON(logging.Formatter):
+    def format(self, registro):
+        linea = {
+            'ts': datetime.fromtimestamp(registro.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'nivel': registro.levelname,
+            'modulo': registro.name[len(RAIZ) + 1:] if registro.name.startswith(RAIZ + '.') else registro.name,
+            'pid': registro.process,
+        }
+        evento = getattr(registro, 'evento', None)
+        if evento:
+            linea['evento'] = evento
+        linea['mensaje'] = registro.getMessage()
+        linea.update(getattr(registro, 'datos', None) or {})
+        if getattr(registro, 'muestreo', None):
+            linea['muestreo'] = registro.muestreo
+        if registro.exc_text:
+            linea['excepcion'] = registro.exc_text
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+
+class FormateadorTexto(logging.Formatter):
+    """Formato legible para desarrollo: el mensaje tal cual y los datos al final"""
+    def format(self, registro):
+        texto = super().format(registro)
+        datos = getattr(registro, 'datos', None)
+        if datos:
+            texto += ' ' + json.dumps(datos, ensure_ascii=False, default=str)
+        return texto
+
+
+class FiltroMuestreo(logging.Filter):
+    """Deja pasar 1 de cada N registros de los eventos configurados"""
+    def __init__(self, tasas):
+        super().__init__()
+        self.tasas = tasas
+        self.contadores = {}
+        self.lock = threading.Lock()
+
+    def filter(self, registro):
+        evento = getattr(registro, 'evento', None)
+        tasa = self.tasas.get(evento) if evento else None
+        if not tasa or tasa <= 1:
+            return True
+        with self.lock:
+            cuenta = self.contadores.get(evento, 0)
+            self.contadores[evento] = cuenta + 1
+        if cuenta % tasa:
+            return False
+        registro.muestreo = tasa
+        return True
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """Encola los registros; el hilo que los escribe arranca con el primero (no al importar)"""
+    def __init__(self, cola, manejadores):
+        super().__init__(cola)
+        self.manejadores = manejadores
+        self.listener = None
+        self.lock_listener = threading.Lock()
+
+    def iniciar(self):
+        with self.lock_listener:
+            if self.listener is None:
+                self.listener = logging.handlers.QueueListener(self.queue, *self.manejadores,
+                                                               respect_handler_level=True)
+                self.listener.start()
+                atexit.register(self.detener)
+
+    def detener(self):
+        with self.lock_listener:
+            if self.listener is not None:
+                self.listener.stop()  # Escribe lo que quede en la cola
+                self.listener = None
+
+    def despues_de_fork(self):
+        # El hilo de escritura no pasa al proceso hijo (p. ej. gunicorn con --preload)
+        self.queue = queue.SimpleQueue()
+        self.listener = None
+        self.lock_listener = threading.Lock()
+
+    def prepare(self, registro):
+        # Se resuelve el mensaje aquí (los argumentos pueden cambiar después) pero el formato
+        # lo aplica el hilo de escritura; la excepción viaja como texto
+        registro = copy.copy(registro)
+        registro.msg = registro.getMessage()
+        registro.args = None
+        if registro.exc_info:
+            registro.exc_text = logging.Formatter().formatException(registro.exc_info)
+            registro.exc_info = None
+        return registro
+
+    def emit(self, registro):
+        if self.listener is None:
+            self.iniciar()
+        super().emit(registro)
+
+
+_configurado = False
+
+
+def configurar_registro():
+    """Configura el logger raíz de la aplicación (una vez por proceso)"""
+    global _configurado
+    if _configurado:
+        return
+    _configurado = True
+
+    salida = logging.StreamHandler(sys.stdout)
+    if os.environ.get('LOG_FORMATO', 'json').strip().lower() == 'texto':
+        salida.setFormatter(FormateadorTexto('%(message)s'))
+    else:
+        salida.setFormatter(FormateadorJSON())
+
+    tasas = dict(MUESTREO_POR_DEFECTO)
+    for evento, tasa in _leer_pares(os.environ.get('LOG_MUESTREO')).items():
+        try:
+            tasas[evento] = int(tasa)
+        except ValueError:
+            pass
+
+    manejador = ManejadorCola(queue.SimpleQueue(), [salida])
+    manejador.addFilter(FiltroMuestreo(tasas))
+    os.register_at_fork(after_in_child=manejador.despues_de_fork)
+
+    raiz = logging.getLogger(RAIZ)
+    raiz.handlers[:] = [manejador]
+    raiz.setLevel(os.environ.get('LOG_NIVEL', 'INFO').strip().upper())
+    raiz.propagate = False
+    for modulo, nivel in _leer_pares(os.environ.get('LOG_NIVELES')).items():
+        logging.getLogger(f'{RAIZ}.{modulo}').setLevel(nivel.upper())
+
+
+def obtener_logger(nombre):
+    configurar_registro()
+    return logging.getLogger(f'{RAIZ}.{nombre}')
@@ -0,0 +1,71 @@
+// Service worker del kiosco de asistencia
+// Guarda la página y sus recursos para que el kiosco abra aunque no haya conexión.
+// Las marcaciones no pasan por aquí: la página las guarda en el dispositivo y las envía por lotes.
+
+const CACHE_KIOSCO = 'kiosco-asistencia-v1';
+const PAGINA_KIOSCO = "{{ url_for('kiosco_asistencia', token=token) }}";
+const RECURSOS = [
+    PAGINA_KIOSCO,
+    "{{ url_for('static', filename='images/logo.png') }}",
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css'
+];
+// Con el enlace degradado la red puede tardar mucho en fallar: pasado este tiempo se usa la copia
+const ESPERA_RED_MS = 4000;
+
+function conTiempoLimite(promesa, ms) {
+    return new Promise((resolver, rechazar) => {
+        const temporizador = setTimeout(() => rechazar(new Error('Tiempo de espera agotado')), ms);
+        promesa.then(
+            valor => { clearTimeout(temporizador); resolver(valor); },
+            error => { clearTimeout(temporizador); rechazar(error); }
+        );
+    });
+}
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_KIOSCO)
+            .then(cache => cache.addAll(RECURSOS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(nombres => Promise.all(
+                nombres.filter(nombre => nombre.startsWith('kiosco-asistencia-') && nombre !== CACHE_KIOSCO)
+                       .map(nombre => caches.delete(nombre))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const peticion = event.request;
+    if (peticion.method !== 'GET') {
+        return;  // El envío de lotes siempre va a la red
+    }
+
+    if (peticion.mode === 'navigate') {
+        // Página: primero la red (para tomar cambios), si falla la copia guardada
+        event.respondWith(
+            conTiempoLimite(fetch(peticion), ESPERA_RED_MS)
+                .then(respuesta => {
+                    if (respuesta.ok) {
+                        const copia = respuesta.clone();
+                        caches.open(CACHE_KIOSCO).then(cache => cache.put(PAGINA_KIOSCO, copia));
+                    }
+                    return respuesta;
+                })
+                .catch(() => caches.match(PAGINA_KIOSCO))
+        );
+        return;
+    }
+
+    // Recursos estáticos: primero la copia guardada
+    event.respondWith(
+        caches.match(peticion).then(guardada => guardada || fetch(peticion))
+    );
+});